@@ -0,0 +1,55 @@
+"""add media_blobs for content-hash deduplication
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('media_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('phash', sa.String(length=16), nullable=True),
+        sa.Column('media_url', sa.String(), nullable=False),
+        sa.Column('thumbnail_url', sa.String(), nullable=False),
+        sa.Column('preview_url', sa.String(), nullable=True),
+        sa.Column('duration', sa.Float(), nullable=True),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('has_audio', sa.Boolean(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('sha256')
+    )
+    op.create_index(op.f('ix_media_blobs_id'), 'media_blobs', ['id'], unique=False)
+    op.create_index(op.f('ix_media_blobs_phash'), 'media_blobs', ['phash'], unique=False)
+
+    op.add_column('memes', sa.Column('media_blob_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_memes_media_blob_id', 'memes', 'media_blobs',
+        ['media_blob_id'], ['id'], ondelete='SET NULL'
+    )
+    op.create_index('ix_memes_media_blob_id', 'memes', ['media_blob_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_memes_media_blob_id', table_name='memes')
+    op.drop_constraint('fk_memes_media_blob_id', 'memes', type_='foreignkey')
+    op.drop_column('memes', 'media_blob_id')
+    op.drop_index(op.f('ix_media_blobs_phash'), table_name='media_blobs')
+    op.drop_index(op.f('ix_media_blobs_id'), table_name='media_blobs')
+    op.drop_table('media_blobs')
@@ -0,0 +1,51 @@
+"""decrement media_blobs.ref_count on every meme delete
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0e1f2a3b4c5'
+down_revision: Union[str, Sequence[str], None] = 'c9d0e1f2a3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Удаление мема любым путем (API, админка, каскад от пользователя) отпускает ссылку;
+    # сами файлы и строки с ref_count = 0 убирает gc_media_blobs_task
+    op.execute("""
+        CREATE OR REPLACE FUNCTION media_blob_release() RETURNS trigger AS $$
+        BEGIN
+            UPDATE media_blobs SET ref_count = ref_count - 1 WHERE id = OLD.media_blob_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER memes_media_blob_release
+        AFTER DELETE ON memes
+        FOR EACH ROW WHEN (OLD.media_blob_id IS NOT NULL)
+        EXECUTE FUNCTION media_blob_release()
+    """)
+    # Счетчики, утекшие при удалениях мимо API
+    op.execute("""
+        UPDATE media_blobs b SET ref_count = c.cnt
+        FROM (
+            SELECT b2.id, COUNT(m.id) AS cnt
+            FROM media_blobs b2 LEFT JOIN memes m ON m.media_blob_id = b2.id
+            GROUP BY b2.id
+        ) c
+        WHERE c.id = b.id AND b.ref_count <> c.cnt
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS memes_media_blob_release ON memes")
+    op.execute("DROP FUNCTION IF EXISTS media_blob_release()")
@@ -0,0 +1,36 @@
+"""add composite indexes for keyset feed pagination
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sort=new: WHERE status = 'approved' AND (created_at, id) < (:c, :id)
+    op.create_index(
+        'ix_memes_status_created_at_id', 'memes',
+        ['status', sa.text('created_at DESC'), sa.text('id DESC')]
+    )
+    # sort=popular: WHERE status = 'approved' AND (likes_count, views_count, id) < (...)
+    op.create_index(
+        'ix_memes_status_popular', 'memes',
+        ['status', sa.text('likes_count DESC'), sa.text('views_count DESC'), sa.text('id DESC')]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_memes_status_popular', table_name='memes')
+    op.drop_index('ix_memes_status_created_at_id', table_name='memes')
@@ -0,0 +1,40 @@
+"""add hot_score to memes
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Стартовый score = (0 + 1) / (0 + 2) ^ 1.5
+    op.add_column('memes', sa.Column('hot_score', sa.Float(), server_default='0.35355339', nullable=False))
+
+    # === BACKFILL ===
+    op.execute("""
+        UPDATE memes SET hot_score =
+            (likes_count + 1) / power(extract(epoch FROM now() - created_at) / 3600 + 2, 1.5)
+    """)
+
+    # sort=smart: WHERE status = 'approved' AND (hot_score, id) < (...)
+    op.create_index(
+        'ix_memes_status_hot_score', 'memes',
+        ['status', sa.text('hot_score DESC'), sa.text('id DESC')]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_memes_status_hot_score', table_name='memes')
+    op.drop_column('memes', 'hot_score')
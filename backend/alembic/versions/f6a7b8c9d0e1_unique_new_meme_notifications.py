@@ -0,0 +1,40 @@
+"""unique new_meme notification per follower and meme
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Убираем дубликаты, которые могли остаться от старой поштучной рассылки
+    op.execute("""
+        DELETE FROM notifications a
+        USING notifications b
+        WHERE a.type = 'new_meme' AND b.type = 'new_meme'
+          AND a.user_id = b.user_id AND a.meme_id = b.meme_id
+          AND a.ctid > b.ctid
+    """)
+
+    # Ключ идемпотентности fanout_new_meme_task (INSERT ... ON CONFLICT DO NOTHING)
+    op.create_index(
+        'uq_notifications_new_meme', 'notifications', ['user_id', 'meme_id'],
+        unique=True,
+        postgresql_where=sa.text("type = 'new_meme'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_notifications_new_meme', table_name='notifications')
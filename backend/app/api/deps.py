@@ -1,67 +1,69 @@
+import hmac
 from typing import Optional  # <--- ДОБАВЛЕН ЭТОТ ИМПОРТ
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-import uuid
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.user_cache import load_user
 from app.models.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token")
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), 
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_sub(token: str) -> Optional[str]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        sub: str = payload.get("sub")
-        if sub is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    try:
-        user_uuid = uuid.UUID(sub)
-        query = select(User).where(User.id == user_uuid)
-    except ValueError:
-        query = select(User).where(User.username == sub)
+        return None
+    return payload.get("sub")
+
+async def _require_user(token: str, db: AsyncSession, fresh: bool) -> User:
+    sub = _decode_sub(token)
+    if sub is None:
+        raise _credentials_exception()
 
-    result = await db.execute(query)
-    user = result.scalars().first()
-    
+    user = await load_user(db, sub, fresh=fresh)
     if user is None:
-        raise credentials_exception
-        
+        raise _credentials_exception()
+
     return user
 
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), 
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Текущий пользователь из кэша снимков (см. app.core.user_cache)."""
+    return await _require_user(token, db, fresh=False)
+
+async def get_current_user_fresh(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Текущий пользователь свежей строкой из БД — для эндпоинтов, которые его изменяют."""
+    return await _require_user(token, db, fresh=True)
+
 async def get_optional_current_user(
     token: str = Depends(OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token", auto_error=False)),
     db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:  # Теперь Optional будет работать
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        sub: str = payload.get("sub")
-        if not sub:
-            return None
-            
-        try:
-            user_uuid = uuid.UUID(sub)
-            query = select(User).where(User.id == user_uuid)
-        except ValueError:
-            query = select(User).where(User.username == sub)
-            
-        result = await db.execute(query)
-        return result.scalars().first()
-    except JWTError:
-        return None
\ No newline at end of file
+    sub = _decode_sub(token)
+    if not sub:
+        return None
+    return await load_user(db, sub)
+
+def is_internal_caller(x_internal_token: Optional[str] = Header(None)) -> bool:
+    """Запрос от своего сервиса (бот, SSR фронтенда) с INTERNAL_API_TOKEN."""
+    if not settings.INTERNAL_API_TOKEN or not x_internal_token:
+        return False
+    return hmac.compare_digest(x_internal_token, settings.INTERNAL_API_TOKEN)
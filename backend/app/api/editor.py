@@ -1,19 +1,28 @@
 from typing import Optional
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query
 from app.core.celery_app import celery_app
 from app.api.deps import get_current_user
 from app.models.models import User
 import uuid
 import os
 import json
+import asyncio
 import pathlib
-import aiofiles
+from app.core.redis import redis_client
+from app.utils.uploads import save_upload, upload_kind
+from app.services import sticker_cache, progress
+from app.services.notification_hub import progress_hub
 from pydantic import BaseModel
 from celery.result import AsyncResult
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
 
+# Long-poll /status: сколько держать запрос по умолчанию/максимум и как часто перепроверять
+LONG_POLL_DEFAULT = 20.0
+LONG_POLL_MAX = 30.0
+LONG_POLL_RECHECK = 5.0
+
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
@@ -47,6 +56,8 @@ class AnimationRequest(BaseModel):
     text_x: Optional[float] = 0.5
     text_y: Optional[float] = 0.8
     crop: Optional[CropOptions] = None
+    # Сначала быстрый WebP-превью (preview_url в статусе), затем полный GIF
+    preview: bool = False
 
 class TextOptions(BaseModel):
     text: str
@@ -75,8 +86,7 @@ async def upload_temp_file(
     filename = f"temp_{file_id}.{ext}"
     file_path = os.path.join(UPLOAD_DIR, filename)
 
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(await file.read())
+    await save_upload(file, file_path, upload_kind(file.filename))
 
     return {"server_path": file_path, "url": f"/static/{filename}"}
 
@@ -90,12 +100,12 @@ async def process_image(
     ext = file.filename.split('.')[-1]
     input_path = os.path.join(UPLOAD_DIR, f"temp_{file_id}.{ext}")
 
-    async with aiofiles.open(input_path, 'wb') as f:
-        await f.write(await file.read())
+    await save_upload(file, input_path, "image")
 
     task = celery_app.send_task(
         "app.worker.process_sticker_image",
-        args=[input_path, operation]
+        args=[input_path, operation],
+        kwargs={"user_id": str(current_user.id)}
     )
     return {"task_id": task.id}
 
@@ -110,8 +120,7 @@ async def upload_video_for_editor(
     filename = f"editor_video_{file_id}.{ext}"
     file_path = os.path.join(UPLOAD_DIR, filename)
 
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(await file.read())
+    await save_upload(file, file_path, "video")
 
     return {"file_path": file_path, "url": f"/static/{filename}"}
 
@@ -133,8 +142,7 @@ async def process_video_editor(
         file_id = str(uuid.uuid4())
         ext = audio_file.filename.split('.')[-1]
         audio_path = os.path.join(UPLOAD_DIR, f"editor_audio_{file_id}.{ext}")
-        async with aiofiles.open(audio_path, 'wb') as f:
-            await f.write(await audio_file.read())
+        await save_upload(audio_file, audio_path, "audio")
 
     # 2. Парсим JSON опции вручную (это решает 422 ошибку)
     try:
@@ -148,7 +156,8 @@ async def process_video_editor(
     # 3. Отправляем в Celery
     task = celery_app.send_task(
         "app.worker.process_video_editor_task",
-        args=[validated_path, final_options_dict, audio_path]
+        args=[validated_path, final_options_dict, audio_path],
+        kwargs={"user_id": str(current_user.id)}
     )
 
     return {"task_id": task.id}
@@ -161,27 +170,114 @@ async def create_sticker(
     # Валидация пути
     validated_path = validate_upload_path(request.image_path)
 
+    options = {
+        "outline_color": request.outline_color,
+        "outline_width": request.outline_width,
+        "text": request.text,
+        "text_color": request.text_color,
+        "text_size": request.text_size,
+        "text_x": request.text_x,
+        "text_y": request.text_y,
+        "crop": request.crop.model_dump() if request.crop else None,
+    }
+
+    # Тот же исходник с теми же параметрами уже рендерили — отдаем готовый файл
+    cache_key = preview_cache_key = preview_url = None
+    try:
+        source_hash = await asyncio.to_thread(sticker_cache.file_sha256, validated_path)
+        cache_key = sticker_cache.cache_key(
+            source_hash, sticker_cache.normalize_params(request.animation, **options)
+        )
+        cached_url = await sticker_cache.lookup_async(redis_client, cache_key)
+        if cached_url:
+            return {"task_id": None, "status": "SUCCESS", "result": {"url": cached_url, "cached": True}}
+        if request.preview:
+            preview_cache_key = sticker_cache.cache_key(
+                source_hash, sticker_cache.normalize_params(request.animation, variant="preview", **options)
+            )
+            preview_url = await sticker_cache.lookup_async(redis_client, preview_cache_key)
+    except Exception as e:
+        print(f"Sticker cache error: {e}")
+
     task = celery_app.send_task(
         "app.worker.animate_sticker_task",
         args=[validated_path, request.animation],
         kwargs={
-            "outline_color": request.outline_color,
-            "outline_width": request.outline_width,
-            "text": request.text,
-            "text_color": request.text_color,
-            "text_size": request.text_size,
-            "text_x": request.text_x,
-            "text_y": request.text_y,
-            "crop": request.crop.model_dump() if request.crop else None,
+            **options,
+            "cache_key": cache_key,
+            "preview": request.preview,
+            "preview_cache_key": preview_cache_key,
+            "preview_url": preview_url,
+            "user_id": str(current_user.id),
         }
     )
-    return {"task_id": task.id}
+    return {"task_id": task.id, "preview_url": preview_url}
 
 @router.get("/status/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(
+    task_id: str,
+    since: Optional[int] = Query(None, description="Последний увиденный progress: ждать, пока он изменится"),
+    wait: float = Query(LONG_POLL_DEFAULT, ge=0, le=LONG_POLL_MAX),
+):
+    """
+    Статус задачи + прогресс из task:{id}. С параметром since — long-poll:
+    ответ приходит, когда прогресс изменился или задача завершилась (но не позже wait секунд).
+    """
+    status = await _read_task_status(task_id)
+    if since is not None and wait > 0 and not _task_settled(status, since):
+        # Общий psubscribe progress:* на процесс (progress_hub), а не pubsub-соединение на запрос
+        queue = progress_hub.register(task_id)
+        try:
+            # Перечитываем после регистрации, чтобы не пропустить обновление между чтением и ней
+            status = await _read_task_status(task_id)
+            deadline = asyncio.get_running_loop().time() + wait
+            while not _task_settled(status, since):
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                # Событие в канале или периодическая перепроверка (задачи без прогресса)
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=min(remaining, LONG_POLL_RECHECK))
+                except asyncio.TimeoutError:
+                    pass
+                status = await _read_task_status(task_id)
+        finally:
+            progress_hub.unregister(task_id, queue)
+    return status
+
+
+def _task_settled(status: dict, since: int) -> bool:
+    return status["status"] in ("SUCCESS", "FAILURE") or (status.get("progress") or 0) != since
+
+
+def _celery_state(task_id: str):
+    """Синхронные чтения result backend Celery: (status, ready, result, preview_url)."""
     task_result = AsyncResult(task_id, app=celery_app)
+    ready = task_result.ready()
+    # Превью стикера доступно раньше результата: PROGRESS-мета, затем в самом результате
+    payload = task_result.result if ready else task_result.info
+    preview_url = payload.get("preview_url") if isinstance(payload, dict) else None
+    return task_result.status, ready, (task_result.result if ready else None), preview_url
+
+
+async def _read_task_status(task_id: str) -> dict:
+    # Result backend опрашивается блокирующим клиентом — вне event loop,
+    # иначе long-poll перепроверки всех ожидающих клиентов тормозили бы API
+    status, ready, result, preview_url = await asyncio.to_thread(_celery_state, task_id)
+
+    state = None
+    raw = await redis_client.get(progress.task_key(task_id))
+    if raw:
+        try:
+            state = json.loads(raw)
+        except ValueError:
+            state = None
+
     return {
         "task_id": task_id,
-        "status": task_result.status,
-        "result": task_result.result if task_result.ready() else None
+        "status": status,
+        "result": result,
+        "preview_url": preview_url or (state or {}).get("preview_url"),
+        "progress": 100 if ready else (state or {}).get("progress", 0),
+        "stage": (state or {}).get("stage"),
     }
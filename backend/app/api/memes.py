@@ -4,17 +4,19 @@ import shutil
 import aiofiles
 import aiofiles.os # Для асинхронного удаления
 import random # Для перемешивания
+import base64
 import sqlalchemy as sa
 from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Response, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, exists, desc, and_, or_, extract, case, update
 from sqlalchemy.orm import selectinload, aliased
+from sqlalchemy.exc import IntegrityError
 
 from app.core.database import get_db
 from app.models.models import (
-    Meme, User, Like, Comment, Tag,
+    Meme, MediaBlob, User, Like, Comment, Tag,
     meme_tags, Notification, NotificationType, follows, Report, Block
 )
 from app.schemas import MemeResponse, CommentCreate, CommentResponse, MemeUpdate, ReportCreate
@@ -22,9 +24,11 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from app.core import security
 from app.services.media import MediaProcessor
+from app.services import ranking, random_pick, media_dedup, search_outbox, search_counters, views
 from app.core.celery_app import celery_app
-from app.api.deps import get_current_user, get_optional_current_user 
+from app.api.deps import get_current_user, get_optional_current_user, is_internal_caller
 from app.utils.notifier import send_notification
+from app.utils.uploads import save_upload
 from app.core.redis import redis_client # Импортируем наш async клиент
 
 router = APIRouter()
@@ -39,6 +43,34 @@ import json as json_lib
 POPULAR_CONTENT_CACHE_KEY = "popular_content"
 POPULAR_CONTENT_TTL = 600  # 10 минут
 
+# Keyset-пагинация ленты: курсор — base64(JSON) с ключом последнего мема страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# "smart" по снимку: потолок пачки id из ZSET (при узких фильтрах пачка удваивается до него)
+SMART_MAX_CHUNK = 1000
+
+
+def _encode_cursor(data: dict) -> str:
+    raw = json_lib.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json_lib.loads(base64.urlsafe_b64decode(padded.encode()))
+        if data.get("s") != sort:
+            raise ValueError("cursor sort mismatch")
+        if "id" in data:
+            data["id"] = uuid.UUID(data["id"])
+        if "created_at" in data:
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        if "gen" in data:
+            data["gen"] = str(int(data["gen"]))
+            data["pos"] = max(0, int(data["pos"]))
+        return data
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/popular-content")
 async def get_popular_content(db: AsyncSession = Depends(get_db)):
     # Пробуем получить из кэша
@@ -117,15 +149,17 @@ async def upload_meme(
     final_path = os.path.join(UPLOAD_DIR, final_filename)
     thumbnail_path = os.path.join(UPLOAD_DIR, thumbnail_filename)
 
-    async with aiofiles.open(raw_path, 'wb') as f:
-        await f.write(await file.read())
+    saved = await save_upload(file, raw_path, "image" if is_image_input else "video")
 
     audio_path = None
     if audio_file:
         audio_ext = audio_file.filename.split('.')[-1]
         audio_path = os.path.join(UPLOAD_DIR, f"audio_{file_id}.{audio_ext}")
-        async with aiofiles.open(audio_path, 'wb') as f:
-            await f.write(await audio_file.read())
+        try:
+            await save_upload(audio_file, audio_path, "audio")
+        except Exception:
+            if os.path.exists(raw_path): os.remove(raw_path)
+            raise
 
     duration, width, height = 0.0, 0, 0
     has_audio = False
@@ -133,7 +167,27 @@ async def upload_meme(
     media_url = f"/static/{final_filename}"
     thumbnail_url = "/static/processing_placeholder.jpg"
 
-    if not is_final_video:
+    # Дедупликация: такой же контент уже загружали — берем готовые файлы.
+    # Без проверки — только по точному sha256; совпавший phash картинки лишь
+    # кандидат, который переиспользуется при попиксельном совпадении.
+    blob = None
+    phash = None
+    if not audio_file:
+        blob = (await db.execute(media_dedup.blob_lookup_query(saved.sha256))).scalars().first()
+        if not blob and not is_final_video:
+            processor = MediaProcessor(raw_path)
+            phash = processor.perceptual_hash()
+            if phash:
+                _, width, height = processor.get_metadata()
+                candidates = (await db.execute(media_dedup.phash_candidates_query(
+                    phash, width, height
+                ))).scalars().all()
+                blob = next((c for c in candidates if media_dedup.same_pixels(raw_path, c)), None)
+
+    if blob:
+        status = "approved"
+        if os.path.exists(raw_path): os.remove(raw_path)
+    elif not is_final_video:
         shutil.copy(raw_path, final_path)
         try:
             processor = MediaProcessor(final_path)
@@ -176,54 +230,45 @@ async def upload_meme(
         status=status
     )
     new_meme.tags = db_tags
+
+    if blob:
+        media_dedup.apply_blob(new_meme, blob)
+        blob.ref_count = MediaBlob.ref_count + 1
+    elif not is_final_video and not audio_file:
+        new_blob = media_dedup.blob_from_meme(new_meme, saved.sha256, phash)
+        try:
+            async with db.begin_nested():
+                db.add(new_blob)
+            new_meme.media_blob_id = new_blob.id
+        except IntegrityError:
+            pass  # параллельная загрузка того же файла — файлы остаются за этим мемом
     
     db.add(new_meme)
+    # Видео без готового blob индексирует воркер после обработки
+    if status == "approved":
+        search_outbox.enqueue(db, new_meme.id)
     await db.commit()
     await db.refresh(new_meme)
 
-    if is_final_video:
+    if is_final_video and not blob:
         # Worker сам запустит индексацию после обработки
-        celery_app.send_task("app.worker.process_meme_task", args=[file_id, raw_path, audio_path])
+        celery_app.send_task(
+            "app.worker.process_meme_task",
+            args=[file_id, raw_path, audio_path],
+            kwargs={"content_hash": saved.sha256}
+        )
     elif status == "approved":
-        # Если это картинка, запускаем индексацию через Celery сразу
-        celery_app.send_task("app.worker.index_meme_task", args=[{
-            "id": str(new_meme.id),
-            "title": new_meme.title,
-            "description": new_meme.description,
-            "thumbnail_url": new_meme.thumbnail_url,
-            "preview_url": new_meme.preview_url,
-            "media_url": new_meme.media_url,
-            "views_count": new_meme.views_count,
-            "shares_count": new_meme.shares_count, # <-- ДОБАВЛЕНО
-            "width": new_meme.width,               # <-- ДОБАВЛЕНО
-            "height": new_meme.height,             # <-- ДОБАВЛЕНО
-            "duration": new_meme.duration,         # <-- ДОБАВЛЕНО
-            "status": new_meme.status,             # <-- ВАЖНО: Добавлено поле status
-            "tags": tag_list,
-            "author_username": current_user.username 
-        }])
-        
-        # Уведомления для картинок
         try:
-            stmt = (
-                select(User)
-                .join(follows, follows.c.follower_id == User.id)
-                .where(follows.c.followed_id == current_user.id)
-            )
-            followers_res = await db.execute(stmt)
-            followers = followers_res.scalars().all()
-            
-            for follower in followers:
-                if getattr(follower, 'notify_on_new_meme', True):
-                    await send_notification(
-                        db=db,
-                        user_id=follower.id,
-                        sender_id=current_user.id,
-                        type=NotificationType.NEW_MEME, 
-                        meme_id=new_meme.id,
-                        sender=current_user,
-                        meme=new_meme
-                    )
+            await redis_client.sadd(random_pick.APPROVED_SET_KEY, str(new_meme.id))
+        except Exception as e:
+            print(f"Redis random set error: {e}")
+
+        # Индексация: событие уже в outbox, будим дренер
+        await search_outbox.kick_async(redis_client, celery_app)
+
+        # Уведомления для картинок — та же пачечная рассылка, что и для видео
+        try:
+            celery_app.send_task("app.worker.fanout_new_meme_task", args=[str(new_meme.id)])
         except Exception as e:
             print(f"Notification error: {e}")
 
@@ -237,8 +282,10 @@ async def upload_meme(
 
 @router.get("/", response_model=List[MemeResponse])
 async def read_memes(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = None,
     username: Optional[str] = None,
     liked_by: Optional[str] = None,
     tag: Optional[str] = None,
@@ -247,6 +294,16 @@ async def read_memes(
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
+    """
+    Лента мемов. Поддерживает два режима пагинации:
+    - skip/limit (OFFSET) — для обратной совместимости;
+    - cursor — keyset-пагинация: значение берется из заголовка X-Next-Cursor
+      предыдущего ответа, и страница N стоит столько же, сколько первая.
+    """
+    if sort not in ("new", "popular", "smart"):
+        sort = "new"
+    after = _decode_cursor(cursor, sort) if cursor else None
+
     MyLike = aliased(Like)
 
     is_liked = sa.literal(False)
@@ -286,16 +343,35 @@ async def read_memes(
         month_ago = datetime.utcnow() - timedelta(days=30)
         query = query.where(Meme.created_at >= month_ago)
 
+    if sort == "smart":
+        # Лента по замороженному снимку ранжирования: стабильна между пересчетами
+        gen = after["gen"] if after and "gen" in after else await _current_snapshot(redis_client)
+        if gen and (not after or "gen" in after):
+            return await _read_smart_snapshot(response, db, query, gen, after["pos"] if after else skip, limit)
+
+    # id везде последний ключ сортировки — иначе keyset неоднозначен при равенстве
     if sort == "popular":
-        query = query.order_by(desc(Meme.likes_count), desc(Meme.views_count))
+        if after:
+            query = query.where(
+                sa.tuple_(Meme.likes_count, Meme.views_count, Meme.id)
+                < sa.tuple_(after["likes"], after["views"], after["id"])
+            )
+        query = query.order_by(desc(Meme.likes_count), desc(Meme.views_count), desc(Meme.id))
     elif sort == "smart":
-        age_in_hours = (extract('epoch', func.now() - Meme.created_at) / 3600)
-        gravity_score = (Meme.likes_count + 1) / func.power((age_in_hours + 2), 1.5)
-        query = query.order_by(desc(gravity_score))
+        # Снимка еще нет (первый запуск) — прямо по hot_score, сортировка идет по индексу
+        if after:
+            query = query.where(sa.tuple_(Meme.hot_score, Meme.id) < sa.tuple_(after["score"], after["id"]))
+        query = query.order_by(desc(Meme.hot_score), desc(Meme.id))
     else:
-        query = query.order_by(Meme.created_at.desc())
+        if after:
+            query = query.where(
+                sa.tuple_(Meme.created_at, Meme.id) < sa.tuple_(after["created_at"], after["id"])
+            )
+        query = query.order_by(Meme.created_at.desc(), Meme.id.desc())
 
-    query = query.offset(skip).limit(limit)
+    if after is None:
+        query = query.offset(skip)
+    query = query.limit(limit)
 
     result = await db.execute(query)
     rows = result.all()
@@ -306,37 +382,124 @@ async def read_memes(
         meme.is_liked = row[1]
         memes_with_stats.append(meme)
 
+    if rows and len(rows) == limit:
+        last = rows[-1][0]
+        next_cursor = {"s": sort, "id": str(last.id)}
+        if sort == "popular":
+            next_cursor.update(likes=last.likes_count or 0, views=last.views_count or 0)
+        elif sort == "smart":
+            next_cursor["score"] = float(last.hot_score or 0.0)
+        else:
+            next_cursor["created_at"] = last.created_at.isoformat()
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(next_cursor)
+
     return memes_with_stats
 
 
+async def _current_snapshot(redis) -> Optional[str]:
+    try:
+        gen = await redis.get(ranking.CURRENT_SNAPSHOT_KEY)
+        if gen and await redis.exists(ranking.SNAPSHOT_KEY.format(gen=gen)):
+            return gen
+    except Exception as e:
+        print(f"Smart snapshot error: {e}")
+    return None
+
+
+async def _read_smart_snapshot(response: Response, db: AsyncSession, query, gen: str, pos: int, limit: int):
+    """
+    Страница "smart" из снимка feed:smart:{gen}: id идут по позициям ZSET, фильтры
+    (блокировки, автор, тег, период) применяет SQL. Курсор — поколение + позиция,
+    поэтому пересчет hot_score и лайки не дают пропусков и повторов.
+
+    Снимок читается, пока не наберется limit строк или не кончится ZSET:
+    клиент считает неполную страницу концом ленты.
+    """
+    key = ranking.SNAPSHOT_KEY.format(gen=gen)
+    if not await redis_client.exists(key):
+        # Курсор старше SNAPSHOT_TTL: продолжаем с той же позиции по текущему снимку
+        gen = await _current_snapshot(redis_client)
+        if not gen:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        key = ranking.SNAPSHOT_KEY.format(gen=gen)
+
+    chunk = max(limit * 3, 30)
+    found = []
+    while len(found) < limit:
+        ids = await redis_client.zrevrange(key, pos, pos + chunk - 1)
+        if not ids:
+            break
+        rows = (await db.execute(query.where(Meme.id.in_([uuid.UUID(i) for i in ids])))).all()
+        by_id = {str(row[0].id): row for row in rows}
+        for offset, meme_id in enumerate(ids, start=1):
+            row = by_id.get(meme_id)
+            if row:
+                found.append(row)
+            if len(found) == limit:
+                pos += offset
+                break
+        else:
+            pos += len(ids)
+        # Фильтры отсекают почти все — следующая пачка крупнее
+        chunk = min(chunk * 2, SMART_MAX_CHUNK)
+
+    memes = []
+    for meme, is_liked in found:
+        meme.is_liked = is_liked
+        memes.append(meme)
+    if len(found) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor({"s": "smart", "gen": gen, "pos": pos})
+    return memes
+
+
 @router.get("/random", response_model=MemeResponse)
-async def get_random_meme(db: AsyncSession = Depends(get_db)):
-    # Получаем общее количество одобренных мемов
-    count = await db.scalar(select(func.count()).select_from(Meme).where(Meme.status == "approved"))
-    if count == 0:
-        raise HTTPException(status_code=404, detail="No memes found")
-    
-    # Берем случайный сдвиг (offset)
-    random_offset = random.randint(0, count - 1)
-    
-    query = (
-        select(Meme)
-        .options(selectinload(Meme.user), selectinload(Meme.tags))
-        .where(Meme.status == "approved")
-        .offset(random_offset)
-        .limit(1)
-    )
-    res = await db.execute(query)
-    return res.scalars().first()
+async def get_random_meme(
+    viewer: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_optional_current_user),
+    internal: bool = Depends(is_internal_caller),
+):
+    """
+    Случайный мем за O(1): SRANDMEMBER по Redis-множеству одобренных мемов.
+    Текущий пользователь включает окно "без повторов". Чужой viewer (tg:<id>
+    от бота) принимается только с X-Internal-Token, иначе им можно было бы
+    читать и засорять окно любого зрителя.
+    """
+    if not internal:
+        viewer = None
+    if not viewer and current_user:
+        viewer = str(current_user.id)
+
+    for _ in range(random_pick.MAX_ATTEMPTS):
+        meme_id = await random_pick.pick_random_meme_id(db, redis_client, viewer)
+        if meme_id is None:
+            break
+
+        res = await db.execute(
+            select(Meme)
+            .options(selectinload(Meme.user), selectinload(Meme.tags))
+            .where(Meme.id == meme_id)
+        )
+        meme = res.scalars().first()
+        if meme and meme.status == "approved":
+            return meme
+
+        # Устаревший id (мем удален/скрыт) — чистим множество и пробуем снова
+        await redis_client.srem(random_pick.APPROVED_SET_KEY, str(meme_id))
+
+    raise HTTPException(status_code=404, detail="No memes found")
 
 @router.get("/{meme_id}", response_model=MemeResponse)
 async def read_meme(
     meme_id: uuid.UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_current_user)
+    current_user: Optional[User] = Depends(get_optional_current_user),
+    internal: bool = Depends(is_internal_caller),
 ):
     try:
-        await redis_client.incr(f"meme:views:{meme_id}")
+        # Повторные открытия тем же зрителем в окне VIEWS_DEDUP_SECONDS не считаются
+        await views.count_view(redis_client, meme_id, views.viewer_id(request, current_user, internal))
     except Exception as e:
         print(f"Redis views error: {e}")
 
@@ -384,6 +547,8 @@ async def like_meme(
     if existing_like:
         await db.delete(existing_like)
         meme.likes_count = max(0, meme.likes_count - 1)
+        meme.hot_score = Meme.hot_score - ranking.like_bump_expr()
+        meme.updated_at = Meme.updated_at
         if meme.user_id != current_user.id:
             await db.execute(
                 sa.delete(Notification).where(
@@ -397,6 +562,10 @@ async def like_meme(
         new_like = Like(user_id=current_user.id, meme_id=meme_id)
         db.add(new_like)
         meme.likes_count = meme.likes_count + 1
+        # Инкрементальный бамп до следующего полного пересчета hot_score
+        meme.hot_score = Meme.hot_score + ranking.like_bump_expr()
+        # updated_at не трогаем: счетчик уходит в поиск частично через search_counters
+        meme.updated_at = Meme.updated_at
         action = "liked"
 
         if meme.user_id != current_user.id:
@@ -421,6 +590,7 @@ async def like_meme(
                     )
 
     await db.commit()
+    await search_counters.mark_async(redis_client, meme_id)
     return {"action": action, "likes_count": meme.likes_count}
 
 
@@ -453,6 +623,7 @@ async def create_comment(
     )
     db.add(new_comm)
     meme.comments_count = meme.comments_count + 1
+    meme.updated_at = Meme.updated_at  # comments_count не индексируется
 
     if meme.user_id != current_user.id:
         meme_owner = await db.get(User, meme.user_id)
@@ -585,33 +756,28 @@ async def delete_meme(
     if meme.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="You are not authorized to delete this meme")
 
+    # Файлы общие с другими мемами (MediaBlob): ref_count уменьшает триггер на
+    # DELETE memes, файлы последней ссылки удаляет gc_media_blobs_task
+    release_files = meme.media_blob_id is None
+
     # 3. ОПТИМИЗАЦИЯ: Асинхронное удаление файлов
     try:
-        if meme.media_url:
-            filename = meme.media_url.split("/")[-1]
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if await aiofiles.os.path.exists(file_path):
-                await aiofiles.os.remove(file_path)
-        
-        if meme.thumbnail_url:
-            filename = meme.thumbnail_url.split("/")[-1]
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if await aiofiles.os.path.exists(file_path):
-                await aiofiles.os.remove(file_path)
-
-        if meme.preview_url:
-            filename = meme.preview_url.split("/")[-1]
+        urls = [meme.media_url, meme.thumbnail_url, meme.preview_url] if release_files else []
+        for url in filter(None, urls):
+            filename = url.split("/")[-1]
             file_path = os.path.join(UPLOAD_DIR, filename)
             if await aiofiles.os.path.exists(file_path):
                 await aiofiles.os.remove(file_path)
     except Exception as e:
         print(f"Error deleting files: {e}")
 
-    # 4. ОПТИМИЗАЦИЯ: Удаление из индекса через Celery
     try:
-        celery_app.send_task("app.worker.delete_index_task", args=[str(meme.id)])
+        await redis_client.srem(random_pick.APPROVED_SET_KEY, str(meme.id))
     except Exception as e:
-        print(f"Meilisearch delete schedule error: {e}")
+        print(f"Redis random set error: {e}")
+
+    # 4. Удаление из индекса через outbox (уходит в той же транзакции)
+    search_outbox.enqueue(db, meme.id, op=search_outbox.OP_DELETE)
 
     await db.execute(sa.delete(Notification).where(Notification.meme_id == meme_id))
     await db.execute(sa.delete(Like).where(Like.meme_id == meme_id))
@@ -621,6 +787,7 @@ async def delete_meme(
 
     await db.delete(meme)
     await db.commit()
+    await search_outbox.kick_async(redis_client, celery_app)
     
     return None
 
@@ -666,29 +833,9 @@ async def update_meme(
         
         meme.tags = new_tags
 
+    search_outbox.enqueue(db, meme.id)
     await db.commit()
-    
-    # ОПТИМИЗАЦИЯ: Обновление индекса через Celery
-    current_tags_list = [t.name for t in meme.tags]
-
-    try:
-        celery_app.send_task("app.worker.index_meme_task", args=[{
-            "id": str(meme.id),
-            "title": meme.title,
-            "description": meme.description,
-            "thumbnail_url": meme.thumbnail_url,
-            "media_url": meme.media_url,
-            "views_count": meme.views_count,
-            "shares_count": meme.shares_count, # <-- ДОБАВЛЕНО
-            "width": meme.width,               # <-- ДОБАВЛЕНО
-            "height": meme.height,             # <-- ДОБАВЛЕНО
-            "duration": meme.duration,         # <-- ДОБАВЛЕНО
-            "status": meme.status,             # <-- ВАЖНО: Добавлено поле status
-            "tags": current_tags_list,
-        "author_username": meme.user.username if meme.user else "unknown" 
-        }])
-    except Exception as e:
-        print(f"Meili update schedule error: {e}")
+    await search_outbox.kick_async(redis_client, celery_app)
 
     final_query = (
         select(Meme)
@@ -731,7 +878,8 @@ async def share_meme_counter(
     stmt = (
         update(Meme)
         .where(Meme.id == meme_id)
-        .values(shares_count=func.coalesce(Meme.shares_count, 0) + 1)
+        # updated_at не трогаем: счетчик уходит в поиск частично через search_counters
+        .values(shares_count=func.coalesce(Meme.shares_count, 0) + 1, updated_at=Meme.updated_at)
         .execution_options(synchronize_session=False)
         .returning(Meme.shares_count) # Сразу возвращаем новое значение
     )
@@ -741,36 +889,8 @@ async def share_meme_counter(
     await db.commit()
     
     print(f"📈 Meme {meme_id} shared! New count: {new_count}")
-    
-    # 2. Обновляем индекс MeiliSearch
-    updated_meme = await db.scalar(
-        select(Meme)
-        .options(selectinload(Meme.tags))
-        .options(selectinload(Meme.user))
-        .where(Meme.id == meme_id)
-    )
-    
-    if updated_meme:
-        try:
-            current_tags_list = [t.name for t in updated_meme.tags]
-            
-            # Отправляем задачу с обновленным количеством
-            celery_app.send_task("app.worker.index_meme_task", args=[{
-                "id": str(updated_meme.id),
-                "title": updated_meme.title,
-                "description": updated_meme.description,
-                "thumbnail_url": updated_meme.thumbnail_url,
-                "media_url": updated_meme.media_url,
-                "views_count": updated_meme.views_count,
-                "shares_count": new_count, # <-- Передаем точное новое число
-                "width": updated_meme.width,
-                "height": updated_meme.height,
-                "duration": updated_meme.duration,
-                "status": updated_meme.status,
-                "tags": current_tags_list,
-                "author_username": updated_meme.user.username if updated_meme.user else "unknown" 
-            }])
-        except Exception as e:
-            print(f"Error scheduling search update for share: {e}")
+
+    # 2. В индексе меняется только счетчик — частичное обновление пачкой
+    await search_counters.mark_async(redis_client, meme_id)
     
     return {"status": "ok", "count": new_count}
\ No newline at end of file
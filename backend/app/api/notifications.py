@@ -12,11 +12,15 @@ from app.models.models import Notification, User, Meme
 from app.schemas import NotificationResponse
 from app.api.deps import get_current_user
 from app.core.redis import redis_client
+from app.services.notification_hub import notification_hub
 
 router = APIRouter()
 
 UNREAD_COUNT_TTL = 300  # 5 минут
 
+HEARTBEAT_INTERVAL = 30  # секунд тишины до ping
+HEARTBEAT_MESSAGE = json.dumps({"type": "ping"})
+
 def _unread_key(user_id) -> str:
     return f"unread_count:{user_id}"
 
@@ -43,37 +47,51 @@ async def websocket_endpoint(
         await websocket.close(code=1008)
         return
 
-    pubsub = redis_client.pubsub()
-    channel = f"notify:{user.id}"
-    await pubsub.subscribe(channel)
-    print(f"WS Connected: {user.username} -> {channel}")
+    queue = notification_hub.register(user.id)
+    print(f"WS Connected: {user.username}")
 
-    try:
+    async def sender():
+        # Ждем сообщений из хаба; тишина дольше HEARTBEAT_INTERVAL — шлем ping,
+        # заодно обнаруживая мертвые соединения
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-
-            if message:
-                print(f"WS Sending to {user.username}: {message['data']}")
-                await websocket.send_text(message["data"])
-
             try:
-                await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
+                data, received_at = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
             except asyncio.TimeoutError:
-                pass
-            except WebSocketDisconnect:
-                print(f"WS Disconnected client: {user.username}")
-                break
+                await websocket.send_text(HEARTBEAT_MESSAGE)
+                continue
+            await websocket.send_text(data)
+            notification_hub.record_delivery(received_at)
 
-    except Exception as e:
-        print(f"WS Loop Error: {e}")
+    async def receiver():
+        # Клиент нам ничего не шлет — читаем только чтобы узнать о disconnect
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if exc and not isinstance(exc, WebSocketDisconnect):
+                print(f"WS Loop Error: {exc}")
     finally:
-        await pubsub.unsubscribe(channel)
+        for task in tasks:
+            task.cancel()
+        notification_hub.unregister(user.id, queue)
+        print(f"WS Disconnected client: {user.username}")
         try:
             await websocket.close()
         except:
             pass
 
 
+@router.get("/ws/metrics")
+async def websocket_metrics(current_user: User = Depends(get_current_user)):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return notification_hub.metrics()
+
+
 @router.get("/", response_model=List[NotificationResponse])
 async def get_notifications(
     skip: int = 0,
@@ -2,7 +2,8 @@ from typing import List, Any
 from fastapi import APIRouter
 from pydantic import BaseModel
 
-from app.services.search import get_search_service
+from app.services.search_client import search_client
+from app.services import search_cache
 from app.core.redis import redis_client
 
 router = APIRouter()
@@ -33,10 +34,5 @@ async def search_global(q: str = "", limit: int = 20, offset: int = 0):
         print(f"Redis search stats error: {e}")
     # -----------------------------------------------------------
 
-    search = get_search_service()
-    if not search:
-        return SearchResponse()
-
-    results = search.search_multi(q, limit, offset)
-
-    return results
\ No newline at end of file
+    # Кэш результатов -> один multi-search через общий async-пул; при сбое Meilisearch — пустой ответ
+    return await search_cache.cached_search(redis_client, search_client, q, limit, offset)
\ No newline at end of file
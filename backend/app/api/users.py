@@ -1,6 +1,5 @@
 import uuid
 import os
-import aiofiles
 import sqlalchemy as sa
 from datetime import datetime
 from typing import Optional, List
@@ -12,10 +11,12 @@ from pydantic import BaseModel
 from app.core.database import get_db
 from app.models.models import User, follows, Notification, NotificationType, Block
 from app.api.memes import get_optional_current_user
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_current_user_fresh
+from app.core.user_cache import invalidate_user
 from app.schemas import UserResponse, UserProfile, UserUpdate, BlockResponse, ChangePasswordRequest, UserUpdateSettings
 from app.core.security import verify_password, get_password_hash
 from app.utils.notifier import send_notification
+from app.utils.uploads import save_upload
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
@@ -26,7 +27,7 @@ UPLOAD_DIR = "uploads"
 async def follow_user(
     username: str,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_fresh)
 ):
     query = select(User).where(User.username == username)
     result = await db.execute(query)
@@ -90,6 +91,9 @@ async def follow_user(
                 )
 
     await db.commit()
+    # Счетчики подписок изменились у обоих
+    await invalidate_user(current_user)
+    await invalidate_user(target_user)
 
     return {
         "action": action,
@@ -172,7 +176,7 @@ async def update_user_me(
     avatar_file: UploadFile = File(None),
     header_file: UploadFile = File(None),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_fresh)
 ):
     if full_name is not None: current_user.full_name = full_name
     if bio is not None: current_user.bio = bio
@@ -182,21 +186,20 @@ async def update_user_me(
         ext = avatar_file.filename.split('.')[-1]
         filename = f"avatar_{current_user.id}.{ext}"
         path = os.path.join(UPLOAD_DIR, filename)
-        async with aiofiles.open(path, 'wb') as f:
-            await f.write(await avatar_file.read())
+        await save_upload(avatar_file, path, "avatar")
         current_user.avatar_url = f"/static/{filename}"
 
     if header_file:
         ext = header_file.filename.split('.')[-1]
         filename = f"header_{current_user.id}.{ext}"
         path = os.path.join(UPLOAD_DIR, filename)
-        async with aiofiles.open(path, 'wb') as f:
-            await f.write(await header_file.read())
+        await save_upload(header_file, path, "avatar")
         current_user.header_url = f"/static/{filename}"
 
     db.add(current_user)
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_user(current_user)
 
     current_user.is_me = True
 
@@ -206,7 +209,7 @@ async def update_user_me(
 async def change_password(
     body: ChangePasswordRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_fresh)
 ):
     if not verify_password(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Неверный текущий пароль")
@@ -214,13 +217,14 @@ async def change_password(
     current_user.hashed_password = get_password_hash(body.new_password)
     db.add(current_user)
     await db.commit()
+    await invalidate_user(current_user)
     return None
 
 @router.patch("/me/settings", response_model=UserResponse)
 async def update_settings(
     settings: UserUpdateSettings,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_fresh)
 ):
     update_data = settings.dict(exclude_unset=True)
     for key, value in update_data.items():
@@ -229,6 +233,7 @@ async def update_settings(
     db.add(current_user)
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_user(current_user)
 
     current_user.is_me = True
     return current_user
@@ -275,7 +280,7 @@ async def read_user(
 async def block_user(
     user_id: uuid.UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_fresh)
 ):
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot block self")
@@ -316,6 +321,9 @@ async def block_user(
             target_user.following_count = max(0, target_user.following_count - 1)
 
     await db.commit()
+    await invalidate_user(current_user)
+    if target_user:
+        await invalidate_user(target_user)
     return {"is_blocked": True, "user_id": user_id}
 
 @router.post("/{user_id}/unblock", response_model=BlockResponse)
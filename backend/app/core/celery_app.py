@@ -1,28 +1,86 @@
+import os
 from celery import Celery
 from app.core.config import settings
 
+# Период частичной синхронизации счетчиков в поисковом индексе (services/search_counters)
+SEARCH_COUNTERS_SYNC_SECONDS = float(os.getenv("SEARCH_COUNTERS_SYNC_SECONDS", "60"))
+
 celery_app = Celery("worker", broker=settings.CELERY_BROKER_URL)
 
 celery_app.conf.update(
     # ВАЖНО: Явно указываем, где лежат наши задачи, чтобы Celery их нашел
     imports=['app.worker'],
     
-    # УБРАЛИ task_routes: теперь все задачи идут в стандартную очередь 'celery',
-    # которую воркер слушает по умолчанию.
-    
+    # Очереди по классу нагрузки: долгие ffmpeg/rembg/рендер-задачи не должны
+    # задерживать индексацию и синхронизацию счетчиков. Каждую очередь слушает
+    # свой воркер (см. docker-compose.yml) со своими concurrency/prefetch.
+    task_default_queue="maintenance",
+    task_routes={
+        "app.worker.process_meme_task": {"queue": "media"},
+        "app.worker.process_sticker_image": {"queue": "ai"},
+        "app.worker.animate_sticker_task": {"queue": "editor"},
+        "app.worker.process_video_editor_task": {"queue": "editor"},
+        "app.worker.drain_search_outbox_task": {"queue": "index"},
+        "app.worker.apply_search_settings_task": {"queue": "index"},
+        "app.worker.sync_search_index_task": {"queue": "index"},
+        "app.worker.index_meme_task": {"queue": "index"},
+        "app.worker.delete_index_task": {"queue": "index"},
+        "app.worker.fanout_new_meme_task": {"queue": "maintenance"},
+        "app.worker.sync_views_task": {"queue": "maintenance"},
+        "app.worker.sync_search_counters_task": {"queue": "index"},
+        "app.worker.sync_search_stats_task": {"queue": "maintenance"},
+        "app.worker.refresh_hot_search_terms_task": {"queue": "maintenance"},
+        "app.worker.reconcile_approved_set_task": {"queue": "maintenance"},
+        "app.worker.gc_media_blobs_task": {"queue": "maintenance"},
+        "app.worker.sync_denormalized_counts_task": {"queue": "maintenance"},
+        "app.worker.recompute_hot_scores_task": {"queue": "maintenance"},
+    },
+
+    # Долгие задачи подтверждаются после выполнения (acks_late в декораторах).
+    # Redis переотдает неподтвержденную задачу по истечении visibility_timeout,
+    # поэтому он должен быть больше самого долгого рендера.
+    broker_transport_options={"visibility_timeout": 7200},
+
     beat_schedule={
+        # Страховка для outbox: подбирает события, если kick не дошел до брокера
+        "drain-search-outbox-every-30-seconds": {
+            "task": "app.worker.drain_search_outbox_task",
+            "schedule": 30.0,
+        },
         "sync-views-every-30-seconds": {
             "task": "app.worker.sync_views_task",
             "schedule": 30.0,
         },
+        "sync-search-counters": {
+            "task": "app.worker.sync_search_counters_task",
+            "schedule": SEARCH_COUNTERS_SYNC_SECONDS,
+        },
         "sync-search-stats-every-5-minutes": {
             "task": "app.worker.sync_search_stats_task",
             "schedule": 300.0,
         },
+        "refresh-hot-search-terms-every-5-minutes": {
+            "task": "app.worker.refresh_hot_search_terms_task",
+            "schedule": 300.0,
+        },
+        # SADD/SREM при загрузке/удалении могут теряться (падение между коммитом и Redis)
+        "reconcile-approved-set-every-hour": {
+            "task": "app.worker.reconcile_approved_set_task",
+            "schedule": 3600.0,
+        },
+        "gc-media-blobs-every-hour": {
+            "task": "app.worker.gc_media_blobs_task",
+            "schedule": 3600.0,
+        },
         "sync-denormalized-counts-every-hour": {
             "task": "app.worker.sync_denormalized_counts_task",
             "schedule": 3600.0,
         },
+        # Пишет только изменившиеся score, поэтому можно чаще: свежее снимок "smart"
+        "recompute-hot-scores-every-5-minutes": {
+            "task": "app.worker.recompute_hot_scores_task",
+            "schedule": 300.0,
+        },
     },
     timezone="UTC"
 )
\ No newline at end of file
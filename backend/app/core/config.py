@@ -26,6 +26,10 @@ class Settings(BaseSettings):
     MEILI_HOST: str = os.getenv("MEILI_HOST", "http://localhost:7700")
     MEILI_MASTER_KEY: str = os.getenv("MEILI_MASTER_KEY", "masterKey123")
 
+    # Общий секрет для внутренних вызовов (бот, SSR фронтенда): заголовок X-Internal-Token.
+    # Пустой — внутренние возможности (viewer у /memes/random и т.п.) выключены.
+    INTERNAL_API_TOKEN: str = os.getenv("INTERNAL_API_TOKEN", "")
+
     # URL для Celery (используем сервис redis из docker-compose)
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
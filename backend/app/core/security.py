@@ -1,10 +1,9 @@
-import uuid # <--- ВАЖНО: Добавлен импорт
 from datetime import datetime, timedelta, timezone
 from typing import Any, Union, Optional
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from app.core.database import AsyncSessionLocal
-from sqlalchemy import select
+from app.core.user_cache import load_user
 from app.models.models import User
 from app.core.config import settings
 
@@ -58,20 +57,6 @@ async def get_current_user_ws(token: str) -> Optional[User]:
     except JWTError:
         return None
 
+    # Один запрос (UUID или username по формату sub) и тот же кэш, что у HTTP-зависимостей
     async with AsyncSessionLocal() as db:
-        # 1. Пробуем найти по username
-        query = select(User).where(User.username == sub)
-        result = await db.execute(query)
-        user = result.scalars().first()
-        
-        # 2. Если не нашли, пробуем по UUID (если sub это ID)
-        if not user:
-            try:
-                user_uuid = uuid.UUID(sub)
-                query = select(User).where(User.id == user_uuid)
-                result = await db.execute(query)
-                user = result.scalars().first()
-            except ValueError:
-                pass 
-
-        return user
\ No newline at end of file
+        return await load_user(db, sub)
@@ -0,0 +1,129 @@
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.redis import redis_client
+from app.models.models import User
+
+# Кэш "снимков" пользователя для аутентификации: локальный LRU + Redis.
+# Локальный TTL короткий — invalidate_user чистит только свой процесс и Redis,
+# остальные процессы догонят через LOCAL_TTL.
+LOCAL_TTL = 5
+LOCAL_MAX_SIZE = 2048
+REDIS_TTL = 60
+REDIS_KEY = "auth:user:{sub}"
+
+# Хэш пароля в кэш не кладем: эндпоинты, которым он нужен, берут свежую строку
+_EXCLUDED_COLUMNS = {"hashed_password"}
+_COLUMNS = [c for c in User.__table__.columns if c.key not in _EXCLUDED_COLUMNS]
+
+_local: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _redis_key(sub: str) -> str:
+    return REDIS_KEY.format(sub=sub)
+
+
+def _dump(user: User) -> dict:
+    data = {}
+    for col in _COLUMNS:
+        value = getattr(user, col.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, uuid.UUID):
+            value = str(value)
+        data[col.key] = value
+    return data
+
+
+def _load(data: dict) -> User:
+    values = {}
+    for col in _COLUMNS:
+        value = data.get(col.key)
+        if value is not None:
+            if isinstance(col.type, UUID):
+                value = uuid.UUID(value)
+            elif isinstance(col.type, DateTime):
+                value = datetime.fromisoformat(value)
+        values[col.key] = value
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+def _local_get(sub: str) -> Optional[dict]:
+    entry = _local.get(sub)
+    if entry is None:
+        return None
+    expires_at, data = entry
+    if expires_at < time.monotonic():
+        _local.pop(sub, None)
+        return None
+    _local.move_to_end(sub)
+    return data
+
+
+def _local_set(sub: str, data: dict):
+    _local[sub] = (time.monotonic() + LOCAL_TTL, data)
+    _local.move_to_end(sub)
+    while len(_local) > LOCAL_MAX_SIZE:
+        _local.popitem(last=False)
+
+
+async def _fetch(db: AsyncSession, sub: str) -> Optional[User]:
+    try:
+        query = select(User).where(User.id == uuid.UUID(sub))
+    except ValueError:
+        query = select(User).where(User.username == sub)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def load_user(db: AsyncSession, sub: str, fresh: bool = False) -> Optional[User]:
+    """
+    Пользователь по `sub` из JWT (UUID или username).
+    fresh=True — всегда SELECT (для эндпоинтов, которые меняют пользователя или
+    читают hashed_password); результат при этом обновляет кэш.
+    Из кэша возвращается объект, присоединенный к сессии через merge(load=False) — без SQL.
+    """
+    if not fresh:
+        data = _local_get(sub)
+        if data is None:
+            try:
+                cached = await redis_client.get(_redis_key(sub))
+                if cached:
+                    data = json.loads(cached)
+                    _local_set(sub, data)
+            except Exception as e:
+                print(f"User cache read error: {e}")
+        if data is not None:
+            return await db.merge(_load(data), load=False)
+
+    user = await _fetch(db, sub)
+    if user is not None:
+        data = _dump(user)
+        _local_set(sub, data)
+        try:
+            await redis_client.set(_redis_key(sub), json.dumps(data), ex=REDIS_TTL)
+        except Exception as e:
+            print(f"User cache write error: {e}")
+    return user
+
+
+async def invalidate_user(user: User):
+    """Сбросить снимок после изменения пользователя (ключи по id и по username)."""
+    subs = [str(user.id), user.username]
+    for sub in subs:
+        _local.pop(sub, None)
+    try:
+        await redis_client.delete(*[_redis_key(sub) for sub in subs])
+    except Exception as e:
+        print(f"User cache invalidate error: {e}")
@@ -1,18 +1,15 @@
 import os
-import asyncio
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.core.config import settings
 from app.api import memes, auth, users, notifications, search, editor
-from app.services.search import get_search_service
-from app.core.database import AsyncSessionLocal 
-from app.models.models import Meme, User, Tag
+from app.services.search_client import search_client
+from app.core.celery_app import celery_app
 from app.core.admin import setup_admin
+from app.services.notification_hub import notification_hub, progress_hub
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -35,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # курсор keyset-пагинации ленты
 )
 
 os.makedirs("uploads", exist_ok=True)
@@ -51,88 +49,22 @@ app.include_router(editor.router, prefix=f"{settings.API_V1_STR}/editor", tags=[
 
 setup_admin(app)
 
-# --- ФУНКЦИЯ СИНХРОНИЗАЦИИ ---
-async def sync_search_index():
-    """Полная пересинхронизация данных в Meilisearch"""
-    search_service = None
-    
-    # 1. Ждем подключения к Meilisearch
-    for i in range(3):
-        try:
-            search_service = get_search_service()
-            if search_service:
-                search_service.client.health()
-                break
-        except Exception:
-            print(f"⏳ Waiting for Meilisearch... ({i+1}/3)")
-            await asyncio.sleep(2)
-            
-    if not search_service:
-        print("⚠️ Search service not available, skipping sync.")
-        return
-
-    print("🔄 Starting background search sync...")
-    
-    try:
-        async with AsyncSessionLocal() as db:
-            # Очистка старого
-            search_service.index_memes.delete_all_documents()
-            search_service.index_users.delete_all_documents()
-            search_service.index_tags.delete_all_documents()
-
-            # 1. Мемы
-            query = select(Meme).where(Meme.status == 'approved').options(
-                selectinload(Meme.tags)
-            )
-            memes_list = (await db.execute(query)).scalars().all()
-
-            if memes_list:
-                documents = []
-                for meme in memes_list:
-                    tags_list = [t.name for t in meme.tags]
-
-                    documents.append({
-                        "id": str(meme.id),
-                        "title": meme.title,
-                        "description": meme.description,
-                        "thumbnail_url": meme.thumbnail_url,
-                        "media_url": meme.media_url,
-                        "views_count": meme.views_count,
-                        "tags": tags_list,
-                    })
-                search_service.index_memes.add_documents(documents)
-                print(f"✅ Synced {len(documents)} memes.")
-
-            # 2. Юзеры
-            user_list = (await db.execute(select(User))).scalars().all()
-            if user_list:
-                user_docs = [{
-                    "id": str(u.id),
-                    "username": u.username,
-                    "full_name": u.full_name,
-                    "avatar_url": u.avatar_url
-                } for u in user_list]
-                search_service.index_users.add_documents(user_docs)
-                print(f"✅ Synced {len(user_docs)} users.")
-
-            # 3. Теги (только используемые)
-            tag_query = (
-                select(Tag)
-                .join(Tag.memes)
-                .where(Meme.status == 'approved')
-                .distinct()
-            )
-            tags_list = (await db.execute(tag_query)).scalars().all()
-            
-            if tags_list:
-                tag_docs = [{"id": t.id, "name": t.name} for t in tags_list]
-                search_service.index_tags.add_documents(tag_docs)
-                print(f"✅ Synced {len(tag_docs)} active tags.")
-            
-    except Exception as e:
-        print(f"❌ Search sync failed: {e}")
-
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Starting up application...")
-    asyncio.create_task(sync_search_index())
\ No newline at end of file
+    # Настройки индексов применяет воркер (один раз на версию), старт API их не ждет
+    try:
+        celery_app.send_task("app.worker.apply_search_settings_task")
+    except Exception as e:
+        print(f"Search settings schedule error: {e}")
+    # Догоняющая синхронизация поиска: инкрементально, одна на все реплики
+    try:
+        celery_app.send_task("app.worker.sync_search_index_task")
+    except Exception as e:
+        print(f"Search sync schedule error: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await notification_hub.stop()
+    await progress_hub.stop()
+    await search_client.close()
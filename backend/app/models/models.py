@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, ForeignKey, Integer, Float, Table, Text, DateTime
+from sqlalchemy import Column, String, Boolean, ForeignKey, Integer, BigInteger, Float, Table, Text, DateTime
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, backref
 from app.core.database import Base
@@ -34,6 +34,7 @@ class User(Base):
     bio = Column(String, nullable=True)
     website = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     is_superuser: bool = Column(Boolean, default=False)
 
     # Денормализованные счетчики
@@ -94,7 +95,13 @@ class Meme(Base):
     comments_count = Column(Integer, default=0)
     status = Column(String, default="pending")
     shares_count = Column(Integer, default=0)
+    # Общие файлы с другими мемами при совпадении контента (см. MediaBlob)
+    media_blob_id = Column(Integer, ForeignKey("media_blobs.id", ondelete="SET NULL"), nullable=True)
+    # Предрасчитанный score "умной" ленты (пересчитывается Celery beat)
+    hot_score = Column(Float, default=1 / (2 ** 1.5), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Водяной знак инкрементальной синхронизации поиска (services/search_sync)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Связи
     user = relationship("User", back_populates="memes")
@@ -102,6 +109,26 @@ class Meme(Base):
     likes = relationship("Like", back_populates="meme", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="meme", cascade="all, delete-orphan")
 
+class MediaBlob(Base):
+    """Обработанный медиа-контент, общий для мемов с одинаковым исходником."""
+    __tablename__ = "media_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # хэш исходного файла
+    phash = Column(String(16), index=True, nullable=True)     # dHash картинки / первого кадра
+
+    media_url = Column(String, nullable=False)
+    thumbnail_url = Column(String, nullable=False)
+    preview_url = Column(String, nullable=True)
+    duration = Column(Float, default=0.0)
+    width = Column(Integer, default=0)
+    height = Column(Integer, default=0)
+    has_audio = Column(Boolean, default=False)
+
+    # Сколько мемов ссылается на файлы; файлы удаляются вместе с последним
+    ref_count = Column(Integer, default=1, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Like(Base):
     __tablename__ = "likes"
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
@@ -194,4 +221,14 @@ class SearchTerm(Base):
     id = Column(Integer, primary_key=True, index=True)
     term = Column(String, unique=True, index=True)
     count = Column(Integer, default=0)
-    last_searched_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    last_searched_at = Column(DateTime, default=datetime.utcnow)
+
+class SearchOutbox(Base):
+    """Изменения для поискового индекса: пишутся в той же транзакции, что и сами данные."""
+    __tablename__ = "search_outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    entity = Column(String(16), nullable=False, default="meme")
+    entity_id = Column(String, nullable=False)
+    op = Column(String(8), nullable=False, default="upsert")  # upsert | delete
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,271 @@
+"""
+Бенчмарк рендера анимированных стикеров по каждой анимации из ANIM_DEFS:
+текущий движок против прежнего (до векторизации), копия которого лежит ниже.
+
+Для каждой анимации меряет:
+- baseline_tf_ms / vector_tf_ms: расчет матриц всех кадров — прежний покадровый
+  скалярный Newton-solve против KeyframeTrack
+- baseline_ms / sticker_ms: полный рендер + экспорт GIF — прежний путь MoviePy
+  (кадр рендерится дважды: для RGB и для маски) против create_animated_sticker
+
+Запуск: python -m app.scripts.bench_stickers [путь_к_png] [повторы]
+"""
+import math
+import os
+import sys
+import time
+import tempfile
+
+# Добавляем корень проекта в path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.services.sticker import (
+    ANIM_DEFS, StickerService, KeyframeTrack, _PROP_DEFAULTS, _TIMING_CACHE,
+)
+
+FPS = 15
+
+
+# ==============================
+# Прежний движок (копия sticker.py до векторизации, только для сравнения)
+# ==============================
+
+def _baseline_cubic_bezier_y(t, p1x, p1y, p2x, p2y):
+    if t <= 0:
+        return 0.0
+    if t >= 1:
+        return 1.0
+    u = t
+    for _ in range(8):
+        bx = 3 * (1 - u) ** 2 * u * p1x + 3 * (1 - u) * u ** 2 * p2x + u ** 3
+        dbx = 3 * (1 - u) ** 2 * p1x + 6 * (1 - u) * u * (p2x - p1x) + 3 * u ** 2 * (1 - p2x)
+        if abs(dbx) < 1e-12:
+            break
+        u -= (bx - t) / dbx
+        u = max(0.0, min(1.0, u))
+    return 3 * (1 - u) ** 2 * u * p1y + 3 * (1 - u) * u ** 2 * p2y + u ** 3
+
+
+def _baseline_ease(t, timing='linear'):
+    if timing == 'linear':
+        return t
+    params = _TIMING_CACHE.get(timing)
+    if not params:
+        return t
+    return _baseline_cubic_bezier_y(t, *params)
+
+
+def _baseline_interpolate(t_seconds, anim_def):
+    duration = anim_def['duration']
+    t_norm = (t_seconds % duration) / duration
+    keyframes = anim_def['keyframes']
+    global_timing = anim_def.get('timing', 'linear')
+
+    prev_kf = keyframes[0]
+    next_kf = keyframes[-1]
+    for i in range(len(keyframes) - 1):
+        if keyframes[i][0] <= t_norm <= keyframes[i + 1][0]:
+            prev_kf = keyframes[i]
+            next_kf = keyframes[i + 1]
+            break
+
+    p0, props0 = prev_kf[0], prev_kf[1]
+    p1, props1 = next_kf[0], next_kf[1]
+    segment_timing = prev_kf[2] if len(prev_kf) > 2 else global_timing
+
+    local_t = (t_norm - p0) / (p1 - p0) if (p1 - p0) > 0 else 0
+    eased_t = _baseline_ease(local_t, segment_timing)
+
+    result = {}
+    for prop in set(list(props0.keys()) + list(props1.keys())):
+        v0 = props0.get(prop, _PROP_DEFAULTS.get(prop, 0))
+        v1 = props1.get(prop, _PROP_DEFAULTS.get(prop, 0))
+        result[prop] = v0 + (v1 - v0) * eased_t
+    return result
+
+
+def _baseline_affine(transforms, anim_name, content_rect):
+    c_x, c_y, cw, ch = content_rect
+    origin_frac = ANIM_DEFS[anim_name].get('origin', (0.5, 0.5))
+    ox = c_x + origin_frac[0] * cw
+    oy = c_y + origin_frac[1] * ch
+
+    tx = transforms.get('translateX', 0)
+    ty = transforms.get('translateY', 0)
+    if anim_name in ('bouncy', 'peeker'):
+        ty = ty * ch
+    sx = transforms.get('scaleX', 1.0)
+    sy = transforms.get('scaleY', 1.0)
+    angle = math.radians(transforms.get('rotate', 0))
+    skew = math.radians(transforms.get('skewX', 0))
+
+    O = np.array([[1, 0, -ox], [0, 1, -oy], [0, 0, 1]], dtype=np.float64)
+    O_inv = np.array([[1, 0, ox], [0, 1, oy], [0, 0, 1]], dtype=np.float64)
+    T = np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+    R = np.array([
+        [math.cos(angle), -math.sin(angle), 0],
+        [math.sin(angle), math.cos(angle), 0],
+        [0, 0, 1]
+    ], dtype=np.float64)
+    K = np.array([[1, math.tan(skew), 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+    S = np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+
+    if anim_name in ('bouncy', 'peeker'):
+        M_t = T @ S
+    elif anim_name == 'jelly':
+        M_t = S @ K
+    elif anim_name == 'floaties':
+        M_t = T @ R
+    elif anim_name in ('flippy', 'zoomie'):
+        M_t = S
+    elif anim_name in ('spinny', 'tilty'):
+        M_t = R
+    else:
+        M_t = np.eye(3)
+    return (O_inv @ M_t @ O)[:2, :].astype(np.float32)
+
+
+def _baseline_bbox(clip, num_samples=10):
+    min_x, min_y = clip.w, clip.h
+    max_x, max_y = 0, 0
+    for t in np.linspace(0, clip.duration * 0.95, num_samples):
+        mask_frame = clip.mask.get_frame(t)
+        rows = np.any(mask_frame > 0.01, axis=1)
+        cols = np.any(mask_frame > 0.01, axis=0)
+        if rows.any() and cols.any():
+            y_idx = np.where(rows)[0]
+            x_idx = np.where(cols)[0]
+            min_x, min_y = min(min_x, x_idx[0]), min(min_y, y_idx[0])
+            max_x, max_y = max(max_x, x_idx[-1]), max(max_y, y_idx[-1])
+    return (max(0, min_x - 4), max(0, min_y - 4),
+            min(clip.w, max_x + 5), min(clip.h, max_y + 5))
+
+
+def _baseline_sticker(image_path: str, output_path: str, animation: str):
+    """Прежний create_animated_sticker для анимации: MoviePy + write_gif(program='ffmpeg')."""
+    from moviepy.editor import ImageClip, CompositeVideoClip, VideoClip
+
+    img = Image.open(image_path).convert("RGBA")
+    if max(img.size) > 512:
+        img.thumbnail((512, 512), Image.Resampling.LANCZOS)
+    w, h = img.size
+    padding = int(max(w, h) * 0.20)
+    new_size = (w + padding * 2, h + padding * 2)
+    canvas = Image.new("RGBA", new_size, (0, 0, 0, 0))
+    canvas.paste(img, (padding, padding))
+    temp_frame = output_path + "_temp.png"
+    canvas.save(temp_frame)
+
+    base_img = np.array(canvas)
+    content_rect = (padding, padding, w, h)
+    anim_def = ANIM_DEFS[animation]
+    duration = anim_def['duration']
+
+    if animation == "floaties":
+        clip_base = ImageClip(temp_frame, duration=duration)
+
+        def pos(t, o=0):
+            tr = _baseline_interpolate(t + o, anim_def)
+            return (tr.get('translateX', 0), tr.get('translateY', 0))
+
+        def rot(t, o=0):
+            return -_baseline_interpolate(t + o, anim_def).get('rotate', 0)
+
+        layers = []
+        for i in range(anim_def.get('ghost_layers', 7), 0, -1):
+            offset = anim_def.get('ghost_delay', 0.15) * i
+            layers.append(clip_base.copy()
+                          .rotate(lambda t, o=offset: rot(t, o), expand=False)
+                          .set_position(lambda t, o=offset: pos(t, o)))
+        layers.append(clip_base.copy().rotate(rot, expand=False).set_position(pos))
+        final_clip = CompositeVideoClip(layers, size=new_size)
+    else:
+        def make_frame(t):
+            M = _baseline_affine(_baseline_interpolate(t, anim_def), animation, content_rect)
+            return cv2.warpAffine(base_img, M, new_size, flags=cv2.INTER_LINEAR,
+                                  borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+
+        # Без кэша кадра: RGB и маска рендерят кадр каждый сам
+        clip = VideoClip(lambda t: make_frame(t)[:, :, :3], duration=duration)
+        clip.mask = VideoClip(lambda t: make_frame(t)[:, :, 3].astype(np.float64) / 255.0,
+                              duration=duration, ismask=True)
+        final_clip = CompositeVideoClip([clip], size=new_size)
+    final_clip.duration = duration
+
+    x1, y1, x2, y2 = _baseline_bbox(final_clip)
+    if x2 > x1 + 10 and y2 > y1 + 10:
+        final_clip = final_clip.crop(x1=x1, y1=y1, x2=x2, y2=y2)
+    final_clip.write_gif(output_path, fps=FPS, program='ffmpeg', opt='Wu', fuzz=3, logger=None)
+    final_clip.close()
+    os.remove(temp_frame)
+
+
+def _sample_image(path: str):
+    """Тестовый стикер: круг с прозрачным фоном 400x400."""
+    img = Image.new("RGBA", (400, 400), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((40, 40, 360, 360), fill=(240, 180, 40, 255))
+    draw.rectangle((150, 120, 250, 280), fill=(30, 30, 30, 255))
+    img.save(path)
+
+
+def _best_of(fn, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def bench(image_path: str, repeats: int = 3):
+    w, h = Image.open(image_path).size
+    padding = int(max(w, h) * 0.20)
+    content_rect = (padding, padding, w, h)
+
+    print(f"{'animation':<10} {'frames':>6} {'baseline_tf_ms':>14} {'vector_tf_ms':>12} "
+          f"{'baseline_ms':>11} {'sticker_ms':>10} {'baseline_kb':>11} {'size_kb':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, anim_def in ANIM_DEFS.items():
+            times = np.arange(0, anim_def['duration'], 1.0 / FPS)
+
+            def baseline_transforms():
+                for t in times:
+                    _baseline_affine(_baseline_interpolate(t, anim_def), name, content_rect)
+
+            baseline_tf_ms = _best_of(baseline_transforms, repeats)
+            vector_tf_ms = _best_of(lambda: KeyframeTrack(name, content_rect, FPS), repeats)
+
+            baseline_out = os.path.join(tmp, f"{name}_baseline.gif")
+            try:
+                baseline_ms = _best_of(lambda: _baseline_sticker(image_path, baseline_out, name), repeats)
+                baseline = f"{baseline_ms:>11.1f} "
+                baseline_kb = f"{os.path.getsize(baseline_out) / 1024:>11.1f}"
+            except ImportError:
+                # moviepy не установлен — сравнение рендера недоступно
+                baseline, baseline_kb = f"{'-':>11} ", f"{'-':>11}"
+
+            output = os.path.join(tmp, f"{name}.gif")
+            sticker_ms = _best_of(
+                lambda: StickerService(output).create_animated_sticker(image_path, animation=name),
+                repeats,
+            )
+            size_kb = os.path.getsize(output) / 1024
+            print(f"{name:<10} {len(times):>6} {baseline_tf_ms:>14.2f} {vector_tf_ms:>12.2f} "
+                  f"{baseline}{sticker_ms:>10.1f} {baseline_kb} {size_kb:>8.1f}")
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    if len(sys.argv) > 1:
+        bench(sys.argv[1], repeats)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sample.png")
+            _sample_image(path)
+            bench(path, repeats)
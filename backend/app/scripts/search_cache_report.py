@@ -0,0 +1,52 @@
+"""
+Отчет по кэшу поиска: hit rate и задержки /search с кэшем (hit) и без него (miss).
+
+Данные пишет services/search_cache: счетчики в stats:search_cache и последние
+LATENCY_SAMPLES задержек каждого вида.
+
+Запуск: python -m app.scripts.search_cache_report [--reset]
+"""
+import os
+import sys
+
+# Добавляем корень проекта в path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import redis
+
+from app.core.config import settings
+from app.services.search_cache import STATS_KEY, LATENCY_KEY, HOT_TERMS_KEY
+
+
+def _percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(redis_client):
+    stats = redis_client.hgetall(STATS_KEY)
+    hits, misses = int(stats.get("hits", 0)), int(stats.get("misses", 0))
+    total = hits + misses
+    hit_rate = hits / total * 100 if total else 0.0
+    print(f"requests: {total}  hits: {hits}  misses: {misses}  hit rate: {hit_rate:.1f}%")
+    print(f"hot terms: {redis_client.scard(HOT_TERMS_KEY)}")
+
+    print(f"{'kind':<6} {'samples':>8} {'p50_ms':>8} {'p99_ms':>8}")
+    for kind, label in (("hit", "cache"), ("miss", "meili")):
+        samples = [float(v) for v in redis_client.lrange(LATENCY_KEY.format(kind=kind), 0, -1)]
+        if not samples:
+            print(f"{label:<6} {0:>8} {'-':>8} {'-':>8}")
+            continue
+        print(f"{label:<6} {len(samples):>8} {_percentile(samples, 50):>8.2f} {_percentile(samples, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    try:
+        report(client)
+        if "--reset" in sys.argv:
+            client.delete(STATS_KEY, LATENCY_KEY.format(kind="hit"), LATENCY_KEY.format(kind="miss"))
+            print("🧹 Stats reset")
+    finally:
+        client.close()
@@ -3,6 +3,14 @@ import numpy as np
 import cv2
 from PIL import Image
 
+from app.services.model_registry import model_registry
+from app.services.bg_batcher import bg_batcher
+
+# birefnet-general - Лучшая детализация (SOTA).
+# Если вдруг упадет, поменяйте на 'u2net' (классика)
+BG_MODEL = "birefnet-general"
+FALLBACK_BG_MODEL = "u2netp"
+
 class AIService:
     @staticmethod
     def remove_background(input_bytes: bytes) -> bytes:
@@ -11,16 +19,6 @@ class AIService:
         Включает жесткую оптимизацию памяти для ноутбуков с 16GB RAM.
         """
         try:
-            # Ленивый импорт для безопасности процессов Celery
-            from rembg import remove, new_session
-            
-            # --- ВЫБОР МОДЕЛИ ---
-            # birefnet-general - Лучшая детализация (SOTA).
-            # Если вдруг упадет, поменяйте на 'u2net' (классика)
-            model_name = "birefnet-general" 
-            
-            session = new_session(model_name)
-            
             # --- 1. ПРЕДВАРИТЕЛЬНАЯ ОБРАБОТКА (Оптимизация RAM) ---
             img_pil = Image.open(io.BytesIO(input_bytes))
             
@@ -41,10 +39,12 @@ class AIService:
             # --- 2. ГЕНЕРАЦИЯ МАСКИ ---
             # alpha_matting=False - для BiRefNet это нормально, она и так точная.
             # Включение True на CPU может завесить систему.
-            result_bytes = remove(
-                input_bytes, 
-                session=session,
-                alpha_matting=False, 
+            # Маска считается в общем батче с параллельными задачами воркера,
+            # сессия берется из реестра процесса
+            result_bytes = bg_batcher.remove(
+                BG_MODEL,
+                input_bytes,
+                alpha_matting=False,
                 post_process_mask=True
             )
 
@@ -81,8 +81,10 @@ class AIService:
             # Аварийный фоллбек на самую легкую модель
             try:
                 print("Switching to lightweight model u2netp...")
-                from rembg import remove, new_session
-                return remove(input_bytes, session=new_session("u2netp"))
+                from rembg import remove
+                return model_registry.run(
+                    FALLBACK_BG_MODEL, lambda session: remove(input_bytes, session=session)
+                )
             except:
                 raise RuntimeError(f"Background removal failed: {e}")
 
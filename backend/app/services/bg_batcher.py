@@ -0,0 +1,165 @@
+"""
+Микробатчинг инференции удаления фона внутри AI-воркера.
+
+AI-воркер работает пулом потоков: параллельные задачи process_sticker_image
+кладут изображения в общую очередь, а один поток-диспетчер собирает все, что
+пришло за BATCH_WINDOW_MS, и прогоняет их одним forward pass. Маска каждого
+изображения возвращается своей задаче; вырезка и post-process остаются на
+стороне rembg.remove, так что результат совпадает с одиночным вызовом.
+
+Размер одного forward pass ограничен не только MAX_BATCH_SIZE, но и памятью:
+вход BiRefNet 1024x1024, и активации на картинку — сотни МБ. Батч режется так,
+чтобы ACTIVATION_MB на картинку укладывались в остаток AI_MODEL_MEMORY_MB после
+загруженных моделей. Используются внутренности rembg (BaseSession.normalize,
+inner_session) — версия закреплена в requirements.txt.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+from app.services.model_registry import model_registry
+
+# Сколько ждать попутчиков после первого запроса и максимум картинок в батче
+BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "15"))
+MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", "4"))
+
+# Предобработка моделей rembg: (mean, std, input size, sigmoid на выходе)
+MODEL_SPECS = {
+    "birefnet-general": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (1024, 1024), True),
+    "u2net": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320), False),
+    "u2netp": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320), False),
+}
+
+# Оценка рабочей памяти ONNX Runtime на одну картинку в батче (МБ, fp32)
+ACTIVATION_MB = {
+    "birefnet-general": 900,
+    "u2net": 150,
+    "u2netp": 40,
+}
+
+
+class _MaskSession:
+    """Сессия-заглушка для rembg.remove: predict отдает маску из батчера."""
+
+    def __init__(self, batcher, model_name: str):
+        self.batcher = batcher
+        self.model_name = model_name
+
+    def predict(self, img, *args, **kwargs):
+        return [self.batcher.predict_mask(self.model_name, img)]
+
+
+class BackgroundBatcher:
+    def __init__(self, window_ms: int = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Модели, чей ONNX-граф экспортирован с фиксированным batch=1
+        self._unbatchable = set()
+
+    def remove(self, model_name: str, data: bytes, **kwargs) -> bytes:
+        """rembg.remove, у которого маска считается в общем батче."""
+        from rembg import remove
+
+        return remove(data, session=_MaskSession(self, model_name), **kwargs)
+
+    def predict_mask(self, model_name: str, img: Image.Image) -> Image.Image:
+        if model_name not in MODEL_SPECS:
+            # Неизвестная предобработка — обычный одиночный predict
+            return model_registry.run(model_name, lambda session: session.predict(img)[0])
+        self._ensure_started()
+        future = Future()
+        self._queue.put((model_name, img, future))
+        return future.result()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="bg-batcher", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            by_model = {}
+            for item in items:
+                by_model.setdefault(item[0], []).append(item)
+            for model_name, group in by_model.items():
+                self._run_group(model_name, group)
+
+    def _run_group(self, model_name: str, group: list):
+        images = [img for _, img, _ in group]
+        try:
+            started = time.monotonic()
+            masks = model_registry.run(model_name, lambda session: self._forward(session, model_name, images))
+            model_registry.record_batch(model_name, len(images), time.monotonic() - started)
+        except Exception as e:
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+        for (_, _, future), mask in zip(group, masks):
+            future.set_result(mask)
+
+    def _batch_cap(self, model_name: str) -> int:
+        """Сколько картинок влезает в один run по остатку бюджета памяти (минимум одна)."""
+        if model_name in self._unbatchable:
+            return 1
+        per_image = ACTIVATION_MB.get(model_name, 500)
+        return max(1, min(self.max_batch, int(model_registry.headroom_mb() // per_image)))
+
+    def _forward(self, session, model_name: str, images: list) -> list:
+        mean, std, size, sigmoid = MODEL_SPECS[model_name]
+        inputs = [session.normalize(img, mean, std, size) for img in images]
+        input_name = next(iter(inputs[0]))
+
+        cap = self._batch_cap(model_name)
+        preds = []
+        for start in range(0, len(inputs), cap):
+            preds.append(self._run_chunk(session, model_name, input_name, inputs[start:start + cap]))
+        preds = np.concatenate(preds, axis=0)
+
+        masks = []
+        for img, pred in zip(images, preds):
+            if sigmoid:
+                pred = 1 / (1 + np.exp(-pred))
+            # Та же нормализация, что в predict() сессий rembg
+            ma, mi = np.max(pred), np.min(pred)
+            pred = (pred - mi) / (ma - mi)
+            mask = Image.fromarray((pred * 255).astype("uint8"), mode="L")
+            masks.append(mask.resize(img.size, Image.Resampling.LANCZOS))
+        return masks
+
+    def _run_chunk(self, session, model_name: str, input_name: str, inputs: list):
+        if len(inputs) > 1 and model_name not in self._unbatchable:
+            try:
+                batch = np.concatenate([inp[input_name] for inp in inputs], axis=0)
+                return session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+            except Exception as e:
+                print(f"Model {model_name} rejects batched input, running one by one: {e}")
+                self._unbatchable.add(model_name)
+        return np.concatenate(
+            [session.inner_session.run(None, inp)[0][:, 0, :, :] for inp in inputs], axis=0
+        )
+
+
+bg_batcher = BackgroundBatcher()
@@ -3,6 +3,24 @@ import shutil
 import ffmpeg
 from PIL import Image
 
+from app.utils.ffmpeg_progress import run_with_progress
+
+
+def display_dimensions(video_stream: dict):
+    """Размеры кадра после autorotate ffmpeg: при повороте на 90/270 ширина и высота меняются местами."""
+    width = int(video_stream.get('width', 0))
+    height = int(video_stream.get('height', 0))
+    rotation = video_stream.get('tags', {}).get('rotate')
+    for side_data in video_stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    try:
+        if abs(int(float(rotation or 0))) % 180 == 90:
+            width, height = height, width
+    except ValueError:
+        pass
+    return width, height
+
+
 class MediaProcessor:
     def __init__(self, path: str):
         self.path = path
@@ -47,6 +65,36 @@ class MediaProcessor:
         if not probe: return False
         return any(s['codec_type'] == 'audio' for s in probe['streams'])
 
+    def perceptual_hash(self) -> str:
+        """dHash (64 бита, hex) картинки или первого кадра видео — для поиска дублей."""
+        try:
+            if self.path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp')):
+                img = Image.open(self.path).convert('L').resize((9, 8), Image.LANCZOS)
+                pixels = list(img.getdata())
+            else:
+                out, _ = (
+                    ffmpeg
+                    .input(self.path, ss=0)
+                    .filter('scale', 9, 8)
+                    .output('pipe:', vframes=1, format='rawvideo', pix_fmt='gray')
+                    .run(capture_stdout=True, capture_stderr=True)
+                )
+                pixels = list(out[:72])
+            if len(pixels) < 72:
+                return None
+        except Exception as e:
+            print(f"Perceptual hash error: {e}")
+            return None
+
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        # Однотонный кадр (все биты одинаковые) ничего не говорит о содержимом
+        if bits in (0, (1 << 64) - 1):
+            return None
+        return f"{bits:016x}"
+
     def generate_thumbnail(self, output_path: str):
         try:
             (
@@ -164,6 +212,55 @@ class MediaProcessor:
             # Фолбэк на старый метод
             self.generate_thumbnail(poster_path.replace('.webp', '.jpg'))
 
+    def _output_dimensions(self):
+        """Размеры после autorotate и округления до четных (как scale=trunc(iw/2)*2)."""
+        probe = self._get_probe()
+        video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None) if probe else None
+        if not video_stream:
+            return 0, 0
+        width, height = display_dimensions(video_stream)
+        return width // 2 * 2, height // 2 * 2
+
+    def transcode_video_renditions(self, mp4_path: str, preview_path: str, poster_path: str,
+                                   preview_width: int = 480, poster_width: int = 640, on_progress=None):
+        """
+        MP4 + WebM preview + WebP poster за одно декодирование исходника (split в графе фильтров).
+        Метаданные результата считаются из уже сделанного probe исходника, без повторного ffprobe.
+        on_progress(доля 0..1) — по выводу ffmpeg -progress.
+        Возвращает (duration, width, height).
+        """
+        inp = ffmpeg.input(self.path)
+        split = inp.video.filter('scale', 'trunc(iw/2)*2', 'trunc(ih/2)*2').split()
+
+        main_streams = [split[0]]
+        if self.has_audio_stream():
+            main_streams.append(inp.audio)
+
+        duration, _, _ = self.get_metadata()
+        try:
+            stream = ffmpeg.merge_outputs(
+                ffmpeg.output(
+                    *main_streams, mp4_path,
+                    vcodec='libx264',
+                    acodec='aac',
+                    movflags='faststart',
+                    pix_fmt='yuv420p'
+                ),
+                ffmpeg.output(
+                    split[1].filter('scale', preview_width, -1), preview_path,
+                    vcodec='libvpx-vp9',
+                    crf=40,
+                    **{'b:v': '0'}
+                ),
+                ffmpeg.output(split[2].filter('scale', poster_width, -1), poster_path, vframes=1)
+            )
+            run_with_progress(stream, duration, on_progress)
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"FFmpeg renditions error: {e.stderr.decode() if e.stderr else str(e)}")
+
+        width, height = self._output_dimensions()
+        return duration, width, height
+
     def convert_to_mp4(self, output_path: str):
         """Конвертирует видео или GIF в MP4 с исправлением размеров."""
         try:
@@ -0,0 +1,89 @@
+import os
+from typing import Optional
+from PIL import Image, ImageChops
+from sqlalchemy import select, delete
+from app.models.models import MediaBlob
+
+# Поля мема, которые берутся из MediaBlob при повторной загрузке того же контента
+BLOB_MEME_FIELDS = ("media_url", "thumbnail_url", "preview_url", "duration", "width", "height", "has_audio")
+
+# Сколько blob'ов с тем же phash сверять попиксельно
+PHASH_CANDIDATES = 5
+
+UPLOAD_DIR = "uploads"
+GC_BATCH = 500
+
+
+def blob_lookup_query(sha256: str):
+    """SELECT MediaBlob с тем же sha256 исходника — единственный случай, когда файлы берутся без проверки."""
+    return select(MediaBlob).where(MediaBlob.sha256 == sha256, MediaBlob.ref_count > 0)
+
+
+def phash_candidates_query(phash: str, width: int, height: int):
+    """
+    Кандидаты по phash картинки. Совпадение phash — не дубликат: кандидат
+    переиспользуется только после same_pixels. Только для картинок: их blob
+    хранит исходник без перекодирования, поэтому размеры blob и загрузки
+    сравнимы (у видео в blob лежит результат транскодирования).
+    """
+    return (
+        select(MediaBlob)
+        .where(MediaBlob.phash == phash, MediaBlob.width == width,
+               MediaBlob.height == height, MediaBlob.ref_count > 0)
+        .limit(PHASH_CANDIDATES)
+    )
+
+
+def blob_path(url: str) -> str:
+    return os.path.join(UPLOAD_DIR, url.split("/")[-1])
+
+
+def same_pixels(path: str, blob: MediaBlob) -> bool:
+    """Попиксельное сравнение загрузки с файлом blob (другие метаданные/сжатие без потерь)."""
+    try:
+        with Image.open(path) as a, Image.open(blob_path(blob.media_url)) as b:
+            if a.size != b.size:
+                return False
+            return ImageChops.difference(a.convert("RGBA"), b.convert("RGBA")).getbbox() is None
+    except Exception as e:
+        print(f"Pixel compare error: {e}")
+        return False
+
+
+def apply_blob(meme, blob: MediaBlob):
+    for field in BLOB_MEME_FIELDS:
+        setattr(meme, field, getattr(blob, field))
+    meme.media_blob_id = blob.id
+
+
+def blob_from_meme(meme, sha256: str, phash: Optional[str]) -> MediaBlob:
+    blob = MediaBlob(sha256=sha256, phash=phash, ref_count=1)
+    for field in BLOB_MEME_FIELDS:
+        setattr(blob, field, getattr(meme, field))
+    return blob
+
+
+def collect_orphans(db) -> int:
+    """
+    Удаляет blob'ы без ссылок (ref_count уменьшает триггер на memes при любом
+    удалении) и их файлы. Sync-сессия воркера. Возвращает число удаленных blob'ов.
+
+    DELETE ... WHERE ref_count <= 0 перепроверяет условие после блокировки
+    строки: blob, который параллельная загрузка успела переиспользовать, останется.
+    """
+    urls = db.execute(
+        delete(MediaBlob)
+        .where(MediaBlob.id.in_(
+            select(MediaBlob.id).where(MediaBlob.ref_count <= 0).limit(GC_BATCH)
+        ))
+        .where(MediaBlob.ref_count <= 0)
+        .returning(MediaBlob.media_url, MediaBlob.thumbnail_url, MediaBlob.preview_url)
+    ).all()
+    db.commit()
+
+    for row in urls:
+        for url in filter(None, row):
+            path = blob_path(url)
+            if os.path.exists(path):
+                os.remove(path)
+    return len(urls)
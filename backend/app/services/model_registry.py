@@ -0,0 +1,182 @@
+"""
+Реестр rembg-сессий на процесс воркера.
+
+Сессия BiRefNet — несколько сотен МБ ONNX-весов; загружать ее на каждую задачу
+дороже самой инференции. Сессии создаются один раз на процесс, прогреваются при
+старте воркера (worker_process_init) и вытесняются по LRU, когда суммарный
+размер загруженных моделей выходит за бюджет памяти.
+"""
+import os
+import io
+import time
+import threading
+from collections import OrderedDict
+
+import redis
+from PIL import Image
+
+from app.core.config import settings
+
+# Бюджет памяти под загруженные модели (МБ) и минимум свободной памяти системы
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("AI_MODEL_MEMORY_MB", "2048"))
+MIN_AVAILABLE_MEMORY_MB = int(os.getenv("AI_MIN_AVAILABLE_MB", "512"))
+
+# Модели для прогрева при старте процесса (через запятую, пусто — без прогрева)
+WARMUP_MODELS_ENV = "AI_WARMUP_MODELS"
+
+# Оценка памяти сессии, если файла модели еще нет на диске (МБ)
+MODEL_SIZE_HINTS_MB = {
+    "birefnet-general": 1000,
+    "u2net": 350,
+    "u2netp": 20,
+}
+# ONNX Runtime держит веса плюс рабочие буферы — берем с запасом
+SESSION_OVERHEAD_FACTOR = 1.5
+
+# Латентность cold/warm по моделям: {model}:{kind}_seconds / {model}:{kind}_count
+AI_STATS_KEY = "stats:ai_models"
+
+
+def _model_path(model_name: str) -> str:
+    home = os.getenv("U2NET_HOME", os.path.join(os.path.expanduser("~"), ".u2net"))
+    return os.path.join(home, f"{model_name}.onnx")
+
+
+def _estimate_mb(model_name: str) -> float:
+    path = _model_path(model_name)
+    if os.path.exists(path):
+        return os.path.getsize(path) / (1024 * 1024) * SESSION_OVERHEAD_FACTOR
+    return MODEL_SIZE_HINTS_MB.get(model_name, 500) * SESSION_OVERHEAD_FACTOR
+
+
+def _available_memory_mb():
+    """MemAvailable из /proc/meminfo (None вне Linux)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class ModelRegistry:
+    def __init__(self, budget_mb: int = MODEL_MEMORY_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self._sessions = OrderedDict()  # model_name -> (session, size_mb)
+        self._warm = set()  # модели, уже прошедшие хотя бы одну инференцию
+        self._lock = threading.Lock()
+        self._redis = None
+
+    def get(self, model_name: str):
+        """Сессия модели: из кэша процесса или загруженная с диска."""
+        with self._lock:
+            entry = self._sessions.get(model_name)
+            if entry:
+                self._sessions.move_to_end(model_name)
+                return entry[0]
+
+            size_mb = _estimate_mb(model_name)
+            self._make_room(size_mb)
+
+            from rembg import new_session
+
+            started = time.monotonic()
+            session = new_session(model_name)
+            elapsed = time.monotonic() - started
+            self._sessions[model_name] = (session, size_mb)
+            self._warm.discard(model_name)
+            print(f"🧠 Model {model_name} loaded in {elapsed:.2f}s (~{size_mb:.0f} MB, pid {os.getpid()})")
+            self._record(model_name, "load", elapsed)
+            return session
+
+    def _make_room(self, size_mb: float):
+        """LRU-вытеснение, пока новая модель не влезет в бюджет и свободную память."""
+        while self._sessions:
+            used = sum(size for _, size in self._sessions.values())
+            available = _available_memory_mb()
+            fits_budget = used + size_mb <= self.budget_mb
+            fits_system = available is None or available - size_mb >= MIN_AVAILABLE_MEMORY_MB
+            if fits_budget and fits_system:
+                return
+            evicted, _ = self._sessions.popitem(last=False)
+            self._warm.discard(evicted)
+            print(f"🧹 Model {evicted} evicted (used ~{used:.0f} MB, available {available} MB)")
+
+    def run(self, model_name: str, fn):
+        """
+        Выполняет fn(session) и пишет латентность: первая инференция после
+        загрузки — cold (включая загрузку), последующие — warm.
+        """
+        started = time.monotonic()
+        session = self.get(model_name)
+        result = fn(session)
+        elapsed = time.monotonic() - started
+        kind = "warm" if model_name in self._warm else "cold"
+        self._warm.add(model_name)
+        self._record(model_name, kind, elapsed)
+        return result
+
+    def warmup(self, model_names):
+        """Загрузка и пробная инференция на крошечном изображении."""
+        from rembg import remove
+
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 64), (255, 255, 255)).save(buf, format="PNG")
+        probe = buf.getvalue()
+        for model_name in model_names:
+            try:
+                self.run(model_name, lambda session: remove(probe, session=session))
+            except Exception as e:
+                print(f"Model warmup error ({model_name}): {e}")
+
+    def headroom_mb(self) -> float:
+        """Сколько памяти осталось под рабочие буферы инференции (бюджет и система)."""
+        with self._lock:
+            used = sum(size for _, size in self._sessions.values())
+        headroom = self.budget_mb - used
+        available = _available_memory_mb()
+        if available is not None:
+            headroom = min(headroom, available - MIN_AVAILABLE_MEMORY_MB)
+        return headroom
+
+    def loaded(self) -> dict:
+        return {name: round(size, 1) for name, (_, size) in self._sessions.items()}
+
+    def record_batch(self, model_name: str, size: int, seconds: float):
+        """Статистика батчей: средний размер = batch_items / batch_count."""
+        self._write_stats({
+            f"{model_name}:batch_seconds": seconds,
+            f"{model_name}:batch_count": 1,
+            f"{model_name}:batch_items": size,
+        })
+
+    def _record(self, model_name: str, kind: str, seconds: float):
+        self._write_stats({
+            f"{model_name}:{kind}_seconds": seconds,
+            f"{model_name}:{kind}_count": 1,
+        })
+
+    def _write_stats(self, fields: dict):
+        try:
+            if self._redis is None:
+                self._redis = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+            pipe = self._redis.pipeline(transaction=False)
+            for field, value in fields.items():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat(AI_STATS_KEY, field, value)
+                else:
+                    pipe.hincrby(AI_STATS_KEY, field, value)
+            pipe.execute()
+        except Exception as e:
+            print(f"Model stats error: {e}")
+
+
+def warmup_from_env():
+    names = [n.strip() for n in os.getenv(WARMUP_MODELS_ENV, "").split(",") if n.strip()]
+    if names:
+        model_registry.warmup(names)
+
+
+model_registry = ModelRegistry()
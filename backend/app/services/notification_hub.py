@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Dict, Set
+
+from app.core.redis import redis_client
+
+CHANNEL_PATTERN = "notify:*"
+PROGRESS_CHANNEL_PATTERN = "progress:*"
+QUEUE_MAX_SIZE = 100       # на одно соединение; при переполнении выкидываем самые старые
+RECONNECT_DELAY = 1.0
+RECONNECT_DELAY_MAX = 30.0
+LATENCY_SAMPLES = 1000
+
+
+class NotificationHub:
+    """
+    Один pattern-подписчик на процесс вместо pubsub на каждое соединение.
+    Сообщения раскладываются по локальным очередям по ключу — части канала
+    после префикса: user_id для notify:*, task_id для progress:*.
+    """
+
+    def __init__(self, pattern: str = CHANNEL_PATTERN):
+        self.pattern = pattern
+        self._queues: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._task: asyncio.Task = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.messages_routed = 0
+        self.messages_dropped = 0
+
+    # --- соединения ---
+
+    def register(self, key) -> asyncio.Queue:
+        self._ensure_started()
+        queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+        self._queues[str(key)].add(queue)
+        return queue
+
+    def unregister(self, key, queue: asyncio.Queue):
+        key = str(key)
+        queues = self._queues.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._queues[key]
+
+    def record_delivery(self, received_at: float):
+        self._latencies.append(time.monotonic() - received_at)
+
+    # --- чтение Redis ---
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(self.pattern)
+                delay = RECONNECT_DELAY
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Notification hub {self.pattern} error (reconnecting in {delay:.0f}s): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _dispatch(self, channel: str, data: str):
+        queues = self._queues.get(channel.split(":", 1)[-1])
+        if not queues:
+            return
+        item = (data, time.monotonic())
+        for queue in queues:
+            if queue.full():
+                # Backpressure: медленный клиент теряет самые старые уведомления
+                queue.get_nowait()
+                self.messages_dropped += 1
+            queue.put_nowait(item)
+            self.messages_routed += 1
+
+    # --- метрики ---
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            "users_online": len(self._queues),
+            "connections": sum(len(q) for q in self._queues.values()),
+            "messages_routed": self.messages_routed,
+            "messages_dropped": self.messages_dropped,
+            "fanout_latency_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+notification_hub = NotificationHub()
+# Long-poll /editor/status ждет события progress:{task_id} через общий подписчик
+progress_hub = NotificationHub(PROGRESS_CHANNEL_PATTERN)
@@ -0,0 +1,86 @@
+"""
+Прогресс долгих задач воркера (видеоредактор, стикеры, обработка мемов).
+
+Состояние пишется в task:{id} (его читает /editor/status) и публикуется в
+progress:{id} — все long-poll запросы статуса слушают эти каналы через один psubscribe (progress_hub).
+Если известен пользователь, то же событие уходит в notify:{user_id} и
+доставляется по WebSocket через NotificationHub.
+Обновления троттлятся: не чаще MIN_INTERVAL и только при изменении на MIN_STEP процентов.
+"""
+import json
+import time
+from typing import Optional
+
+TASK_KEY = "task:{task_id}"
+PROGRESS_CHANNEL = "progress:{task_id}"
+TASK_KEY_TTL = 24 * 3600
+
+MIN_INTERVAL = 0.5
+MIN_STEP = 1
+
+# Тип WS-сообщения (фронтенд не считает его уведомлением)
+WS_MESSAGE_TYPE = "task_progress"
+
+
+def task_key(task_id: str) -> str:
+    return TASK_KEY.format(task_id=task_id)
+
+
+def progress_channel(task_id: str) -> str:
+    return PROGRESS_CHANNEL.format(task_id=task_id)
+
+
+class ProgressReporter:
+    def __init__(self, redis_client, task_id: str, user_id=None, kind: str = "task", **extra):
+        self.redis = redis_client
+        self.task_id = task_id
+        self.user_id = str(user_id) if user_id else None
+        self.kind = kind
+        self.extra = extra
+        self.percent = -1
+        self.stage_name = None
+        self._last_sent = 0.0
+
+    def update(self, fraction: float, stage: Optional[str] = None, force: bool = False):
+        percent = max(0, min(100, int(fraction * 100)))
+        stage_changed = stage is not None and stage != self.stage_name
+        if stage is not None:
+            self.stage_name = stage
+        now = time.monotonic()
+        if not force and not stage_changed:
+            if percent - self.percent < MIN_STEP or now - self._last_sent < MIN_INTERVAL:
+                return
+        self.percent = max(self.percent, percent)
+        self._last_sent = now
+        self._publish({"status": "PROCESSING", "progress": self.percent, "stage": self.stage_name})
+
+    def stage(self, name: str, start: float, end: float):
+        """Колбэк on_progress(доля), отображающий прогресс этапа в диапазон [start, end]."""
+        self.update(start, stage=name)
+        return lambda fraction: self.update(start + (end - start) * fraction)
+
+    def finish(self, **result):
+        self.percent = 100
+        payload = {"status": "SUCCESS", "progress": 100, **result}
+        self._publish(payload)
+        return payload
+
+    def fail(self, error: str):
+        payload = {"status": "FAILURE", "progress": max(self.percent, 0), "error": error}
+        self._publish(payload)
+        return payload
+
+    def _publish(self, payload: dict):
+        data = json.dumps({**self.extra, **payload})
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(task_key(self.task_id), data, ex=TASK_KEY_TTL)
+            pipe.publish(progress_channel(self.task_id), data)
+            if self.user_id:
+                pipe.publish(f"notify:{self.user_id}", json.dumps({
+                    "type": WS_MESSAGE_TYPE, "task_id": self.task_id, "kind": self.kind,
+                    **self.extra, **payload,
+                }))
+            pipe.execute()
+        except Exception as e:
+            print(f"Progress publish error: {e}")
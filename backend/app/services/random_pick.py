@@ -0,0 +1,130 @@
+import time
+import uuid
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Meme
+
+# Redis-множество id одобренных мемов: SRANDMEMBER работает за O(1) от размера каталога
+APPROVED_SET_KEY = "memes:approved"
+REBUILD_LOCK_KEY = "memes:approved:rebuild_lock"
+REBUILD_LOCK_TTL = 60
+
+# Окно "не повторять недавно показанные": ZSET id -> timestamp показа
+SEEN_KEY = "random:seen:{viewer}"
+SEEN_WINDOW = 6 * 3600
+SEEN_MAX = 200
+
+SAMPLE_SIZE = 10
+MAX_ATTEMPTS = 3
+
+# Периодическая сверка множества с БД (reconcile_approved_set_task)
+RECONCILE_KEY = "memes:approved:reconcile"
+RECONCILE_CHUNK = 1000
+
+
+def _seen_key(viewer: str) -> str:
+    return SEEN_KEY.format(viewer=viewer)
+
+
+async def rebuild_approved_set(db: AsyncSession, redis) -> int:
+    """Холодный старт: заливаем id всех одобренных мемов в множество (один раз)."""
+    if not await redis.set(REBUILD_LOCK_KEY, "1", nx=True, ex=REBUILD_LOCK_TTL):
+        return 0
+    try:
+        result = await db.stream_scalars(select(Meme.id).where(Meme.status == "approved"))
+        total = 0
+        async for chunk in result.partitions(1000):
+            await redis.sadd(APPROVED_SET_KEY, *[str(mid) for mid in chunk])
+            total += len(chunk)
+        return total
+    finally:
+        await redis.delete(REBUILD_LOCK_KEY)
+
+
+async def _pick_sql(db: AsyncSession) -> Optional[uuid.UUID]:
+    """
+    Запасной путь, пока множество пустое или пересобирается: первый одобренный
+    мем после случайного UUID по индексу первичного ключа (id — uuid4, поэтому
+    распределение близко к равномерному), без ORDER BY random() по всей таблице.
+    """
+    base = select(Meme.id).where(Meme.status == "approved").order_by(Meme.id).limit(1)
+    meme_id = (await db.execute(base.where(Meme.id >= uuid.uuid4()))).scalar()
+    if meme_id is None:
+        meme_id = (await db.execute(base)).scalar()
+    return meme_id
+
+
+async def pick_random_meme_id(db: AsyncSession, redis, viewer: Optional[str] = None) -> Optional[uuid.UUID]:
+    """
+    Случайный id одобренного мема.
+    Если задан viewer — избегаем мемов, показанных ему за последние SEEN_WINDOW секунд
+    (когда свежих кандидатов нет, отдаем любой).
+    None — одобренных мемов нет.
+    """
+    candidates = await redis.srandmember(APPROVED_SET_KEY, SAMPLE_SIZE)
+    if not candidates and await rebuild_approved_set(db, redis):
+        candidates = await redis.srandmember(APPROVED_SET_KEY, SAMPLE_SIZE)
+    if not candidates:
+        # Пересборку ведет другой запрос — не отвечаем 404, берем из БД
+        return await _pick_sql(db)
+
+    if viewer:
+        key = _seen_key(viewer)
+        now = time.time()
+        await redis.zremrangebyscore(key, "-inf", now - SEEN_WINDOW)
+        scores = await redis.zmscore(key, candidates)
+        fresh = [c for c, score in zip(candidates, scores) if score is None]
+        chosen = fresh[0] if fresh else candidates[0]
+
+        pipe = redis.pipeline()
+        pipe.zadd(key, {chosen: now})
+        pipe.zremrangebyrank(key, 0, -SEEN_MAX - 1)
+        pipe.expire(key, SEEN_WINDOW)
+        await pipe.execute()
+        return uuid.UUID(chosen)
+
+    return uuid.UUID(candidates[0])
+
+
+def reconcile_approved_set(db, redis) -> tuple:
+    """
+    Сверка множества с БД (sync-сессия воркера). Возвращает (добавлено, удалено).
+
+    Одобренные id собираются во временный ключ, недостающие добавляются в
+    живое множество. Лишние удаляются только после повторной проверки в БД:
+    мем, одобренный уже после чтения, не должен пропасть из выдачи.
+    """
+    redis.delete(RECONCILE_KEY)
+    result = db.execute(
+        select(Meme.id).where(Meme.status == "approved")
+        .execution_options(yield_per=RECONCILE_CHUNK)
+    )
+    for chunk in result.scalars().partitions():
+        redis.sadd(RECONCILE_KEY, *[str(mid) for mid in chunk])
+    db.rollback()  # закрываем транзакцию чтения
+
+    missing = list(redis.sdiff(RECONCILE_KEY, APPROVED_SET_KEY))
+    for start in range(0, len(missing), RECONCILE_CHUNK):
+        redis.sadd(APPROVED_SET_KEY, *missing[start:start + RECONCILE_CHUNK])
+
+    extra = list(redis.sdiff(APPROVED_SET_KEY, RECONCILE_KEY))
+    removed = 0
+    for start in range(0, len(extra), RECONCILE_CHUNK):
+        chunk = extra[start:start + RECONCILE_CHUNK]
+        ids = []
+        for mid in chunk:
+            try:
+                ids.append(uuid.UUID(mid))
+            except ValueError:
+                continue  # мусор в множестве удалится как stale
+        still_approved = {
+            str(mid) for mid in db.execute(
+                select(Meme.id).where(Meme.id.in_(ids), Meme.status == "approved")
+            ).scalars()
+        } if ids else set()
+        stale = [mid for mid in chunk if mid not in still_approved]
+        if stale:
+            removed += redis.srem(APPROVED_SET_KEY, *stale)
+    redis.delete(RECONCILE_KEY)
+    return len(missing), removed
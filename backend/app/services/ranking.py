@@ -0,0 +1,75 @@
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, extract, literal, select, update, DateTime
+from app.models.models import Meme
+
+# Гравитация "умной" ленты: score = (likes + 1) / (age_hours + 2) ^ GRAVITY
+GRAVITY = 1.5
+
+# Пересчет пишет только строки, чей score сдвинулся больше чем на RECOMPUTE_EPSILON
+# (относительно), и только мемы моложе HORIZON: у старых score почти не меняется
+RECOMPUTE_EPSILON = 0.01
+HORIZON = timedelta(days=int(os.getenv("HOT_SCORE_HORIZON_DAYS", "30")))
+
+# Замороженный снимок ранжирования для keyset-пагинации "smart":
+# ZSET id -> hot_score на поколение; курсор хранит поколение и позицию,
+# поэтому пересчеты и лайки не сдвигают уже открытую ленту.
+SNAPSHOT_KEY = "feed:smart:{gen}"
+CURRENT_SNAPSHOT_KEY = "feed:smart:current"
+SNAPSHOT_TTL = int(os.getenv("SMART_SNAPSHOT_TTL", "1800"))
+SNAPSHOT_CHUNK = 5000
+
+
+def _age_hours(now: datetime = None):
+    now_expr = literal(now, DateTime) if now else func.now()
+    return extract('epoch', now_expr - Meme.created_at) / 3600
+
+
+def hot_score_expr(now: datetime = None):
+    """SQL-выражение полного пересчета hot_score."""
+    return (Meme.likes_count + 1) / func.power(_age_hours(now) + 2, GRAVITY)
+
+
+def like_bump_expr(now: datetime = None):
+    """Прирост hot_score от одного лайка прямо сейчас (между пересчетами beat)."""
+    return 1.0 / func.power(_age_hours(now) + 2, GRAVITY)
+
+
+def recompute_stmt(now: datetime = None):
+    """UPDATE hot_score только там, где значение реально изменилось."""
+    now = now or datetime.utcnow()
+    new_score = hot_score_expr(now)
+    return (
+        update(Meme)
+        .where(
+            Meme.status == "approved",
+            Meme.created_at >= now - HORIZON,
+            func.abs(Meme.hot_score - new_score) > new_score * RECOMPUTE_EPSILON,
+        )
+        # updated_at не трогаем: это не изменение для поискового индекса
+        .values(hot_score=new_score, updated_at=Meme.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def build_snapshot(redis, db) -> str:
+    """Новое поколение снимка из текущих hot_score (sync Session/redis — воркер)."""
+    gen = str(int(time.time()))
+    key = SNAPSHOT_KEY.format(gen=gen)
+    rows = db.execute(
+        select(Meme.id, Meme.hot_score)
+        .where(Meme.status == "approved")
+        .execution_options(yield_per=SNAPSHOT_CHUNK)
+    )
+    built = False
+    for chunk in rows.partitions():
+        pipe = redis.pipeline(transaction=False)
+        pipe.zadd(key, {str(meme_id): float(score or 0.0) for meme_id, score in chunk})
+        # Старые поколения живут SNAPSHOT_TTL — столько действует выданный по ним курсор
+        pipe.expire(key, SNAPSHOT_TTL)
+        pipe.execute()
+        built = True
+    if built:
+        redis.set(CURRENT_SNAPSHOT_KEY, gen)
+    return gen
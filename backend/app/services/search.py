@@ -12,38 +12,28 @@ class SearchService:
         self.index_users = self.client.index('users')
         self.index_tags = self.client.index('tags')
         
-        # --- НАСТРОЙКИ ИНДЕКСОВ ---
-        self._setup_indexes()
-
-    def _setup_indexes(self):
-        # 1. Мемы: ищем по заголовку, описанию, тегам
-        self.index_memes.update_searchable_attributes([
-            'title',
-            'description',
-            'tags',
-            'author_username'
-        ])
-
-        # Фильтры
-        self.index_memes.update_filterable_attributes([
-            'tags',
-            'user_id',
-            'status',
-            'author_username'
-        ])
-        
-        # Сортировка
-        self.index_memes.update_sortable_attributes(['views_count', 'shares_count', 'created_at'])
-
-        # 2. Пользователи
-        self.index_users.update_searchable_attributes(['username', 'full_name'])
-        
-        # 3. Теги
-        self.index_tags.update_searchable_attributes(['name'])
+        # Настройки индексов здесь не трогаем: каждый update_* в Meilisearch может
+        # запустить переиндексацию. Их применяет apply_search_settings_task (services/search_settings)
 
     def add_meme(self, meme_data: dict):
         self.index_memes.add_documents([meme_data])
 
+    def upsert_memes(self, documents: list):
+        """Пачка документов одним запросом (одна задача Meilisearch). TaskInfo или None."""
+        if documents:
+            return self.index_memes.add_documents(documents)
+        return None
+
+    def update_memes_partial(self, documents: list):
+        """Частичное обновление: Meilisearch сливает переданные поля с документом."""
+        if documents:
+            self.index_memes.update_documents(documents)
+
+    def delete_memes(self, meme_ids: list):
+        if meme_ids:
+            return self.index_memes.delete_documents(meme_ids)
+        return None
+
     def add_user(self, user_data: dict):
         self.index_users.add_documents([user_data])
 
@@ -57,65 +47,95 @@ class SearchService:
             print(f"Error deleting document from {index_name}: {e}")
 
     def search_multi(self, query: str, limit: int = 20, offset: int = 0):
-        """Параллельный поиск по всем индексам с поддержкой @username"""
-
-        filter_conditions = ["status = approved"]
-        clean_query = query if query else ""
-
-        # --- 1. ПАРСИНГ @USERNAME ---
-        # Ищем паттерн @word (например @admin)
-        username_match = re.search(r'@([\w\d_]+)', clean_query)
-        
-        if username_match:
-            target_username = username_match.group(1)
-            # Добавляем фильтр по автору
-            filter_conditions.append(f"author_username = '{target_username}'")
-            
-            # Удаляем @username из текстового запроса, чтобы не мешал искать по смыслу
-            clean_query = clean_query.replace(f"@{target_username}", "").strip()
-
-        # --- 2. ПАРАМЕТРЫ ПОИСКА ---
-        search_params = {
-            'limit': limit,
-            'offset': offset,
-            'filter': " AND ".join(filter_conditions),
-            'sort': ['created_at:desc']
-        }
-
-        # Если запрос пустой (например, был только @admin или вообще ""), MeiliSearch требует ''
-        # Если есть фильтр author_username, он вернет все мемы этого автора.
-        q = clean_query if clean_query else ""
-
+        """Последовательный sync-поиск по индексам (API использует AsyncSearchClient)"""
+        results = {"memes": [], "users": [], "tags": []}
         try:
-            # Основной поиск по мемам
-            memes_results = self.index_memes.search(q, search_params)
-            memes_hits = memes_results.get('hits', [])
-            
-            # Если это был поиск только по мемам конкретного юзера,
-            # нет смысла искать юзеров и теги по пустому запросу.
-            if username_match and not clean_query:
-                users_hits = []
-                tags_hits = []
-            else:
-                # Поиск юзеров и тегов только если есть текстовый запрос
-                if q:
-                    users_hits = self.index_users.search(q, {'limit': limit}).get('hits', [])
-                    tags_hits = self.index_tags.search(q, {'limit': limit}).get('hits', [])
-                else:
-                    # Если вообще пустой запрос (меню бота), возвращаем просто свежие мемы
-                    users_hits = []
-                    tags_hits = []
-
-            return {
-                "memes": memes_hits,
-                "users": users_hits,
-                "tags": tags_hits
-            }
-
+            for query_params in build_search_queries(query, limit, offset):
+                index_uid = query_params.pop("indexUid")
+                q = query_params.pop("q")
+                results[index_uid] = self.client.index(index_uid).search(q, query_params).get('hits', [])
+            return results
         except Exception as e:
             print(f"Search error: {e}")
             return {"memes": [], "users": [], "tags": []}
 
+
+def build_search_queries(query: str, limit: int = 20, offset: int = 0) -> list:
+    """
+    Запросы к индексам в формате multi-search (indexUid + параметры) с поддержкой @username.
+    Пользователей и теги ищем только при непустом текстовом запросе.
+    """
+    filter_conditions = ["status = approved"]
+    clean_query = query if query else ""
+
+    # --- 1. ПАРСИНГ @USERNAME ---
+    # Ищем паттерн @word (например @admin)
+    username_match = re.search(r'@([\w\d_]+)', clean_query)
+
+    if username_match:
+        target_username = username_match.group(1)
+        # Добавляем фильтр по автору
+        filter_conditions.append(f"author_username = '{target_username}'")
+
+        # Удаляем @username из текстового запроса, чтобы не мешал искать по смыслу
+        clean_query = clean_query.replace(f"@{target_username}", "").strip()
+
+    # --- 2. ПАРАМЕТРЫ ПОИСКА ---
+    # Если запрос пустой (например, был только @admin или вообще ""), MeiliSearch требует ''
+    # Если есть фильтр author_username, он вернет все мемы этого автора.
+    q = clean_query if clean_query else ""
+
+    queries = [{
+        'indexUid': 'memes',
+        'q': q,
+        'limit': limit,
+        'offset': offset,
+        'filter': " AND ".join(filter_conditions),
+        'sort': ['created_at:desc']
+    }]
+
+    # Пустой запрос (меню бота или только @username) — возвращаем просто свежие мемы
+    if q:
+        queries.append({'indexUid': 'users', 'q': q, 'limit': limit})
+        queries.append({'indexUid': 'tags', 'q': q, 'limit': limit})
+    return queries
+
+
+def meme_document(meme) -> dict:
+    """Документ мема для индекса. Теги и автор должны быть уже загружены."""
+    return {
+        "id": str(meme.id),
+        "title": meme.title,
+        "description": meme.description,
+        "thumbnail_url": meme.thumbnail_url,
+        "preview_url": meme.preview_url,
+        "media_url": meme.media_url,
+        "views_count": meme.views_count or 0,
+        "likes_count": meme.likes_count or 0,
+        "shares_count": meme.shares_count or 0,
+        "width": meme.width,
+        "height": meme.height,
+        "duration": meme.duration,
+        "status": meme.status,
+        "tags": [t.name for t in meme.tags],
+        "author_username": meme.user.username if meme.user else "unknown",
+        "user_id": str(meme.user_id) if meme.user_id else None,
+        # ISO-строка: сортируется лексикографически в хронологическом порядке
+        "created_at": meme.created_at.isoformat() if meme.created_at else None,
+    }
+
+def user_document(user) -> dict:
+    return {
+        "id": str(user.id),
+        "username": user.username,
+        "full_name": user.full_name,
+        "avatar_url": user.avatar_url,
+    }
+
+
+def tag_document(tag) -> dict:
+    return {"id": tag.id, "name": tag.name}
+
 # Глобальный инстанс
 _search_service = None
 
@@ -0,0 +1,198 @@
+"""
+Кэш результатов поиска перед AsyncSearchClient.search_multi.
+
+Ключ — sha1 от нормализованных запросов multi-search (q, limit, offset, фильтр
+по @username). TTL зависит от популярности: термы из HOT_TERMS_KEY (топ
+SearchTerm + stats:search_terms, обновляет refresh_hot_search_terms_task)
+живут HOT_TTL и обновляются заранее, когда до истечения остается меньше
+REFRESH_AHEAD доли TTL. Остальные живут TTL.
+
+Инвалидация по тегам (SET ключей кэша на тег):
+- meme:{id}   — записи, в выдаче которых есть мем (изменен/удален);
+- term:{слово} — записи с этим словом в запросе (новый/измененный мем со словом);
+- recent      — пустой запрос (лента свежих мемов в боте).
+Теги сбрасывает дренер search_outbox. Изменения одних счетчиков (search_counters)
+кэш не сбрасывают — они отстают не больше чем на TTL.
+
+Статистика: STATS_KEY (hits/misses) и выборки задержек hit/miss в LATENCY_KEY —
+отчет: python -m app.scripts.search_cache_report
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+
+from app.services.search import build_search_queries
+
+TTL = int(os.getenv("SEARCH_CACHE_TTL", "30"))
+HOT_TTL = int(os.getenv("SEARCH_CACHE_HOT_TTL", "300"))
+REFRESH_AHEAD = 0.2
+HOT_TERMS_LIMIT = int(os.getenv("SEARCH_CACHE_HOT_TERMS", "300"))
+
+ENTRY_KEY = "search:cache:{key}"
+TAG_KEY = "search:cache:tag:{tag}"
+REFRESH_LOCK_KEY = "search:cache:refresh:{key}"
+HOT_TERMS_KEY = "search:cache:hot_terms"
+
+STATS_KEY = "stats:search_cache"
+LATENCY_KEY = "stats:search_cache:latency:{kind}"   # kind = hit | miss
+LATENCY_SAMPLES = 2000
+
+# Слова из документа, по которым сбрасываются term-теги (на мем)
+MAX_DOC_TERMS = 64
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_query(q: str) -> str:
+    return " ".join((q or "").split())
+
+
+def cache_key(queries: list) -> str:
+    # Meilisearch не различает регистр в q; фильтр по автору оставляем как есть
+    normalized = [{**query, "q": query["q"].lower()} for query in queries]
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def query_terms(q: str) -> set:
+    return {w.lower() for w in WORD_RE.findall(q or "")}
+
+
+def document_terms(doc: dict) -> set:
+    text = " ".join(filter(None, [
+        doc.get("title"), doc.get("description"), doc.get("author_username"),
+        " ".join(doc.get("tags") or []),
+    ]))
+    terms = []
+    for word in WORD_RE.findall(text.lower()):
+        if word not in terms:
+            terms.append(word)
+        if len(terms) >= MAX_DOC_TERMS:
+            break
+    return set(terms)
+
+
+def _tags_for(memes_query: dict, result: dict) -> list:
+    tags = [f"meme:{hit['id']}" for hit in result.get("memes", []) if hit.get("id")]
+    terms = query_terms(memes_query["q"])
+    tags.extend(f"term:{term}" for term in terms)
+    if not terms:
+        tags.append("recent")
+    return tags
+
+
+async def _store(redis, key: str, result: dict, tags: list, ttl: int):
+    pipe = redis.pipeline(transaction=False)
+    pipe.set(ENTRY_KEY.format(key=key), json.dumps(result), ex=ttl)
+    for tag in tags:
+        tag_key = TAG_KEY.format(tag=tag)
+        pipe.sadd(tag_key, key)
+        pipe.expire(tag_key, HOT_TTL)
+    await pipe.execute()
+
+
+async def _record(redis, kind: str, started: float):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby(STATS_KEY, "hits" if kind == "hit" else "misses", 1)
+        pipe.lpush(LATENCY_KEY.format(kind=kind), round(elapsed_ms, 3))
+        pipe.ltrim(LATENCY_KEY.format(kind=kind), 0, LATENCY_SAMPLES - 1)
+        await pipe.execute()
+    except Exception as e:
+        print(f"Search cache stats error: {e}")
+
+
+async def _refresh(redis, key: str, queries: list, fetch, ttl: int):
+    """Фоновое обновление горячей записи до истечения TTL (одно на ключ)."""
+    try:
+        if not await redis.set(REFRESH_LOCK_KEY.format(key=key), 1, nx=True, ex=max(1, ttl // 5)):
+            return
+        result = await fetch()
+        if result.get("memes") or result.get("users") or result.get("tags"):
+            await _store(redis, key, result, _tags_for(queries[0], result), ttl)
+    except Exception as e:
+        print(f"Search cache refresh error: {e}")
+
+
+async def cached_search(redis, search_client, q: str, limit: int = 20, offset: int = 0) -> dict:
+    """search_multi через кэш. Ошибки Redis не ломают поиск — идем в Meilisearch напрямую."""
+    started = time.perf_counter()
+    q = normalize_query(q)
+    queries = build_search_queries(q, limit, offset)
+    key = cache_key(queries)
+
+    async def fetch():
+        return await search_client.search_multi(q, limit, offset)
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.get(ENTRY_KEY.format(key=key))
+        pipe.ttl(ENTRY_KEY.format(key=key))
+        pipe.sismember(HOT_TERMS_KEY, q.lower())
+        cached, remaining, is_hot = await pipe.execute()
+    except Exception as e:
+        print(f"Search cache error: {e}")
+        return await fetch()
+
+    ttl = HOT_TTL if is_hot else TTL
+    if cached:
+        if is_hot and 0 < remaining < ttl * REFRESH_AHEAD:
+            asyncio.create_task(_refresh(redis, key, queries, fetch, ttl))
+        await _record(redis, "hit", started)
+        return json.loads(cached)
+
+    result = await fetch()
+    # Пустой ответ может означать открытый circuit breaker — не кэшируем
+    if result.get("memes") or result.get("users") or result.get("tags"):
+        try:
+            await _store(redis, key, result, _tags_for(queries[0], result), ttl)
+        except Exception as e:
+            print(f"Search cache store error: {e}")
+    await _record(redis, "miss", started)
+    return result
+
+
+def invalidate(redis, meme_ids=(), documents=()):
+    """
+    Сбрасывает записи по тегам (sync redis — дренер search_outbox).
+    meme_ids — измененные/удаленные мемы, documents — их новые документы.
+    """
+    tags = {f"meme:{mid}" for mid in meme_ids}
+    for doc in documents:
+        tags.update(f"term:{term}" for term in document_terms(doc))
+    if documents:
+        tags.add("recent")
+    if not tags:
+        return 0
+    tag_keys = [TAG_KEY.format(tag=tag) for tag in tags]
+    pipe = redis.pipeline(transaction=False)
+    for tag_key in tag_keys:
+        pipe.smembers(tag_key)
+    keys = set()
+    for members in pipe.execute():
+        keys.update(members)
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.delete(ENTRY_KEY.format(key=key))
+    pipe.delete(*tag_keys)
+    pipe.execute()
+    return len(keys)
+
+
+def refresh_hot_terms(redis, db_terms: list):
+    """Пересобирает множество горячих термов: топ из БД + текущий счетчик Redis."""
+    recent = redis.zrevrange("stats:search_terms", 0, HOT_TERMS_LIMIT - 1)
+    terms = {normalize_query(t).lower() for t in list(db_terms) + list(recent) if t}
+    tmp_key = f"{HOT_TERMS_KEY}:tmp"
+    pipe = redis.pipeline()
+    pipe.delete(tmp_key)
+    if terms:
+        pipe.sadd(tmp_key, *terms)
+        pipe.rename(tmp_key, HOT_TERMS_KEY)
+    else:
+        pipe.delete(HOT_TERMS_KEY)
+    pipe.execute()
+    return len(terms)
@@ -0,0 +1,134 @@
+"""
+Асинхронный клиент Meilisearch для API поиска.
+
+meilisearch.Client синхронный: его вызовы из async-эндпоинта блокируют event loop
+на время HTTP-запроса. Здесь — один httpx.AsyncClient на процесс (keep-alive пул),
+все индексы запрашиваются одним POST /multi-search, у каждого вызова свой таймаут.
+
+CircuitBreaker: после BREAKER_FAILURES ошибок подряд запросы не отправляются
+BREAKER_RESET_SECONDS секунд (сразу пустой результат), затем один пробный запрос
+решает, закрыть ли его снова.
+"""
+import os
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.search import build_search_queries
+
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "1.5"))
+SEARCH_CONNECT_TIMEOUT = float(os.getenv("SEARCH_CONNECT_TIMEOUT_SECONDS", "0.5"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "50"))
+SEARCH_MAX_KEEPALIVE = int(os.getenv("SEARCH_MAX_KEEPALIVE", "20"))
+
+BREAKER_FAILURES = int(os.getenv("SEARCH_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("SEARCH_BREAKER_RESET_SECONDS", "30"))
+
+EMPTY_RESULT = {"memes": [], "users": [], "tags": []}
+
+
+class CircuitBreaker:
+    def __init__(self, max_failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # half-open: пропускаем только один пробный запрос
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """Пробный запрос завершился без вердикта (отмена, неожиданная ошибка) — следующий может пробовать снова."""
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.opened_at is None:
+                print(f"⚠️ Search circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+class AsyncSearchClient:
+    def __init__(self, host: str = settings.MEILI_HOST, api_key: str = settings.MEILI_MASTER_KEY):
+        self.host = host.rstrip("/")
+        self.api_key = api_key
+        self.breaker = CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Создаем лениво — внутри работающего event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.host,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=SEARCH_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=SEARCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=SEARCH_MAX_KEEPALIVE,
+                ),
+            )
+        return self._client
+
+    async def multi_search(self, queries: list, timeout: Optional[float] = None) -> Optional[list]:
+        """Результаты по каждому запросу или None (ошибка, таймаут, открытый breaker)."""
+        if not self.breaker.allow():
+            return None
+        try:
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            resp = await self._http().post("/multi-search", json={"queries": queries}, **kwargs)
+            resp.raise_for_status()
+            results = resp.json().get("results", [])
+        except (httpx.HTTPError, ValueError) as e:
+            self.breaker.failure()
+            print(f"Search error: {e!r}")
+            return None
+        finally:
+            # CancelledError (клиент ушел) и прочие исключения не вызывают success/failure
+            self.breaker.release_probe()
+        self.breaker.success()
+        return results
+
+    async def search_multi(self, query: str, limit: int = 20, offset: int = 0,
+                           timeout: Optional[float] = None) -> dict:
+        """Мемы/пользователи/теги одним multi-search; при недоступности — пустой ответ."""
+        results = await self.multi_search(build_search_queries(query, limit, offset), timeout)
+        if results is None:
+            return {key: [] for key in EMPTY_RESULT}
+        found = {key: [] for key in EMPTY_RESULT}
+        for result in results:
+            found[result.get("indexUid")] = result.get("hits", [])
+        return found
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Один клиент (и пул соединений) на процесс uvicorn
+search_client = AsyncSearchClient()
@@ -0,0 +1,71 @@
+"""
+Частичное обновление счетчиков в индексе memes.
+
+Лайки, шеры и sync_views_task не переиндексируют мем целиком — только помечают
+его id в DIRTY_KEY. sync_search_counters_task (celery beat, период
+SEARCH_COUNTERS_SYNC_SECONDS) забирает пачки по BATCH_SIZE id, читает
+текущие счетчики из БД и отправляет
+{id, views_count, shares_count, likes_count} через update_documents —
+остальные поля документа Meilisearch не трогает.
+"""
+import os
+
+from sqlalchemy import select
+
+from app.models.models import Meme
+
+DIRTY_KEY = "search:counters:dirty"
+
+BATCH_SIZE = int(os.getenv("SEARCH_COUNTERS_BATCH_SIZE", "1000"))
+
+
+async def mark_async(redis, *meme_ids):
+    """Помечает мемы для обновления счетчиков (API, redis.asyncio)."""
+    if not meme_ids:
+        return
+    try:
+        await redis.sadd(DIRTY_KEY, *[str(mid) for mid in meme_ids])
+    except Exception as e:
+        print(f"Search counters mark error: {e}")
+
+
+def mark(redis, *meme_ids):
+    """То же для воркера (sync redis)."""
+    if not meme_ids:
+        return
+    try:
+        redis.sadd(DIRTY_KEY, *[str(mid) for mid in meme_ids])
+    except Exception as e:
+        print(f"Search counters mark error: {e}")
+
+
+def counter_documents(db, meme_ids) -> list:
+    """Частичные документы со счетчиками. Только approved: остальных в поиске нет,
+    а update_documents для отсутствующего id создал бы неполный документ."""
+    rows = db.execute(
+        select(Meme.id, Meme.views_count, Meme.shares_count, Meme.likes_count)
+        .where(Meme.id.in_(meme_ids), Meme.status == "approved")
+    ).all()
+    return [
+        {
+            "id": str(row.id),
+            "views_count": row.views_count or 0,
+            "shares_count": row.shares_count or 0,
+            "likes_count": row.likes_count or 0,
+        }
+        for row in rows
+    ]
+
+
+def sync_batch(redis, db, search, batch_size: int = BATCH_SIZE) -> int:
+    """Отправляет одну пачку. Возвращает число взятых id (0 — помеченных нет)."""
+    meme_ids = redis.spop(DIRTY_KEY, batch_size)
+    if not meme_ids:
+        return 0
+    try:
+        search.update_memes_partial(counter_documents(db, meme_ids))
+    except Exception:
+        # Вернем пометки, чтобы следующий запуск повторил пачку
+        redis.sadd(DIRTY_KEY, *meme_ids)
+        raise
+    return len(meme_ids)
@@ -0,0 +1,106 @@
+"""
+Transactional outbox для поискового индекса.
+
+Эндпоинты и воркер не шлют документы в Meilisearch сами: enqueue() добавляет
+строку в search_outbox в той же транзакции, что и изменение мема, а kick()
+планирует drain_search_outbox_task. Повторные kick в течение FLUSH_MS
+схлопываются в один запуск, поэтому всплеск шеров превращается в одну пачку.
+
+Дренер работает под общим локом писателей (search_writer) и берет до BATCH_SIZE строк (FOR UPDATE SKIP LOCKED), оставляет по одной
+на мем и отправляет одним add_documents + одним delete_documents. Документ
+всегда строится из текущего состояния БД, так что op — только подсказка:
+удаленный мем уходит в delete независимо от порядка событий.
+
+Задачи Meilisearch асинхронные: кэш поиска сбрасывается только после того,
+как последняя задача пачки выполнена (задачи индекса идут по порядку), иначе
+запрос между enqueue и применением снова закэширует старую выдачу.
+"""
+import os
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import selectinload
+
+from app.models.models import Meme, SearchOutbox
+from app.services.search import meme_document
+from app.services import search_cache
+
+BATCH_SIZE = int(os.getenv("SEARCH_OUTBOX_BATCH_SIZE", "500"))
+FLUSH_MS = int(os.getenv("SEARCH_OUTBOX_FLUSH_MS", "500"))
+
+DRAIN_TASK = "app.worker.drain_search_outbox_task"
+KICK_KEY = "search:outbox:kick"
+# Ожидание задачи Meilisearch пачки (меньше search_writer.LOCK_TIMEOUT)
+TASK_TIMEOUT_MS = int(os.getenv("SEARCH_OUTBOX_TASK_TIMEOUT_MS", "60000"))
+
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+
+
+def enqueue(db, meme_id, op: str = OP_UPSERT):
+    """Добавляет событие в текущую транзакцию (sync и async Session)."""
+    db.add(SearchOutbox(entity="meme", entity_id=str(meme_id), op=op))
+
+
+def kick(redis, celery_app):
+    """Планирует дренер не чаще раза в FLUSH_MS (sync redis — воркер)."""
+    try:
+        if redis.set(KICK_KEY, 1, nx=True, px=FLUSH_MS):
+            celery_app.send_task(DRAIN_TASK, countdown=FLUSH_MS / 1000)
+    except Exception as e:
+        print(f"Search outbox kick error: {e}")
+
+
+async def kick_async(redis, celery_app):
+    """То же для API (redis.asyncio)."""
+    try:
+        if await redis.set(KICK_KEY, 1, nx=True, px=FLUSH_MS):
+            celery_app.send_task(DRAIN_TASK, countdown=FLUSH_MS / 1000)
+    except Exception as e:
+        print(f"Search outbox kick error: {e}")
+
+
+def drain_batch(db, search, redis=None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Отправляет одну пачку событий в индекс и удаляет их из outbox.
+    Возвращает число обработанных строк (0 — outbox пуст). Sync Session.
+    С redis сбрасывает затронутые записи кэша поиска.
+    """
+    rows = db.execute(
+        select(SearchOutbox.id, SearchOutbox.entity_id)
+        .where(SearchOutbox.entity == "meme")
+        .order_by(SearchOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    meme_ids = list(dict.fromkeys(row.entity_id for row in rows))
+    memes = db.execute(
+        select(Meme)
+        .options(selectinload(Meme.tags), selectinload(Meme.user))
+        .where(Meme.id.in_(meme_ids))
+    ).scalars().all()
+
+    documents = [meme_document(m) for m in memes]
+    found = {doc["id"] for doc in documents}
+    deleted = [mid for mid in meme_ids if mid not in found]
+
+    # Ошибка Meilisearch (и упавшая задача) пробрасывается до удаления строк — пачка повторится
+    for info in (search.upsert_memes(documents), search.delete_memes(deleted)):
+        if info is None:
+            continue
+        task = search.client.wait_for_task(info.task_uid, timeout_in_ms=TASK_TIMEOUT_MS)
+        if getattr(task, "status", None) == "failed":
+            raise RuntimeError(f"Meilisearch task {info.task_uid} failed: {task.error}")
+
+    db.execute(delete(SearchOutbox).where(SearchOutbox.id.in_([row.id for row in rows])))
+    db.commit()
+    if redis is not None:
+        try:
+            search_cache.invalidate(redis, meme_ids, documents)
+        except Exception as e:
+            print(f"Search cache invalidate error: {e}")
+    print(f"🔍 Search outbox: {len(rows)} events -> {len(documents)} upserts, {len(deleted)} deletes")
+    return len(rows)
@@ -0,0 +1,152 @@
+"""
+Версионированные настройки индексов Meilisearch.
+
+Раньше SearchService при каждом создании слал пять update_*_attributes — каждый
+мог запустить полную переиндексацию, а get_search_service пересоздает сервис
+после любой ошибки подключения. Теперь настройки применяет только
+apply_search_settings_task (отправляется при старте API, не блокирует его):
+
+1. Версия — хэш INDEX_SETTINGS. Совпала с примененной (APPLIED_KEY, живет
+   APPLIED_TTL) — выходим без запросов к Meilisearch.
+2. Для каждого индекса сравниваем живые настройки с желаемыми и берем только diff.
+3. Пустой индекс обновляем на месте. Индекс с документами — через теневой
+   {uid}__next: настройки, копия документов, swap_indexes, удаление старого.
+   Поиск все это время отвечает по старому индексу.
+
+На время копирования держится общий лок писателей (search_writer): изменения
+копятся в outbox и dirty-множестве счетчиков и после swap попадают уже в новый
+индекс. Перед копированием дожидаемся задач, поставленных в живой индекс до лока.
+"""
+import json
+import hashlib
+from urllib.parse import urlencode
+
+from meilisearch.errors import MeilisearchApiError
+
+INDEX_SETTINGS = {
+    # Мемы: ищем по заголовку, описанию, тегам; фильтры и сортировка для ленты/бота
+    "memes": {
+        "searchableAttributes": ["title", "description", "tags", "author_username"],
+        "filterableAttributes": ["tags", "user_id", "status", "author_username"],
+        "sortableAttributes": ["views_count", "shares_count", "created_at"],
+    },
+    "users": {
+        "searchableAttributes": ["username", "full_name"],
+    },
+    "tags": {
+        "searchableAttributes": ["name"],
+    },
+}
+
+# Порядок важен только для searchableAttributes (это ранжирование)
+UNORDERED_SETTINGS = {"filterableAttributes", "sortableAttributes"}
+
+APPLIED_KEY = "search:settings:applied"
+# Периодически перепроверяем живые настройки (например, после пересоздания тома Meilisearch)
+APPLIED_TTL = 6 * 3600
+LOCK_KEY = "search:settings:lock"
+LOCK_TIMEOUT = 600
+
+SHADOW_SUFFIX = "__next"
+COPY_BATCH = 1000
+TASK_TIMEOUT_MS = 10 * 60 * 1000
+
+
+def settings_version() -> str:
+    payload = json.dumps(INDEX_SETTINGS, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def diff_settings(live: dict, desired: dict) -> dict:
+    """Только отличающиеся настройки из desired."""
+    changed = {}
+    for name, value in desired.items():
+        current = live.get(name)
+        if name in UNORDERED_SETTINGS:
+            if set(current or []) != set(value):
+                changed[name] = value
+        elif current != value:
+            changed[name] = value
+    return changed
+
+
+def document_count(client, uid: str):
+    """Число документов или None, если индекса нет."""
+    try:
+        return client.index(uid).get_stats().number_of_documents
+    except MeilisearchApiError as e:
+        if getattr(e, "code", None) == "index_not_found":
+            return None
+        raise
+
+
+def wait_task(client, task_info):
+    task = client.wait_for_task(task_info.task_uid, timeout_in_ms=TASK_TIMEOUT_MS)
+    if getattr(task, "status", None) == "failed":
+        raise RuntimeError(f"Meilisearch task {task_info.task_uid} failed: {task.error}")
+
+
+def wait_pending(client, uid: str):
+    """Дожидается последней незавершенной задачи индекса (поставленной до взятия лока)."""
+    page = client.http.get(
+        f"tasks?{urlencode({'indexUids': uid, 'statuses': 'enqueued,processing', 'limit': 1})}"
+    )
+    pending = page.get("results", [])
+    if pending:
+        # Задачи индекса выполняются по порядку; в ответе — самая новая
+        task = client.wait_for_task(pending[0]["uid"], timeout_in_ms=TASK_TIMEOUT_MS)
+        print(f"⏳ Waited for pending task {pending[0]['uid']} on '{uid}' ({getattr(task, 'status', '?')})")
+
+
+def _copy_documents(client, source: str, target: str, on_batch=None) -> int:
+    copied = 0
+    target_index = client.index(target)
+    while True:
+        # Сырые словари документов (модель Document клиента добавляет служебные поля)
+        page = client.http.get(
+            f"indexes/{source}/documents?{urlencode({'limit': COPY_BATCH, 'offset': copied})}"
+        )
+        documents = page.get("results", [])
+        if not documents:
+            return copied
+        wait_task(client, target_index.add_documents(documents, primary_key="id"))
+        copied += len(documents)
+        if on_batch:
+            on_batch(copied)
+
+
+def _swap_in(client, uid: str, settings: dict, on_batch=None):
+    """Теневой индекс с новыми настройками и копией документов, затем атомарный swap."""
+    shadow = f"{uid}{SHADOW_SUFFIX}"
+    if document_count(client, shadow) is not None:
+        wait_task(client, client.delete_index(shadow))
+    wait_task(client, client.create_index(shadow, {"primaryKey": "id"}))
+    wait_task(client, client.index(shadow).update_settings(settings))
+    wait_pending(client, uid)
+    copied = _copy_documents(client, uid, shadow, on_batch)
+    wait_task(client, client.swap_indexes([{"indexes": [uid, shadow]}]))
+    # После swap под именем shadow лежит старый индекс
+    wait_task(client, client.delete_index(shadow))
+    print(f"🔁 Index '{uid}' swapped with new settings ({copied} docs)")
+
+
+def apply_index_settings(client, on_batch=None) -> dict:
+    """
+    Приводит настройки всех индексов к INDEX_SETTINGS.
+    Возвращает {uid: список измененных настроек}; пустой dict — все уже актуально.
+    """
+    applied = {}
+    for uid, desired in INDEX_SETTINGS.items():
+        count = document_count(client, uid)
+        live = client.index(uid).get_settings() if count is not None else {}
+        changed = diff_settings(live, desired)
+        if not changed:
+            continue
+        if count:
+            # Полный набор настроек: теневой индекс создается с дефолтными
+            _swap_in(client, uid, {**live, **desired}, on_batch)
+        else:
+            wait_task(client, client.index(uid).update_settings(changed))
+            print(f"⚙️ Index '{uid}' settings updated in place: {sorted(changed)}")
+        applied[uid] = sorted(changed)
+    return applied
@@ -0,0 +1,190 @@
+"""
+Инкрементальная синхронизация Postgres -> Meilisearch (общая для sync_meili.py
+и старта API через sync_search_index_task).
+
+- Инкрементально: строки с updated_at не раньше водяного знака (минус
+  OVERLAP — транзакции, закоммиченные позже своего updated_at) читаются
+  серверным курсором (yield_per) пачками по BATCH_SIZE и уходят upsert'ом.
+  Водяной знак сохраняется после каждой пачки, прерванный запуск продолжится
+  с нее. Теги неизменяемы — для них водяной знак по id.
+- Полная пересборка (нет водяного знака, пустой живой индекс или full=True):
+  в теневой {uid}__next с настройками INDEX_SETTINGS, затем swap_indexes —
+  поиск все время отвечает по старому индексу. Прогресс (последний id)
+  хранится в REBUILD_KEY, пересборка продолжается после рестарта.
+
+Каждый индекс (оба прохода) синхронизируется под общим локом писателей
+(search_writer): дренер outbox и счетчики в это время пропускают запуски,
+их изменения применяются после swap уже к новому индексу.
+
+Удаления в инкрементальном режиме не ищутся — их доставляет search_outbox.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.models.models import Meme, User, Tag
+from app.services.search import meme_document, user_document, tag_document
+from app.services import search_writer
+from app.services.search_settings import (
+    INDEX_SETTINGS, SHADOW_SUFFIX, settings_version, document_count, wait_task,
+)
+
+BATCH_SIZE = int(os.getenv("SEARCH_SYNC_BATCH_SIZE", "1000"))
+OVERLAP = timedelta(seconds=int(os.getenv("SEARCH_SYNC_OVERLAP_SECONDS", "60")))
+
+WATERMARK_KEY = "search:sync:watermark:{uid}"
+REBUILD_KEY = "search:sync:rebuild:{uid}"
+LOCK_KEY = "search:sync:lock"
+LOCK_TIMEOUT = 600
+
+
+class _Source:
+    def __init__(self, model, serialize, options=(), full_filter=None, updated_col=None):
+        self.model = model
+        self.serialize = serialize
+        self.options = options
+        self.full_filter = full_filter
+        self.updated_col = updated_col
+
+
+SOURCES = {
+    "memes": _Source(
+        Meme, meme_document,
+        options=(selectinload(Meme.tags), selectinload(Meme.user)),
+        # Полная пересборка — только опубликованные; инкрементально идут все
+        # изменения, чтобы снятый с публикации мем получил новый status
+        full_filter=Meme.status == "approved",
+        updated_col=Meme.updated_at,
+    ),
+    "users": _Source(User, user_document, updated_col=User.updated_at),
+    "tags": _Source(Tag, tag_document),
+}
+
+
+def _stream(db, query):
+    """Пачки ORM-объектов через серверный курсор."""
+    result = db.execute(query.execution_options(yield_per=BATCH_SIZE))
+    yield from result.scalars().partitions()
+
+
+def _incremental(db, redis, client, uid: str, source: _Source, on_batch=None) -> int:
+    key = WATERMARK_KEY.format(uid=uid)
+    mark = redis.get(key)
+    index = client.index(uid)
+    query = select(source.model).options(*source.options)
+    if source.updated_col is not None:
+        since = datetime.fromisoformat(mark) - OVERLAP
+        query = query.where(source.updated_col >= since).order_by(source.updated_col, source.model.id)
+    else:
+        query = query.where(source.model.id > int(mark)).order_by(source.model.id)
+
+    synced = 0
+    for batch in _stream(db, query):
+        index.add_documents([source.serialize(obj) for obj in batch], primary_key="id")
+        last = batch[-1]
+        if source.updated_col is not None:
+            new_mark = last.updated_at.isoformat() if last.updated_at else mark
+        else:
+            new_mark = str(last.id)
+        redis.set(key, new_mark)
+        synced += len(batch)
+        if on_batch:
+            on_batch(synced)
+    return synced
+
+
+def _rebuild(db, redis, client, uid: str, source: _Source, on_batch=None) -> int:
+    """Пересборка в теневой индекс с продолжением после прерывания."""
+    shadow = f"{uid}{SHADOW_SUFFIX}"
+    progress_key = REBUILD_KEY.format(uid=uid)
+    version = settings_version()
+    progress = json.loads(redis.get(progress_key) or "null")
+
+    if not (progress and progress.get("version") == version
+            and document_count(client, shadow) is not None):
+        if document_count(client, shadow) is not None:
+            wait_task(client, client.delete_index(shadow))
+        wait_task(client, client.create_index(shadow, {"primaryKey": "id"}))
+        wait_task(client, client.index(shadow).update_settings(INDEX_SETTINGS[uid]))
+        progress = {"version": version, "last_id": None, "started_at": datetime.utcnow().isoformat()}
+        redis.set(progress_key, json.dumps(progress))
+    else:
+        print(f"⏯️ Resuming '{uid}' rebuild after {progress['last_id']}")
+
+    index = client.index(shadow)
+    query = select(source.model).options(*source.options).order_by(source.model.id)
+    if source.full_filter is not None:
+        query = query.where(source.full_filter)
+    if progress["last_id"] is not None:
+        # В JSON id хранится строкой: UUID у мемов/юзеров, int у тегов
+        last_id = source.model.id.type.python_type(progress["last_id"])
+        query = query.where(source.model.id > last_id)
+
+    task, added = None, 0
+    for batch in _stream(db, query):
+        task = index.add_documents([source.serialize(obj) for obj in batch], primary_key="id")
+        progress["last_id"] = str(batch[-1].id)
+        redis.set(progress_key, json.dumps(progress))
+        added += len(batch)
+        if on_batch:
+            on_batch(added)
+    if task is not None:
+        # Задачи индекса выполняются по порядку — достаточно дождаться последней
+        wait_task(client, task)
+
+    wait_task(client, client.swap_indexes([{"indexes": [uid, shadow]}]))
+    wait_task(client, client.delete_index(shadow))
+
+    # Изменения, сделанные во время пересборки, догонит инкрементальный проход
+    if source.updated_col is not None:
+        redis.set(WATERMARK_KEY.format(uid=uid), progress["started_at"])
+    else:
+        redis.set(WATERMARK_KEY.format(uid=uid), progress["last_id"] or "0")
+    redis.delete(progress_key)
+    print(f"🔁 Index '{uid}' rebuilt: {added} docs in this run")
+    return added
+
+
+def _needs_rebuild(db, redis, client, uid: str, source: _Source) -> bool:
+    if redis.exists(REBUILD_KEY.format(uid=uid)):
+        return True
+    if not redis.get(WATERMARK_KEY.format(uid=uid)):
+        return True
+    # Индекс потерян (новый том Meilisearch), а в БД есть данные
+    if not document_count(client, uid):
+        query = select(source.model.id).limit(1)
+        if source.full_filter is not None:
+            query = query.where(source.full_filter)
+        return db.execute(query).first() is not None
+    return False
+
+
+def sync_all(db, redis, client, full: bool = False, on_batch=None) -> dict:
+    """
+    Синхронизирует все индексы. Вызывающий держит LOCK_KEY.
+    Возвращает {uid: ("incremental"|"rebuild", число документов)}.
+    """
+    report = {}
+    for uid, source in SOURCES.items():
+        writer = search_writer.writer_lock(redis)
+        search_writer.acquire_or_raise(writer)
+
+        def keep_lock(done):
+            writer.extend(search_writer.LOCK_TIMEOUT, replace_ttl=True)
+            if on_batch:
+                on_batch(done)
+
+        try:
+            if full or _needs_rebuild(db, redis, client, uid, source):
+                count = _rebuild(db, redis, client, uid, source, keep_lock)
+                count += _incremental(db, redis, client, uid, source, keep_lock)
+                report[uid] = ("rebuild", count)
+            else:
+                report[uid] = ("incremental", _incremental(db, redis, client, uid, source, keep_lock))
+        finally:
+            search_writer.release(writer)
+        db.rollback()  # закрываем транзакцию чтения между индексами
+    return report
@@ -0,0 +1,32 @@
+"""
+Общий лок всех, кто пишет в индексы Meilisearch.
+
+Пересборка (search_sync) и смена настроек (search_settings) копируют индекс в
+теневой и переключают swap'ом: запись в живой индекс в это время потерялась бы
+со старой копией. Поэтому каждый писатель — дренер search_outbox,
+sync_search_counters_task, sync_search_index_task, устаревшие
+index_meme_task/delete_index_task — ставит задачи Meilisearch только под этим
+локом. Короткие периодические писатели при занятом локе пропускают запуск
+(их данные ждут в outbox / множестве dirty), долгие ждут и продлевают его.
+"""
+LOCK_KEY = "search:index:writer"
+LOCK_TIMEOUT = 120
+# Сколько долгий писатель ждет, пока короткие отпустят лок
+WAIT_SECONDS = 60
+
+
+def writer_lock(redis, timeout: int = LOCK_TIMEOUT):
+    """redis-py Lock (sync-клиент воркера)."""
+    return redis.lock(LOCK_KEY, timeout=timeout)
+
+
+def acquire_or_raise(lock, wait: float = WAIT_SECONDS):
+    if not lock.acquire(blocking=True, blocking_timeout=wait):
+        raise RuntimeError("Search index writer lock is busy")
+
+
+def release(lock):
+    try:
+        lock.release()
+    except Exception:
+        pass  # истек по таймауту — уже свободен
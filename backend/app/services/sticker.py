@@ -1,31 +1,36 @@
-from moviepy.editor import ImageClip, CompositeVideoClip, VideoClip
 import numpy as np
 import cv2
-import math
+import ffmpeg
 from PIL import Image, ImageDraw, ImageFont
 import os
 
+# Кадров в секунду для анимированных стикеров и длительность без ANIM_DEFS
+STICKER_FPS = 15
+STATIC_ANIM_DURATION = 2.5
+# Запас вокруг контента при авто-кропе (px)
+CROP_MARGIN = 4
+# Быстрое превью: маленький animated WebP с пониженным fps
+PREVIEW_MAX_DIM = 192
+PREVIEW_FPS = 8
+
 
 # ==============================
 # CSS cubic-bezier solver
 # ==============================
 
 def _cubic_bezier_y(t, p1x, p1y, p2x, p2y):
-    """Solve CSS cubic-bezier(p1x, p1y, p2x, p2y) for progress t.
+    """Solve CSS cubic-bezier(p1x, p1y, p2x, p2y) for progress t (scalar or array).
     Uses Newton's method to find u where Bx(u) = t, returns By(u)."""
-    if t <= 0:
-        return 0.0
-    if t >= 1:
-        return 1.0
-    u = t
+    t = np.asarray(t, dtype=np.float64)
+    u = np.clip(t, 0.0, 1.0)
     for _ in range(8):
         bx = 3 * (1 - u) ** 2 * u * p1x + 3 * (1 - u) * u ** 2 * p2x + u ** 3
         dbx = 3 * (1 - u) ** 2 * p1x + 6 * (1 - u) * u * (p2x - p1x) + 3 * u ** 2 * (1 - p2x)
-        if abs(dbx) < 1e-12:
-            break
-        u -= (bx - t) / dbx
-        u = max(0.0, min(1.0, u))
-    return 3 * (1 - u) ** 2 * u * p1y + 3 * (1 - u) * u ** 2 * p2y + u ** 3
+        ok = np.abs(dbx) >= 1e-12
+        u = np.where(ok, u - (bx - t) / np.where(ok, dbx, 1.0), u)
+        u = np.clip(u, 0.0, 1.0)
+    y = 3 * (1 - u) ** 2 * u * p1y + 3 * (1 - u) * u ** 2 * p2y + u ** 3
+    return np.where(t <= 0, 0.0, np.where(t >= 1, 1.0, y))
 
 
 _TIMING_CACHE = {
@@ -146,69 +151,73 @@ _PROP_DEFAULTS = {
 }
 
 
-def _interpolate_keyframes(t_seconds, anim_def):
-    """Interpolate animation properties at given time, matching CSS behavior."""
+def _sample_keyframes(anim_def, times):
+    """Vectorized CSS keyframe interpolation: property -> array of values for each time."""
+    times = np.asarray(times, dtype=np.float64)
     duration = anim_def['duration']
-    t_norm = (t_seconds % duration) / duration
+    t_norm = (times % duration) / duration
     keyframes = anim_def['keyframes']
     global_timing = anim_def.get('timing', 'linear')
 
-    prev_kf = keyframes[0]
-    next_kf = keyframes[-1]
-    for i in range(len(keyframes) - 1):
-        if keyframes[i][0] <= t_norm <= keyframes[i + 1][0]:
-            prev_kf = keyframes[i]
-            next_kf = keyframes[i + 1]
-            break
-
-    p0, props0 = prev_kf[0], prev_kf[1]
-    p1, props1 = next_kf[0], next_kf[1]
-    segment_timing = prev_kf[2] if len(prev_kf) > 2 else global_timing
+    # Segment i spans keyframes[i]..keyframes[i + 1]; exact keyframe hits end the previous one
+    progress = np.array([kf[0] for kf in keyframes], dtype=np.float64)
+    seg = np.clip(np.searchsorted(progress, t_norm, side='left') - 1, 0, len(keyframes) - 2)
+    p0, p1 = progress[seg], progress[seg + 1]
+    span = p1 - p0
+    local_t = np.where(span > 0, (t_norm - p0) / np.where(span > 0, span, 1.0), 0.0)
 
-    local_t = (t_norm - p0) / (p1 - p0) if (p1 - p0) > 0 else 0
-    eased_t = _ease(local_t, segment_timing)
+    seg_timings = [kf[2] if len(kf) > 2 else global_timing for kf in keyframes[:-1]]
+    eased_t = np.empty_like(local_t)
+    for timing in set(seg_timings):
+        in_timing = np.isin(seg, [i for i, tm in enumerate(seg_timings) if tm == timing])
+        eased_t[in_timing] = _ease(local_t[in_timing], timing)
 
-    all_props = set(list(props0.keys()) + list(props1.keys()))
+    props = {prop for kf in keyframes for prop in kf[1]}
     result = {}
-    for prop in all_props:
-        v0 = props0.get(prop, _PROP_DEFAULTS.get(prop, 0))
-        v1 = props1.get(prop, _PROP_DEFAULTS.get(prop, 0))
+    for prop in props:
+        values = np.array([kf[1].get(prop, _PROP_DEFAULTS.get(prop, 0)) for kf in keyframes], dtype=np.float64)
+        v0, v1 = values[seg], values[seg + 1]
         result[prop] = v0 + (v1 - v0) * eased_t
     return result
 
 
-def _build_affine(transforms, anim_name, canvas_w, canvas_h, content_rect):
-    """Build 2x3 affine matrix replicating CSS transform + transform-origin.
+def _build_affines(transforms, anim_name, content_rect, n):
+    """Build n 2x3 affine matrices replicating CSS transform + transform-origin.
+    transforms: property -> array of n values (see _sample_keyframes).
     content_rect: (cx, cy, cw, ch) — position and size of content in canvas.
-    Returns forward transform matrix for cv2.warpAffine."""
+    Returns forward transform matrices for cv2.warpAffine, shape (n, 2, 3)."""
     c_x, c_y, cw, ch = content_rect
     anim_def = ANIM_DEFS[anim_name]
     origin_frac = anim_def.get('origin', (0.5, 0.5))
     ox = c_x + origin_frac[0] * cw
     oy = c_y + origin_frac[1] * ch
 
-    tx = transforms.get('translateX', 0)
-    ty_raw = transforms.get('translateY', 0)
+    def prop(name, default):
+        return np.broadcast_to(np.asarray(transforms.get(name, default), dtype=np.float64), (n,))
+
+    tx = prop('translateX', 0)
+    ty = prop('translateY', 0)
     if anim_name in ('bouncy', 'peeker'):
-        ty = ty_raw * ch
-    else:
-        ty = ty_raw
-
-    sx = transforms.get('scaleX', 1.0)
-    sy = transforms.get('scaleY', 1.0)
-    angle = math.radians(transforms.get('rotate', 0))
-    skew = math.radians(transforms.get('skewX', 0))
-
-    O = np.array([[1, 0, -ox], [0, 1, -oy], [0, 0, 1]], dtype=np.float64)
-    O_inv = np.array([[1, 0, ox], [0, 1, oy], [0, 0, 1]], dtype=np.float64)
-    T = np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
-    R = np.array([
-        [math.cos(angle), -math.sin(angle), 0],
-        [math.sin(angle), math.cos(angle), 0],
-        [0, 0, 1]
-    ], dtype=np.float64)
-    K = np.array([[1, math.tan(skew), 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
-    S = np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+        ty = ty * ch
+    sx = prop('scaleX', 1.0)
+    sy = prop('scaleY', 1.0)
+    angle = np.radians(prop('rotate', 0))
+    skew = np.radians(prop('skewX', 0))
+
+    def stack(m00, m01, m02, m10, m11, m12):
+        m = np.zeros((n, 3, 3), dtype=np.float64)
+        m[:, 0, 0], m[:, 0, 1], m[:, 0, 2] = m00, m01, m02
+        m[:, 1, 0], m[:, 1, 1], m[:, 1, 2] = m10, m11, m12
+        m[:, 2, 2] = 1
+        return m
+
+    zeros, ones = np.zeros(n), np.ones(n)
+    O = stack(ones, zeros, -ox, zeros, ones, -oy)
+    O_inv = stack(ones, zeros, ox, zeros, ones, oy)
+    T = stack(ones, zeros, tx, zeros, ones, ty)
+    R = stack(np.cos(angle), -np.sin(angle), zeros, np.sin(angle), np.cos(angle), zeros)
+    K = stack(ones, np.tan(skew), zeros, zeros, ones, zeros)
+    S = stack(sx, zeros, zeros, zeros, sy, zeros)
 
     if anim_name in ('bouncy', 'peeker'):
         M_t = T @ S
@@ -221,10 +230,34 @@ def _build_affine(transforms, anim_name, canvas_w, canvas_h, content_rect):
     elif anim_name in ('spinny', 'tilty'):
         M_t = R
     else:
-        M_t = np.eye(3)
+        M_t = np.broadcast_to(np.eye(3), (n, 3, 3))
 
     M_final = O_inv @ M_t @ O
-    return M_final[:2, :].astype(np.float32)
+    return M_final[:, :2, :].astype(np.float32)
+
+
+class KeyframeTrack:
+    """Precomputed per-frame affine matrices for one animation at a fixed fps."""
+
+    def __init__(self, anim_name, content_rect, fps, duration=None):
+        self.anim_name = anim_name
+        self.anim_def = ANIM_DEFS[anim_name]
+        self.content_rect = content_rect
+        self.fps = fps
+        self.duration = duration or self.anim_def['duration']
+        self.times = np.arange(0, self.duration, 1.0 / fps)
+        self.matrices = self.matrices_at(self.times)
+
+    def matrices_at(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        transforms = _sample_keyframes(self.anim_def, times)
+        return _build_affines(transforms, self.anim_name, self.content_rect, len(times))
+
+    def matrix(self, t):
+        idx = int(round(t * self.fps))
+        if idx < len(self.times) and abs(self.times[idx] - t) < 1e-6:
+            return self.matrices[idx]
+        return self.matrices_at([t])[0]
 
 
 class StickerService:
@@ -286,53 +319,127 @@ class StickerService:
         return pil_img
 
     @staticmethod
-    def _make_rgba_clip(make_frame_fn, duration):
-        def rgb_fn(t):
-            frame = make_frame_fn(t)
-            return frame[:, :, :3] if frame.shape[2] >= 4 else frame
+    def _frame_layers(animation, anim_def, content_rect, fps):
+        """Матрицы слоев для каждого кадра: (n_layers, n_frames, 2, 3), задний слой первым."""
+        if not anim_def:
+            n = len(np.arange(0, STATIC_ANIM_DURATION, 1.0 / fps))
+            identity = np.tile(np.eye(2, 3, dtype=np.float32), (n, 1, 1))
+            return identity[None]
+
+        track = KeyframeTrack(animation, content_rect, fps)
+        if animation != 'floaties':
+            return track.matrices[None]
+
+        # Floaties: призрачные копии отстают по времени на ghost_delay * i
+        ghost_delay = anim_def.get('ghost_delay', 0.15)
+        num_ghosts = anim_def.get('ghost_layers', 7)
+        layers = [track.matrices_at(track.times + ghost_delay * i) for i in range(num_ghosts, 0, -1)]
+        layers.append(track.matrices)
+        return np.stack(layers)
 
-        def mask_fn(t):
-            frame = make_frame_fn(t)
-            if frame.shape[2] >= 4:
-                return frame[:, :, 3].astype(np.float64) / 255.0
-            return np.ones(frame.shape[:2])
+    @staticmethod
+    def _content_bbox(base_img, layers, canvas_size):
+        """Объединение bbox контента по всем кадрам — аналитически, через углы под аффинными матрицами."""
+        alpha = base_img[:, :, 3]
+        ys, xs = np.nonzero(alpha)
+        if not len(xs):
+            return 0, 0, canvas_size[0], canvas_size[1]
+        x0, x1 = xs.min(), xs.max() + 1
+        y0, y1 = ys.min(), ys.max() + 1
+        corners = np.array([[x0, y0, 1], [x1, y0, 1], [x0, y1, 1], [x1, y1, 1]], dtype=np.float64)
+        mapped = layers.reshape(-1, 2, 3).astype(np.float64) @ corners.T  # (n, 2, 4)
+        w, h = canvas_size
+        return (
+            max(0, int(np.floor(mapped[:, 0].min())) - CROP_MARGIN),
+            max(0, int(np.floor(mapped[:, 1].min())) - CROP_MARGIN),
+            min(w, int(np.ceil(mapped[:, 0].max())) + CROP_MARGIN + 1),
+            min(h, int(np.ceil(mapped[:, 1].max())) + CROP_MARGIN + 1),
+        )
 
-        clip = VideoClip(rgb_fn, duration=duration)
-        clip.mask = VideoClip(mask_fn, duration=duration, ismask=True)
-        return clip
+    @staticmethod
+    def _render_frames(base_img, layers, size):
+        """Генератор RGBA-кадров: каждый слой — warpAffine, слои складываются alpha-over."""
+        for frame_idx in range(layers.shape[1]):
+            warped = [
+                cv2.warpAffine(
+                    base_img, layers[layer_idx, frame_idx], size,
+                    flags=cv2.INTER_LINEAR,
+                    borderMode=cv2.BORDER_CONSTANT,
+                    borderValue=(0, 0, 0, 0)
+                )
+                for layer_idx in range(layers.shape[0])
+            ]
+            if len(warped) == 1:
+                yield warped[0]
+                continue
+
+            # Premultiplied alpha: acc = layer + acc * (1 - a_layer)
+            acc = np.zeros((size[1], size[0], 4), dtype=np.float32)
+            for layer in warped:
+                a = layer[:, :, 3:4].astype(np.float32) / 255.0
+                acc[:, :, :3] = layer[:, :, :3] * a + acc[:, :, :3] * (1 - a)
+                acc[:, :, 3:4] = a + acc[:, :, 3:4] * (1 - a)
+            out_a = acc[:, :, 3:4]
+            rgb = np.where(out_a > 0, acc[:, :, :3] / np.maximum(out_a, 1e-6), 0)
+            frame = np.empty((size[1], size[0], 4), dtype=np.uint8)
+            frame[:, :, :3] = np.clip(rgb, 0, 255)
+            frame[:, :, 3] = np.clip(out_a[:, :, 0] * 255, 0, 255)
+            yield frame
 
     @staticmethod
-    def _get_content_bbox(clip, num_samples=10):
-        min_x, min_y = clip.w, clip.h
-        max_x, max_y = 0, 0
-        for t in np.linspace(0, clip.duration * 0.95, num_samples):
-            if clip.mask:
-                mask_frame = clip.mask.get_frame(t)
-                rows = np.any(mask_frame > 0.01, axis=1)
-                cols = np.any(mask_frame > 0.01, axis=0)
-            else:
-                frame = clip.get_frame(t)
-                rows = np.any(np.sum(frame, axis=2) > 15, axis=1)
-                cols = np.any(np.sum(frame, axis=2) > 15, axis=0)
-            if rows.any() and cols.any():
-                y_idx = np.where(rows)[0]
-                x_idx = np.where(cols)[0]
-                min_x = min(min_x, x_idx[0])
-                min_y = min(min_y, y_idx[0])
-                max_x = max(max_x, x_idx[-1])
-                max_y = max(max_y, y_idx[-1])
-        margin = 4
-        return (max(0, min_x - margin), max(0, min_y - margin),
-                min(clip.w, max_x + margin + 1), min(clip.h, max_y + margin + 1))
+    def _count_frames(frames, total, on_progress):
+        for idx, frame in enumerate(frames, 1):
+            yield frame
+            on_progress(idx / total)
+
+    @staticmethod
+    def _encode_gif(frames, output_path, size, fps):
+        """Кадры потоком в один ffmpeg: palettegen + paletteuse с прозрачностью."""
+        stream = ffmpeg.input('pipe:', format='rawvideo', pix_fmt='rgba', s=f'{size[0]}x{size[1]}', r=fps)
+        split = stream.split()
+        palette = split[0].filter('palettegen', reserve_transparent=1, stats_mode='full')
+        out = ffmpeg.filter([split[1], palette], 'paletteuse', dither='bayer', bayer_scale=3, alpha_threshold=128)
+        process = (
+            out.output(output_path, loop=0)
+            .overwrite_output()
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdin=True, pipe_stderr=True)
+        )
+        try:
+            for frame in frames:
+                process.stdin.write(frame.tobytes())
+            process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg завершился раньше (плохой фильтр, нет места) — причина в stderr
+            stderr = process.stderr.read()
+            process.wait()
+            raise RuntimeError(f"GIF encoding failed: {stderr.decode(errors='ignore')}")
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"GIF encoding failed: {stderr.decode(errors='ignore')}")
+
+    @staticmethod
+    def _encode_webp(frames, output_path, fps, quality=80):
+        """Анимированный WebP через Pillow (24-bit цвет + полноценная альфа)."""
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(
+            output_path, 'WEBP', save_all=True, append_images=images[1:],
+            duration=int(1000 / fps), loop=0, quality=quality, method=4
+        )
 
     def create_animated_sticker(self, image_path: str, animation: str = "none",
                                 outline_color=None, outline_width=0,
                                 text=None, text_color="white",
                                 text_size=15, text_x=0.5, text_y=0.8,
-                                crop=None):
-        final_clip = None
-        clip = None
-
+                                crop=None, preview=False, on_progress=None):
+        """
+        GIF/WebP по расширению output_path; preview=True — уменьшенный кадр и fps.
+        on_progress(доля 0..1) вызывается по мере рендера кадров.
+        """
         try:
             img = Image.open(image_path).convert("RGBA")
 
@@ -356,6 +463,12 @@ class StickerService:
                 img.save(output_path, 'PNG', optimize=True)
                 return output_path
 
+            fps = STICKER_FPS
+            if preview:
+                # Обводка и текст уже нанесены на полном размере — превью их просто уменьшает
+                img.thumbnail((PREVIEW_MAX_DIM, PREVIEW_MAX_DIM), Image.Resampling.LANCZOS)
+                fps = PREVIEW_FPS
+
             # Padding for animations (auto-crop removes excess later)
             w, h = img.size
             padding = int(max(w, h) * 0.20)
@@ -365,106 +478,32 @@ class StickerService:
             canvas.paste(img, (padding, padding))
             img = canvas
 
-            temp_frame = self.output_path + "_temp.png"
-            img.save(temp_frame)
-
-            fps = 15
-            base_img = np.array(Image.open(temp_frame))
+            base_img = np.array(img)
             content_rect = (padding, padding, w, h)
-
             anim_def = ANIM_DEFS.get(animation)
-            if not anim_def:
-                duration = 2.5
-                clip = ImageClip(temp_frame, duration=duration).set_position("center")
-            elif animation == "floaties":
-                # Special case: CompositeVideoClip with ghost layers
-                duration = anim_def['duration']
-                ghost_delay = anim_def.get('ghost_delay', 0.15)
-                num_ghosts = anim_def.get('ghost_layers', 7)
-
-                clip_base = ImageClip(temp_frame, duration=duration)
-
-                def get_floaty_pos(t, time_offset=0):
-                    tr = _interpolate_keyframes(t + time_offset, anim_def)
-                    return (tr.get('translateX', 0), tr.get('translateY', 0))
-
-                def get_floaty_rot(t, time_offset=0):
-                    tr = _interpolate_keyframes(t + time_offset, anim_def)
-                    return -tr.get('rotate', 0)  # Negate for MoviePy (CCW convention)
-
-                layers = []
-                for i in range(num_ghosts, 0, -1):
-                    offset = ghost_delay * i
-                    ghost = clip_base.copy() \
-                        .set_opacity(1.0) \
-                        .rotate(lambda t, o=offset: get_floaty_rot(t, o), expand=False) \
-                        .set_position(lambda t, o=offset: get_floaty_pos(t, o))
-                    layers.append(ghost)
-
-                main = clip_base.copy() \
-                    .rotate(lambda t: get_floaty_rot(t, 0), expand=False) \
-                    .set_position(lambda t: get_floaty_pos(t, 0))
-                layers.append(main)
-                clip = CompositeVideoClip(layers, size=new_size)
-            else:
-                # Unified keyframe engine for all other animations
-                duration = anim_def['duration']
-                h_canvas, w_canvas = base_img.shape[:2]
-
-                def make_frame(t):
-                    transforms = _interpolate_keyframes(t, anim_def)
-                    M = _build_affine(transforms, animation, w_canvas, h_canvas, content_rect)
-                    return cv2.warpAffine(
-                        base_img, M, (w_canvas, h_canvas),
-                        flags=cv2.INTER_LINEAR,
-                        borderMode=cv2.BORDER_CONSTANT,
-                        borderValue=(0, 0, 0, 0)
-                    )
-
-                clip = self._make_rgba_clip(make_frame, duration)
-
-            # Assemble final clip
-            if animation != "floaties":
-                final_clip = CompositeVideoClip([clip], size=new_size)
-            else:
-                final_clip = clip
 
-            final_clip.duration = duration
+            layers = self._frame_layers(animation, anim_def, content_rect, fps)
 
-            # Auto-crop transparent edges
-            try:
-                x1, y1, x2, y2 = self._get_content_bbox(final_clip)
-                if x2 > x1 + 10 and y2 > y1 + 10:
-                    final_clip = final_clip.crop(x1=x1, y1=y1, x2=x2, y2=y2)
-            except Exception as e:
-                print(f"Auto-crop skipped: {e}")
-
-            # Export GIF
-            final_clip.write_gif(
-                self.output_path,
-                fps=fps,
-                program='ffmpeg',
-                opt='Wu',
-                fuzz=3,
-                logger=None
-            )
-
-            if os.path.exists(temp_frame):
-                os.remove(temp_frame)
+            # Auto-crop прозрачных краев: сдвигаем матрицы и рендерим сразу в размер кропа
+            x1, y1, x2, y2 = self._content_bbox(base_img, layers, new_size)
+            if x2 > x1 + 10 and y2 > y1 + 10:
+                layers = layers.copy()
+                layers[:, :, 0, 2] -= x1
+                layers[:, :, 1, 2] -= y1
+                out_size = (x2 - x1, y2 - y1)
+            else:
+                out_size = new_size
+
+            frames = self._render_frames(base_img, layers, out_size)
+            if on_progress:
+                frames = self._count_frames(frames, layers.shape[1], on_progress)
+            if self.output_path.lower().endswith('.webp'):
+                self._encode_webp(frames, self.output_path, fps)
+            else:
+                self._encode_gif(frames, self.output_path, out_size, fps)
 
             return self.output_path
 
         except Exception as e:
             print(f"Sticker Generation Error: {e}")
             raise e
-        finally:
-            if final_clip:
-                try:
-                    final_clip.close()
-                except:
-                    pass
-            if clip:
-                try:
-                    clip.close()
-                except:
-                    pass
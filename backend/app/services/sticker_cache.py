@@ -0,0 +1,129 @@
+"""
+Кэш отрендеренных стикеров: sha256 исходника + нормализованные параметры -> готовый файл.
+
+Редактор постоянно пересылает /editor/create-sticker с теми же параметрами
+(переключение анимаций, повторный экспорт). Попадание отдает готовый
+/static/sticker_* сразу, без Celery. Файлы вытесняются по LRU, когда суммарный
+размер кэша превышает STICKER_CACHE_MAX_BYTES.
+
+Функции lookup_async — для API (redis.asyncio), store — для воркера (sync redis).
+"""
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+
+UPLOAD_DIR = "uploads"
+
+# Версия рендера: меняем при изменении StickerService, чтобы не отдавать старые файлы
+RENDER_VERSION = 2
+STICKER_CACHE_MAX_BYTES = int(os.getenv("STICKER_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+ENTRY_KEY = "sticker:cache:{key}"      # -> имя файла в uploads
+LRU_KEY = "sticker:cache:lru"          # ZSET key -> время последнего обращения
+SIZES_KEY = "sticker:cache:sizes"      # HASH key -> размер файла
+TOTAL_KEY = "sticker:cache:bytes"      # суммарный размер закэшированных файлов
+
+EVICT_BATCH = 20
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_params(animation: str, outline_color=None, outline_width=0,
+                     text=None, text_color="white", text_size=15,
+                     text_x=0.5, text_y=0.8, crop=None, variant="full") -> dict:
+    """Параметры, влияющие на результат: неиспользуемые опции схлопываются в None."""
+    outline = None
+    if outline_color and outline_width and int(outline_width) > 0:
+        outline = [outline_color.lower(), int(outline_width)]
+    text_opts = None
+    if text:
+        text_opts = [text, (text_color or "white").lower(), int(text_size or 15),
+                     round(float(text_x), 4), round(float(text_y), 4)]
+    crop_opts = None
+    if crop:
+        crop_opts = [int(crop["x"]), int(crop["y"]), int(crop["width"]), int(crop["height"])]
+    return {
+        "v": RENDER_VERSION,
+        "animation": animation if animation and animation != "none" else "none",
+        "outline": outline,
+        "text": text_opts,
+        "crop": crop_opts,
+        "variant": variant,
+    }
+
+
+def cache_key(source_hash: str, params: dict) -> str:
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{source_hash}:{payload}".encode()).hexdigest()
+
+
+async def lookup_async(redis, key: str) -> Optional[str]:
+    """URL закэшированного стикера или None. Отсутствующий файл чистит запись."""
+    filename = await redis.get(ENTRY_KEY.format(key=key))
+    if not filename:
+        return None
+    path = os.path.join(UPLOAD_DIR, filename)
+    if not os.path.exists(path):
+        if await redis.zrem(LRU_KEY, key):
+            size = int(await redis.hget(SIZES_KEY, key) or 0)
+            pipe = redis.pipeline(transaction=False)
+            pipe.delete(ENTRY_KEY.format(key=key))
+            pipe.hdel(SIZES_KEY, key)
+            pipe.decrby(TOTAL_KEY, size)
+            await pipe.execute()
+        return None
+    await redis.zadd(LRU_KEY, {key: time.time()})
+    return f"/static/{filename}"
+
+
+def store(redis, key: str, path: str):
+    """Регистрирует готовый файл в кэше и вытесняет старые при превышении лимита."""
+    # Параллельный рендер тех же параметров уже занял запись — свой файл не учитываем
+    if not redis.set(ENTRY_KEY.format(key=key), os.path.basename(path), nx=True):
+        return
+    size = os.path.getsize(path)
+    pipe = redis.pipeline(transaction=False)
+    pipe.zadd(LRU_KEY, {key: time.time()})
+    pipe.hset(SIZES_KEY, key, size)
+    pipe.incrby(TOTAL_KEY, size)
+    pipe.execute()
+    evict(redis)
+
+
+def evict(redis, max_bytes: int = STICKER_CACHE_MAX_BYTES) -> int:
+    """LRU-вытеснение: удаляет самые давно запрошенные файлы, пока кэш больше лимита."""
+    removed = 0
+    while int(redis.get(TOTAL_KEY) or 0) > max_bytes:
+        oldest = redis.zrange(LRU_KEY, 0, EVICT_BATCH - 1)
+        if not oldest:
+            redis.set(TOTAL_KEY, 0)
+            break
+        for key in oldest:
+            # ZREM как захват: параллельный воркер мог уже вытеснить эту запись
+            if not redis.zrem(LRU_KEY, key):
+                continue
+            filename = redis.get(ENTRY_KEY.format(key=key))
+            size = int(redis.hget(SIZES_KEY, key) or 0)
+            if filename:
+                path = os.path.join(UPLOAD_DIR, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            pipe = redis.pipeline(transaction=False)
+            pipe.delete(ENTRY_KEY.format(key=key))
+            pipe.hdel(SIZES_KEY, key)
+            pipe.decrby(TOTAL_KEY, size)
+            pipe.execute()
+            removed += 1
+            if int(redis.get(TOTAL_KEY) or 0) <= max_bytes:
+                break
+    if removed:
+        print(f"🧹 Sticker cache evicted {removed} files")
+    return removed
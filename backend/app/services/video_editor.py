@@ -1,6 +1,16 @@
 import os
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
-from moviepy.audio.io.AudioFileClip import AudioFileClip
+import tempfile
+import ffmpeg
+
+from app.services.media import display_dimensions
+from app.utils.ffmpeg_progress import run_with_progress
+
+# Шрифт для drawtext (fonts-dejavu из Dockerfile)
+TEXT_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# Кодеки, которые можно положить в MP4 без перекодирования (stream copy)
+COPY_VIDEO_CODECS = {"h264", "hevc"}
+COPY_AUDIO_CODECS = {"aac", "mp3"}
 
 
 class VideoEditorService:
@@ -20,75 +30,144 @@ class VideoEditorService:
         remove_audio: bool = False,
         new_audio_path: str = None,
         text_config: dict = None,
+        on_progress=None,
     ) -> str:
-        clip = None
+        """
+        Trim / crop / текст / замена звука одним вызовом ffmpeg с сохранением fps исходника.
+        Чистая обрезка по ключевому кадру идет stream copy, без перекодирования.
+        on_progress(доля 0..1) вызывается по мере кодирования.
+        """
+        text_file = None
         try:
             print(f"🎬 START PROCESSING video: {input_path}")
-            clip = VideoFileClip(input_path)
+            probe = ffmpeg.probe(input_path)
+            video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+            audio_info = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+            # ffmpeg поворачивает кадр при декодировании — crop считается в повернутых координатах
+            src_w, src_h = display_dimensions(video_info)
+            src_duration = float(probe['format'].get('duration') or video_info.get('duration') or 0)
 
-            # 1. Trimming
+            # 1. Trimming (как раньше: только если заданы обе границы и start < end)
+            start = end = None
             if trim_start is not None and trim_end is not None:
-                start = max(0, trim_start)
-                end = min(clip.duration, trim_end)
-                if start < end:
-                    clip = clip.subclip(start, end)
+                s0 = max(0, trim_start)
+                e0 = min(src_duration, trim_end)
+                if s0 < e0:
+                    start, end = s0, e0
+            duration = (end - start) if start is not None else src_duration
+            input_kwargs = {'ss': start, 't': end - start} if start is not None else {}
 
-            # 2. Cropping
-            if crop:
-                clip = clip.crop(
-                    x1=crop.get('x', 0),
-                    y1=crop.get('y', 0),
-                    width=crop.get('width'),
-                    height=crop.get('height')
+            has_text = bool(text_config and text_config.get('text'))
+            new_audio = new_audio_path if new_audio_path and os.path.exists(new_audio_path) else None
+            output_path = os.path.join(self.output_dir, output_filename)
+
+            if (not crop and not has_text and not new_audio
+                    and self._can_stream_copy(input_path, video_info, audio_info, start)):
+                print("⚡ Stream copy (trim only)")
+                stream = ffmpeg.output(
+                    ffmpeg.input(input_path, **input_kwargs),
+                    output_path,
+                    c='copy',
+                    avoid_negative_ts='make_zero',
+                    movflags='+faststart',
+                    **({'an': None} if remove_audio else {}),
                 )
+                run_with_progress(stream, duration, on_progress)
+                print(f"✅ DONE: {output_path}")
+                return output_path
 
-            # 3. Audio
-            if remove_audio:
-                clip = clip.without_audio()
-            elif new_audio_path and os.path.exists(new_audio_path):
-                new_audio = AudioFileClip(new_audio_path)
-                if new_audio.duration > clip.duration:
-                    new_audio = new_audio.subclip(0, clip.duration)
-                clip = clip.set_audio(new_audio)
-
-            # 4. Text
-            if text_config and text_config.get('text'):
+            source = ffmpeg.input(input_path, **input_kwargs)
+            video = source.video
+
+            # 2. Cropping (+ четные размеры для yuv420p)
+            x, y, w, h = 0, 0, src_w, src_h
+            if crop:
+                x = max(0, int(crop.get('x', 0)))
+                y = max(0, int(crop.get('y', 0)))
+                w = min(int(crop.get('width') or src_w), src_w - x)
+                h = min(int(crop.get('height') or src_h), src_h - y)
+            w, h = w - w % 2, h - h % 2
+            if (x, y, w, h) != (0, 0, src_w, src_h):
+                video = video.filter('crop', w, h, x, y)
+
+            # 3. Text (drawtext вместо TextClip/ImageMagick; текст через файл — без экранирования)
+            if has_text:
                 fontsize = max(12, float(text_config.get('size', 50)))
-                txt_clip = TextClip(
-                    text_config['text'],
-                    fontsize=fontsize,
-                    color=text_config.get('color', 'white'),
-                    font='DejaVu-Sans-Bold',
-                    stroke_color='black',
-                    stroke_width=max(1, int(fontsize / 25))
+                with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+                    f.write(text_config['text'])
+                    text_file = f.name
+                video = video.drawtext(
+                    textfile=text_file,
+                    fontfile=TEXT_FONT,
+                    fontsize=int(fontsize),
+                    fontcolor=text_config.get('color', 'white'),
+                    borderw=max(1, int(fontsize / 25)),
+                    bordercolor='black',
+                    x=f"{float(text_config.get('x', 0.5))}*w-text_w/2",
+                    y=f"{float(text_config.get('y', 0.8))}*h-text_h/2",
                 )
-                tx = float(text_config.get('x', 0.5)) * clip.w - txt_clip.w / 2
-                ty = float(text_config.get('y', 0.8)) * clip.h - txt_clip.h / 2
-                txt_clip = txt_clip.set_position((tx, ty)).set_duration(clip.duration)
-                clip = CompositeVideoClip([clip, txt_clip])
 
-            # 5. Save
-            output_path = os.path.join(self.output_dir, output_filename)
+            # 4. Audio
+            streams = [video]
+            if remove_audio:
+                pass
+            elif new_audio:
+                # Длиннее видео — обрезаем, короче — видео продолжается без звука
+                streams.append(ffmpeg.input(new_audio, t=duration).audio)
+            elif audio_info:
+                streams.append(source.audio)
 
-            clip.write_videofile(
+            # 5. Save (fps не задаем — остается как у исходника)
+            audio_args = {'acodec': 'aac'} if len(streams) > 1 else {}
+            stream = ffmpeg.output(
+                *streams,
                 output_path,
-                codec='libx264',
-                audio_codec='aac',
+                vcodec='libx264',
                 preset='ultrafast',
-                fps=24,
-                threads=4,
-                logger='bar',
+                pix_fmt='yuv420p',
+                movflags='+faststart',
+                **audio_args,
             )
+            run_with_progress(stream, duration, on_progress)
 
             print(f"✅ DONE: {output_path}")
             return output_path
 
+        except ffmpeg.Error as e:
+            error = e.stderr.decode(errors='ignore') if e.stderr else str(e)
+            print(f"❌ VideoEditorService Error: {error}")
+            raise RuntimeError(f"Video processing failed: {error}")
         except Exception as e:
             print(f"❌ VideoEditorService Error: {e}")
             raise e
         finally:
-            if clip:
-                try:
-                    clip.close()
-                except:
-                    pass
+            if text_file and os.path.exists(text_file):
+                os.remove(text_file)
+
+    @staticmethod
+    def _can_stream_copy(input_path, video_info, audio_info, start) -> bool:
+        """Копирование без перекодирования: MP4-совместимые кодеки и старт на ключевом кадре."""
+        if video_info.get('codec_name') not in COPY_VIDEO_CODECS:
+            return False
+        if audio_info and audio_info.get('codec_name') not in COPY_AUDIO_CODECS:
+            return False
+        if not start:
+            return True
+        try:
+            rate = video_info.get('avg_frame_rate') or '25/1'
+            num, _, den = rate.partition('/')
+            fps = float(num) / float(den or 1) if float(num) else 25.0
+            keyframes = ffmpeg.probe(
+                input_path,
+                select_streams='v:0',
+                skip_frame='nokey',
+                show_entries='frame=best_effort_timestamp_time',
+                read_intervals=f"{max(0, start - 2)}%{start + 2}",
+            ).get('frames', [])
+        except (ffmpeg.Error, ValueError, ZeroDivisionError):
+            return False
+        tolerance = 0.5 / fps
+        return any(
+            abs(float(frame.get('best_effort_timestamp_time', -1)) - start) <= tolerance
+            for frame in keyframes
+        )
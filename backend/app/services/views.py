@@ -0,0 +1,132 @@
+"""
+Просмотры мемов: накопление в Redis и пачечный сброс в Postgres.
+
+read_meme одним вызовом Lua-скрипта ставит метку зрителя (SET NX EX на
+DEDUP_SECONDS) и, только если ее не было, делает HINCRBY в общий хэш
+PENDING_KEY. Повторные открытия тем же зрителем в окне не считаются.
+
+Зритель — пользователь или IP клиента. X-Forwarded-For принимается только от
+своих: SSR Next.js (присылает X-Internal-Token и IP браузера) и прокси из
+TRUSTED_PROXIES. Иначе любой клиент подделал бы IP, а все SSR-просмотры
+схлопнулись бы в один IP контейнера фронтенда.
+
+sync_views_task (beat, 30 с) атомарно забирает хэш: RENAME PENDING_KEY ->
+DRAIN_KEY, HGETALL, и прибавляет счетчики одним UPDATE ... FROM (VALUES ...).
+DRAIN_KEY удаляется после коммита; если воркер упал между ними, следующий
+запуск сначала досливает оставшийся DRAIN_KEY.
+"""
+import os
+import uuid
+
+import redis as redis_lib
+from sqlalchemy import Integer, column, func, update, values
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.models.models import Meme
+
+PENDING_KEY = "meme:views:pending"
+DRAIN_KEY = "meme:views:draining"
+VIEWER_KEY = "meme:viewed:{meme_id}:{viewer}"
+LEGACY_PATTERN = "meme:views:*"
+LEGACY_DONE_KEY = "meme:views:legacy_migrated"
+LEGACY_RECHECK_SECONDS = 3600
+
+DEDUP_SECONDS = int(os.getenv("VIEWS_DEDUP_SECONDS", "1800"))
+# Адреса обратных прокси перед API, чьему X-Forwarded-For можно верить (через запятую)
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+# Строк в одном UPDATE (обычно за 30 с их меньше — один запрос)
+FLUSH_CHUNK = 5000
+
+# KEYS[1] — метка зрителя, KEYS[2] — хэш просмотров; ARGV[1] — окно, ARGV[2] — id мема
+_COUNT_VIEW_LUA = """
+if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+return 0
+"""
+
+
+def viewer_id(request, user=None, internal: bool = False) -> str:
+    """
+    Пользователь, если залогинен, иначе IP клиента. internal — запрос с
+    X-Internal-Token (SSR фронтенда), тогда X-Forwarded-For — IP браузера.
+    """
+    if user is not None:
+        return f"u:{user.id}"
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and (internal or peer in TRUSTED_PROXIES):
+        return f"ip:{forwarded.split(',')[0].strip()}"
+    return f"ip:{peer}"
+
+
+async def count_view(redis, meme_id, viewer: str) -> bool:
+    """Засчитывает просмотр (redis.asyncio). False — повтор в окне дедупликации."""
+    counted = await redis.eval(
+        _COUNT_VIEW_LUA, 2,
+        VIEWER_KEY.format(meme_id=meme_id, viewer=viewer), PENDING_KEY,
+        DEDUP_SECONDS, str(meme_id),
+    )
+    return bool(counted)
+
+
+def _take_pending(redis) -> dict:
+    """Хэш к сбросу: недослитый DRAIN_KEY или атомарно переименованный PENDING_KEY."""
+    if not redis.exists(DRAIN_KEY):
+        try:
+            redis.rename(PENDING_KEY, DRAIN_KEY)
+        except redis_lib.ResponseError:
+            return {}  # за интервал просмотров не было
+    return redis.hgetall(DRAIN_KEY)
+
+
+def _migrate_legacy(redis):
+    """Раз в LEGACY_RECHECK_SECONDS переносит счетчики meme:views:{id} старого формата в PENDING_KEY."""
+    if redis.get(LEGACY_DONE_KEY):
+        return
+    for key in redis.scan_iter(match=LEGACY_PATTERN):
+        meme_id = key.split(":")[-1]
+        if meme_id in ("pending", "draining", "legacy_migrated"):
+            continue
+        pipe = redis.pipeline()  # MULTI: GET + DEL атомарно
+        pipe.get(key)
+        pipe.delete(key)
+        count = int(pipe.execute()[0] or 0)
+        if count > 0:
+            redis.hincrby(PENDING_KEY, meme_id, count)
+    # Час на rolling deploy: старые реплики API еще могут писать ключи прежнего формата
+    redis.set(LEGACY_DONE_KEY, 1, ex=LEGACY_RECHECK_SECONDS)
+
+
+def _bulk_update(db, rows: list):
+    data = values(
+        column("id", UUID(as_uuid=True)), column("delta", Integer), name="v",
+    ).data(rows)
+    db.execute(
+        update(Meme)
+        .where(Meme.id == data.c.id)
+        .values(
+            views_count=func.coalesce(Meme.views_count, 0) + data.c.delta,
+            # Просмотры — не изменение для поиска (счетчики идут через search_counters)
+            updated_at=Meme.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def flush(redis, db) -> dict:
+    """Сбрасывает накопленные просмотры в БД. Возвращает {meme_id: прирост}."""
+    _migrate_legacy(redis)
+    pending = _take_pending(redis)
+    updates = {}
+    for meme_id, count in pending.items():
+        try:
+            updates[uuid.UUID(meme_id)] = int(count)
+        except ValueError:
+            continue
+    rows = [(meme_id, count) for meme_id, count in updates.items() if count > 0]
+    for start in range(0, len(rows), FLUSH_CHUNK):
+        _bulk_update(db, rows[start:start + FLUSH_CHUNK])
+    db.commit()
+    redis.delete(DRAIN_KEY)
+    return {str(meme_id): count for meme_id, count in rows}
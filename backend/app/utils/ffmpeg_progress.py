@@ -0,0 +1,46 @@
+"""
+Запуск ffmpeg-python графа с разбором `-progress pipe:1`.
+
+ffmpeg пишет в stdout блоки key=value (out_time_us, progress=continue/end);
+по out_time и ожидаемой длительности считаем долю готовности 0..1.
+stderr читается отдельным потоком: иначе ffmpeg, заполнив буфер stderr
+(много предупреждений), блокируется, и чтение stdout до EOF зависает.
+"""
+import threading
+from typing import Callable, Optional
+
+import ffmpeg
+
+ProgressCallback = Callable[[float], None]
+
+
+def run_with_progress(stream, duration: float, on_progress: Optional[ProgressCallback] = None):
+    """Выполняет ffmpeg и вызывает on_progress(доля) по мере кодирования. Ошибка -> ffmpeg.Error."""
+    process = (
+        stream
+        .overwrite_output()
+        .global_args('-progress', 'pipe:1', '-nostats', '-loglevel', 'error')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    drain.start()
+    try:
+        for raw in process.stdout:
+            key, _, value = raw.decode(errors='ignore').strip().partition('=')
+            if not on_progress:
+                continue
+            # out_time_ms исторически тоже в микросекундах
+            if key in ('out_time_us', 'out_time_ms') and value.isdigit() and duration > 0:
+                on_progress(min(1.0, int(value) / 1_000_000 / duration))
+            elif key == 'progress' and value == 'end':
+                on_progress(1.0)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        returncode = process.wait()
+        drain.join()
+
+    if returncode != 0:
+        raise ffmpeg.Error('ffmpeg', b'', b''.join(stderr_chunks))
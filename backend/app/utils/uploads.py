@@ -0,0 +1,93 @@
+import os
+import time
+import uuid
+import hashlib
+from typing import NamedTuple
+
+import aiofiles
+from fastapi import UploadFile, HTTPException
+
+from app.core.redis import redis_client
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Лимиты размера по типу загрузки (байты)
+MAX_UPLOAD_SIZE = {
+    "image": 20 * 1024 * 1024,
+    "video": 200 * 1024 * 1024,
+    "audio": 50 * 1024 * 1024,
+    "avatar": 5 * 1024 * 1024,
+}
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp']
+
+STATS_KEY = "stats:uploads:{kind}"
+
+
+class SavedUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+    seconds: float
+
+
+def upload_kind(filename: str) -> str:
+    """image/video по расширению — для выбора лимита."""
+    ext = (filename or "").split('.')[-1].lower()
+    return "image" if ext in IMAGE_EXTENSIONS else "video"
+
+
+async def save_upload(file: UploadFile, path: str, kind: str) -> SavedUpload:
+    """
+    Потоково копирует UploadFile на диск кусками по CHUNK_SIZE.
+    Лимит MAX_UPLOAD_SIZE[kind] проверяется по ходу записи (413 + удаление
+    недописанного файла), SHA-256 считается попутно.
+
+    Пишем во временный файл рядом с path и переносим os.replace только после
+    успеха: при перезаписи (аватар, шапка) ошибка не трогает текущий файл.
+    Лимит защищает диск и воркеры, но не память/tmp API: Starlette
+    целиком спулит multipart-тело до вызова эндпоинта, поэтому сам размер
+    запроса ограничивается на прокси (client_max_body_size).
+    """
+    max_size = MAX_UPLOAD_SIZE[kind]
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Файл слишком большой (максимум {max_size // (1024 * 1024)} МБ)"
+    )
+    if file.size is not None and file.size > max_size:
+        raise too_large
+
+    hasher = hashlib.sha256()
+    size = 0
+    started = time.monotonic()
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large
+                hasher.update(chunk)
+                await f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    seconds = time.monotonic() - started
+    await _record_stats(kind, size, seconds)
+    return SavedUpload(path=path, size=size, sha256=hasher.hexdigest(), seconds=seconds)
+
+
+async def _record_stats(kind: str, size: int, seconds: float):
+    # Пропускная способность загрузок: bytes / seconds из хэша stats:uploads:{kind}
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        key = STATS_KEY.format(kind=kind)
+        pipe.hincrby(key, "files", 1)
+        pipe.hincrby(key, "bytes", size)
+        pipe.hincrbyfloat(key, "seconds", seconds)
+        await pipe.execute()
+    except Exception as e:
+        print(f"Upload stats error: {e}")
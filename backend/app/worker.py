@@ -1,27 +1,52 @@
 import os
+import time
 import shutil
 import json
 import uuid
 import redis
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from celery import shared_task
+from celery.signals import worker_init, worker_process_init
 
 # --- Импорты ---
 from app.core.celery_app import celery_app
 from app.core.config import settings
-from app.models.models import Meme, Notification, NotificationType, SearchTerm
+from app.models.models import Meme, MediaBlob, Notification, NotificationType, SearchTerm
 from app.services.media import MediaProcessor
 from app.services.search import get_search_service
 from app.services.ai import AIService
 from app.services.sticker import StickerService
 from app.services.video_editor import VideoEditorService
+from app.services import ranking, random_pick, media_dedup, sticker_cache, search_outbox, search_counters, search_cache, search_settings, search_sync, search_writer, views
+from app.services.model_registry import warmup_from_env
+from app.services.progress import ProgressReporter
+
+# Размер пачки подписчиков при рассылке уведомлений о новом меме
+FANOUT_CHUNK_SIZE = 1000
 
 # Настройка БД
 engine = create_engine(settings.DATABASE_URL.replace("+asyncpg", ""))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+@worker_process_init.connect
+def _warmup_models(**kwargs):
+    # Прогрев rembg-сессий в каждом процессе AI-воркера (AI_WARMUP_MODELS)
+    warmup_from_env()
+
+
+@worker_init.connect
+def _warmup_models_threads(sender=None, **kwargs):
+    # Пул потоков (AI-воркер с батчингом) не форкает процессы — греем в основном
+    if "thread" in str(getattr(sender, "pool_cls", "")).lower():
+        warmup_from_env()
+
+
 class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
@@ -34,13 +59,142 @@ class DateTimeEncoder(json.JSONEncoder):
 # 1. ЗАДАЧИ ДЛЯ ОСНОВНОГО САЙТА (MEMES)
 # ==========================================
 
-@shared_task(bind=True, max_retries=3, name="app.worker.process_meme_task")
-def process_meme_task(self, meme_id_str: str, file_path: str, audio_path: str = None):
+# Суммарное время по стадиям обработки медиа: {stage}_seconds / {stage}_count
+MEDIA_STAGES_STATS_KEY = "stats:media_stages"
+
+@contextmanager
+def _stage(timings: dict, name: str):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.monotonic() - started
+
+
+def _record_timings(redis_client, timings: dict):
+    if not timings:
+        return
+    print("⏱️ " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for name, seconds in timings.items():
+            pipe.hincrbyfloat(MEDIA_STAGES_STATS_KEY, f"{name}_seconds", seconds)
+            pipe.hincrby(MEDIA_STAGES_STATS_KEY, f"{name}_count", 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"Stage timings error: {e}")
+
+
+def _transcode_meme(meme: Meme, processor: MediaProcessor, file_path: str,
+                    audio_path: str = None, timings: dict = None,
+                    reporter: ProgressReporter = None) -> str:
+    """Полный ffmpeg-пайплайн: финальный файл, превью, метаданные. Возвращает путь финального файла."""
+    meme_id_str = str(meme.id)
+    with _stage(timings, "probe"):
+        has_audio_stream = processor.has_audio_stream()
+
+    # 2. Определяем формат вывода
+    # Если есть оригинальный звук ИЛИ добавили новый звук -> MP4
+    # Иначе -> GIF
+    if has_audio_stream or audio_path:
+        output_ext = "mp4"
+        is_gif = False
+    else:
+        output_ext = "gif"
+        is_gif = True
+
+    final_filename = f"{meme_id_str}.{output_ext}"
+    upload_dir = os.path.dirname(file_path)
+    final_path = os.path.join(upload_dir, final_filename)
+
+    # Все thumbnails теперь WebP
+    thumbnail_path = os.path.join(upload_dir, f"{meme_id_str}_thumb.webp")
+
+    print(f"ℹ️ Detected format: {output_ext}, Thumb: webp (Audio: {has_audio_stream}, New Audio: {bool(audio_path)})")
+
+    # --- ОБРАБОТКА ---
+    if reporter and not (output_ext == "mp4" and not audio_path):
+        reporter.update(0.1, stage="transcode")
+    if audio_path:
+        # Если есть новое аудио, это точно MP4
+        with _stage(timings, "transcode"):
+            processor.process_video_with_audio(audio_path, final_path)
+        if os.path.exists(audio_path): os.remove(audio_path)
+        # Пересоздаем процессор на готовом файле: превью строятся из результата склейки
+        processor = MediaProcessor(final_path)
+        preview_path = os.path.join(upload_dir, f"{meme_id_str}_preview.webm")
+        with _stage(timings, "preview"):
+            processor.generate_video_preview(preview_path, thumbnail_path)
+        meme.preview_url = f"/static/{meme_id_str}_preview.webm"
+        with _stage(timings, "probe"):
+            duration, width, height = processor.get_metadata()
+
+    elif is_gif:
+        # Конвертируем в оптимизированный GIF
+        with _stage(timings, "transcode"):
+            processor.convert_to_gif(final_path)
+        processor = MediaProcessor(final_path)
+        # Animated WebP thumbnail для GIF (25-34% меньше, 24-bit цвет)
+        with _stage(timings, "preview"):
+            processor.generate_animated_webp_thumbnail(thumbnail_path)
+        with _stage(timings, "probe"):
+            duration, width, height = processor.get_metadata()
+
+    else:
+        # MP4 + WebM preview (полное, без звука) + WebP poster за одно декодирование
+        preview_path = os.path.join(upload_dir, f"{meme_id_str}_preview.webm")
+        on_progress = reporter.stage("transcode", 0.1, 0.9) if reporter else None
+        try:
+            with _stage(timings, "transcode"):
+                duration, width, height = processor.transcode_video_renditions(
+                    final_path, preview_path, thumbnail_path, on_progress=on_progress
+                )
+        except RuntimeError as e:
+            print(f"Single-pass transcode failed, falling back to separate passes: {e}")
+            with _stage(timings, "transcode"):
+                processor.convert_to_mp4(final_path)
+            processor = MediaProcessor(final_path)
+            with _stage(timings, "preview"):
+                processor.generate_video_preview(preview_path, thumbnail_path)
+            with _stage(timings, "probe"):
+                duration, width, height = processor.get_metadata()
+        meme.preview_url = f"/static/{meme_id_str}_preview.webm"
+
+    # --- СОХРАНЕНИЕ В БД ---
+    meme.duration = duration
+    meme.width = width
+    meme.height = height
+    # Для GIF длительность часто определяется криво, но has_audio точно False
+    meme.has_audio = output_ext == "mp4"
+    meme.status = "approved"
+    meme.media_url = f"/static/{final_filename}"
+    meme.thumbnail_url = f"/static/{meme_id_str}_thumb.webp"
+    return final_path
+
+
+def _find_reusable_blob(db, content_hash: str, timings: dict = None):
+    """
+    Уже обработанный тот же контент — только точный sha256 исходника.
+    phash первого кадра видео не годится даже в кандидаты: в blob лежит
+    результат транскодирования, сверить его с исходником по кадрам и звуку нельзя.
+    """
+    if not content_hash:
+        return None
+    with _stage(timings, "dedup"):
+        return db.execute(media_dedup.blob_lookup_query(content_hash)).scalars().first()
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, name="app.worker.process_meme_task")
+def process_meme_task(self, meme_id_str: str, file_path: str, audio_path: str = None,
+                      content_hash: str = None):
     print(f"🚀 Processing meme {meme_id_str}...")
     
     redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
     db = SessionLocal()
     meme = None
+    reporter = None
+    timings = {}
     
     try:
         meme_id = meme_id_str 
@@ -49,173 +203,172 @@ def process_meme_task(self, meme_id_str: str, file_path: str, audio_path: str =
             print(f"❌ Meme {meme_id} not found in DB")
             return
 
+        reporter = ProgressReporter(redis_client, self.request.id, user_id=meme.user_id,
+                                    kind="meme", meme_id=str(meme.id))
+        reporter.update(0, stage="probe")
+
         # 1. Анализируем исходный файл
         processor = MediaProcessor(file_path)
-        has_audio_stream = processor.has_audio_stream()
-        
-        # 2. Определяем формат вывода
-        # Если есть оригинальный звук ИЛИ добавили новый звук -> MP4
-        # Иначе -> GIF
-        if has_audio_stream or audio_path:
-            output_ext = "mp4"
-            is_gif = False
-        else:
-            output_ext = "gif"
-            is_gif = True
-
-        final_filename = f"{meme_id_str}.{output_ext}"
-        upload_dir = os.path.dirname(file_path)
-        final_path = os.path.join(upload_dir, final_filename)
-        
-        # Все thumbnails теперь WebP
-        thumbnail_path = os.path.join(upload_dir, f"{meme_id_str}_thumb.webp")
-
-        print(f"ℹ️ Detected format: {output_ext}, Thumb: webp (Audio: {has_audio_stream}, New Audio: {bool(audio_path)})")
-
-        # --- ОБРАБОТКА ---
-        if audio_path:
-            # Если есть новое аудио, это точно MP4
-            processor.process_video_with_audio(audio_path, final_path)
-            if os.path.exists(audio_path): os.remove(audio_path)
-            # Пересоздаем процессор на готовом файле для метаданных
-            processor = MediaProcessor(final_path)
-            
-        elif is_gif:
-            # Конвертируем в оптимизированный GIF
-            processor.convert_to_gif(final_path)
-            processor = MediaProcessor(final_path)
-            
-        else:
-            # Конвертируем в MP4 (стандартизация)
-            processor.convert_to_mp4(final_path)
-            processor = MediaProcessor(final_path)
 
-        # --- ГЕНЕРАЦИЯ ПРЕВЬЮ ---
-        if is_gif:
-            # Animated WebP thumbnail для GIF (25-34% меньше, 24-bit цвет)
-            processor.generate_animated_webp_thumbnail(thumbnail_path)
+        # Дедупликация: тот же контент уже обработан — переиспользуем файлы без ffmpeg.
+        # С новой аудиодорожкой результат другой, поэтому там не ищем.
+        blob = None if audio_path else _find_reusable_blob(db, content_hash, timings)
+        if blob:
+            media_dedup.apply_blob(meme, blob)
+            blob.ref_count = MediaBlob.ref_count + 1
+            meme.status = "approved"
+            if os.path.exists(file_path): os.remove(file_path)
+            print(f"♻️ Meme {meme_id} reuses media blob {blob.id}")
         else:
-            # Для видео: WebM preview (полное, без звука) + WebP poster
-            preview_path = os.path.join(upload_dir, f"{meme_id_str}_preview.webm")
-            processor.generate_video_preview(preview_path, thumbnail_path)
-            meme.preview_url = f"/static/{meme_id_str}_preview.webm"
-        
-        # Получаем метаданные финального файла
-        duration, width, height = processor.get_metadata()
-        
-        # Для GIF длительность часто определяется криво, но has_audio точно False
-        final_has_audio = True if output_ext == "mp4" else False
-
-        # --- СОХРАНЕНИЕ В БД ---
-        meme.duration = duration
-        meme.width = width
-        meme.height = height
-        meme.has_audio = final_has_audio
-        meme.status = "approved"
-        meme.media_url = f"/static/{final_filename}"
-        meme.thumbnail_url = f"/static/{meme_id_str}_thumb.webp"
-        
-        db.commit()
+            final_path = _transcode_meme(meme, processor, file_path, audio_path, timings, reporter)
+            if content_hash and not audio_path:
+                new_blob = media_dedup.blob_from_meme(meme, content_hash, None)
+                try:
+                    with db.begin_nested():
+                        db.add(new_blob)
+                    meme.media_blob_id = new_blob.id
+                except IntegrityError:
+                    # Параллельная загрузка того же файла успела первой — файлы остаются за этим мемом
+                    pass
+            # Удаляем исходник
+            if os.path.exists(file_path) and os.path.abspath(file_path) != os.path.abspath(final_path):
+                os.remove(file_path)
+
+        reporter.update(0.95, stage="db")
+        search_outbox.enqueue(db, meme.id)
+        with _stage(timings, "db"):
+            db.commit()
 
-        # --- ИНДЕКСАЦИЯ ---
         try:
-            tags_list = [t.name for t in meme.tags] if meme.tags else []
-            
-            # 👇 Получаем имя автора
-            author_username = "unknown"
-            # Мы уже делали запрос к базе выше (meme = db.query...), 
-            # но user может быть не подгружен. Лучше подгрузить или сделать запрос.
-            # Самый надежный вариант тут - простой SQL, так как sessionmaker синхронный
-            if meme.user_id:
-                user_res = db.execute(text("SELECT username FROM users WHERE id = :uid"), {"uid": meme.user_id}).fetchone()
-                if user_res:
-                    author_username = user_res.username
-            
-            index_meme_task.delay({
-                "id": str(meme.id),
-                "title": meme.title,
-                "description": meme.description,
-                "thumbnail_url": meme.thumbnail_url,
-                "preview_url": meme.preview_url,
-                "media_url": meme.media_url,
-                "views_count": meme.views_count,
-                "shares_count": meme.shares_count,
-                "width": meme.width,
-                "height": meme.height,
-                "duration": meme.duration,
-                "status": meme.status,
-                "tags": tags_list,
-                "author_username": author_username
-            })
+            redis_client.sadd(random_pick.APPROVED_SET_KEY, str(meme.id))
         except Exception as e:
-            print(f"Search index trigger error: {e}")
+            print(f"Redis random set error: {e}")
+
+        # --- ИНДЕКСАЦИЯ --- (событие записано в outbox в той же транзакции)
+        search_outbox.kick(redis_client, celery_app)
 
         # --- УВЕДОМЛЕНИЯ ---
+        # Рассылка подписчикам — отдельной задачей, не занимая медиа-воркер
         try:
-            sender_info = db.execute(
-                text("SELECT username, avatar_url FROM users WHERE id = :uid"), 
-                {"uid": meme.user_id}
-            ).fetchone()
-            
+            fanout_new_meme_task.delay(str(meme.id))
+        except Exception as e:
+            print(f"Notification fan-out trigger error: {e}")
+
+        print(f"✅ Meme {meme_id} ready: {meme.media_url}")
+        _record_timings(redis_client, timings)
+        reporter.finish(url=meme.media_url)
+
+    except Exception as e:
+        print(f"❌ Worker Error: {e}")
+        if reporter:
+            reporter.fail(str(e))
+        try:
+            if meme:
+                meme.status = "failed"
+                db.commit()
+        except: pass
+    finally:
+        db.close()
+        redis_client.close()
+
+@shared_task(bind=True, max_retries=5, name="app.worker.fanout_new_meme_task")
+def fanout_new_meme_task(self, meme_id_str: str):
+    """
+    Fan-out-on-write: уведомления NEW_MEME всем подписчикам автора.
+    Пачки по FANOUT_CHUNK_SIZE: один multi-row INSERT ... RETURNING на пачку и
+    одна Redis pipeline на публикацию. Идемпотентна при ретраях: уникальный индекс
+    (user_id, meme_id) для new_meme + ON CONFLICT DO NOTHING, публикуются только вставленные.
+    """
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    db = SessionLocal()
+    try:
+        meme = db.query(Meme).filter(Meme.id == meme_id_str).first()
+        if not meme or meme.status != "approved":
+            return
+
+        sender_info = db.execute(
+            text("SELECT username, full_name, avatar_url FROM users WHERE id = :uid"),
+            {"uid": meme.user_id}
+        ).fetchone()
+        sender_data = {
+            "username": sender_info.username,
+            "full_name": sender_info.full_name,
+            "avatar_url": sender_info.avatar_url
+        } if sender_info else None
+        meme_data = {
+            "id": str(meme.id),
+            "thumbnail_url": meme.thumbnail_url,
+            "media_url": meme.media_url
+        }
+
+        total = 0
+        last_follower_id = None
+        while True:
             followers = db.execute(
-                text("SELECT follower_id FROM follows WHERE followed_id = :uid"), 
-                {"uid": meme.user_id}
+                text("""
+                    SELECT f.follower_id FROM follows f
+                    JOIN users u ON u.id = f.follower_id
+                    WHERE f.followed_id = :uid
+                      AND COALESCE(u.notify_on_new_meme, TRUE)
+                      AND (CAST(:after AS uuid) IS NULL OR f.follower_id > CAST(:after AS uuid))
+                    ORDER BY f.follower_id
+                    LIMIT :lim
+                """),
+                {"uid": meme.user_id, "after": last_follower_id, "lim": FANOUT_CHUNK_SIZE}
             ).fetchall()
-            
-            for row in followers:
-                now = datetime.utcnow()
-                notif = Notification(
-                    user_id=row.follower_id, 
-                    sender_id=meme.user_id, 
-                    type=NotificationType.NEW_MEME, 
-                    meme_id=meme.id,
-                    is_read=False,
-                    created_at=now
+            if not followers:
+                break
+            last_follower_id = str(followers[-1].follower_id)
+
+            now = datetime.utcnow()
+            stmt = (
+                pg_insert(Notification)
+                .values([{
+                    "id": uuid.uuid4(),
+                    "user_id": row.follower_id,
+                    "sender_id": meme.user_id,
+                    "type": NotificationType.NEW_MEME,
+                    "meme_id": meme.id,
+                    "is_read": False,
+                    "created_at": now,
+                } for row in followers])
+                .on_conflict_do_nothing(
+                    index_elements=["user_id", "meme_id"],
+                    index_where=Notification.type == NotificationType.NEW_MEME
                 )
-                db.add(notif)
-                db.commit() 
-                db.refresh(notif)
+                .returning(Notification.id, Notification.user_id, Notification.created_at)
+            )
+            inserted = db.execute(stmt).fetchall()
+            db.commit()
 
-                try:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                for notif in inserted:
                     payload = {
                         "id": str(notif.id),
-                        "type": NotificationType.NEW_MEME, 
+                        "type": NotificationType.NEW_MEME,
                         "is_read": False,
                         "created_at": notif.created_at.isoformat(),
                         "text": None,
-                        "sender": {
-                            "username": sender_info.username,
-                            "avatar_url": sender_info.avatar_url
-                        },
-                        "meme": {
-                            "id": str(meme.id),
-                            "thumbnail_url": meme.thumbnail_url,
-                            "media_url": meme.media_url
-                        },
+                        "sender": sender_data,
+                        "meme": meme_data,
                         "meme_id": str(meme.id)
                     }
-                    
-                    channel = f"notify:{str(row.follower_id)}"
-                    redis_client.publish(channel, json.dumps(payload, cls=DateTimeEncoder))
-                except Exception as e:
-                    print(f"Redis publish error: {e}")
-                    
-        except Exception as e:
-             print(f"Notification error: {e}")
-
-        # Удаляем исходник
-        if os.path.exists(file_path) and os.path.abspath(file_path) != os.path.abspath(final_path):
-            os.remove(file_path)
+                    pipe.publish(f"notify:{notif.user_id}", json.dumps(payload, cls=DateTimeEncoder))
+                    pipe.delete(f"unread_count:{notif.user_id}")
+                pipe.execute()
+            except Exception as e:
+                print(f"Redis publish error: {e}")
 
-        print(f"✅ Meme {meme_id} ready as {output_ext.upper()}!")
+            total += len(inserted)
+            if len(followers) < FANOUT_CHUNK_SIZE:
+                break
 
+        print(f"📣 New meme {meme_id_str}: notified {total} followers")
     except Exception as e:
-        print(f"❌ Worker Error: {e}")
-        try:
-            if meme:
-                meme.status = "failed"
-                db.commit()
-        except: pass
+        print(f"Notification fan-out error: {e}")
+        db.rollback()
+        raise self.retry(exc=e, countdown=10 * (self.request.retries + 1))
     finally:
         db.close()
         redis_client.close()
@@ -224,12 +377,15 @@ def process_meme_task(self, meme_id_str: str, file_path: str, audio_path: str =
 # 2. ЗАДАЧИ ДЛЯ STICKER MAKER (НОВЫЕ)
 # ==========================================
 
-@shared_task(bind=True, name="app.worker.process_sticker_image")
+@shared_task(bind=True, acks_late=True, name="app.worker.process_sticker_image")
 def process_sticker_image(self, file_path: str, operation: str, **kwargs):
     """
     Обработка стикера: удаление фона или обводка.
     """
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    reporter = ProgressReporter(redis_client, self.request.id, user_id=kwargs.get("user_id"), kind="image")
     try:
+        reporter.update(0, stage=operation)
         # Меняем расширение на .png
         base_name = os.path.splitext(os.path.basename(file_path))[0]
         dir_name = os.path.dirname(file_path)
@@ -262,13 +418,17 @@ def process_sticker_image(self, file_path: str, operation: str, **kwargs):
             return {"error": "Unknown operation"}
 
         # Возвращаем URL и Путь
+        reporter.finish(url=f"/static/{output_filename}")
         return {"url": f"/static/{output_filename}", "server_path": output_path}
 
     except Exception as e:
         print(f"Error processing sticker: {e}")
+        reporter.fail(str(e))
         raise e
+    finally:
+        redis_client.close()
 
-@shared_task(bind=True, name="app.worker.animate_sticker_task")
+@shared_task(bind=True, acks_late=True, name="app.worker.animate_sticker_task")
 def animate_sticker_task(self, image_path: str, animation: str,
                          outline_color: str = None,
                          outline_width: int = 0,
@@ -277,15 +437,23 @@ def animate_sticker_task(self, image_path: str, animation: str,
                          text_size: int = 15,
                          text_x: float = 0.5,
                          text_y: float = 0.8,
-                         crop: dict = None):
-    """Создает анимированный GIF или PNG (если без анимации)"""
+                         crop: dict = None,
+                         cache_key: str = None,
+                         preview: bool = False,
+                         preview_cache_key: str = None,
+                         preview_url: str = None,
+                         user_id: str = None):
+    """
+    Создает анимированный GIF или PNG (если без анимации).
+    preview=True: сначала маленький animated WebP (отдается через статус PROGRESS),
+    затем полноценный GIF.
+    """
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    reporter = ProgressReporter(redis_client, self.request.id, user_id=user_id, kind="sticker")
     try:
         file_id = str(uuid.uuid4())
         gif_path = os.path.join("uploads", f"sticker_{file_id}.gif")
-
-        service = StickerService(gif_path)
-        result_path = service.create_animated_sticker(
-            image_path,
+        options = dict(
             animation=animation,
             outline_color=outline_color,
             outline_width=outline_width,
@@ -297,17 +465,52 @@ def animate_sticker_task(self, image_path: str, animation: str,
             crop=crop,
         )
 
+        is_animated = bool(animation) and animation != "none"
+        full_start = 0.0
+        if preview and is_animated:
+            full_start = 0.2
+            if not preview_url:
+                preview_path = os.path.join("uploads", f"sticker_{file_id}_preview.webp")
+                StickerService(preview_path).create_animated_sticker(
+                    image_path, preview=True, on_progress=reporter.stage("preview", 0.0, full_start), **options
+                )
+                _store_sticker(redis_client, preview_cache_key, preview_path)
+                preview_url = f"/static/{os.path.basename(preview_path)}"
+            self.update_state(state="PROGRESS", meta={"preview_url": preview_url})
+            reporter.extra["preview_url"] = preview_url
+
+        service = StickerService(gif_path)
+        result_path = service.create_animated_sticker(
+            image_path, on_progress=reporter.stage("render", full_start, 1.0), **options
+        )
+        _store_sticker(redis_client, cache_key, result_path)
+
         result_filename = os.path.basename(result_path)
-        return {"url": f"/static/{result_filename}"}
+        result = {"url": f"/static/{result_filename}", "preview_url": preview_url}
+        reporter.finish(**result)
+        return result
     except Exception as e:
         print(f"Worker Error: {e}")
+        reporter.fail(str(e))
         raise e
+    finally:
+        redis_client.close()
+
+
+def _store_sticker(redis_client, cache_key: str, path: str):
+    if not cache_key:
+        return
+    try:
+        sticker_cache.store(redis_client, cache_key, path)
+    except Exception as e:
+        print(f"Sticker cache store error: {e}")
     
 # --- ИСПРАВЛЕНИЕ: Используем shared_task и redis_client внутри ---
-@shared_task(bind=True, name="app.worker.process_video_editor_task")
-def process_video_editor_task(self, video_path: str, options: dict, audio_path: str = None):
+@shared_task(bind=True, acks_late=True, name="app.worker.process_video_editor_task")
+def process_video_editor_task(self, video_path: str, options: dict, audio_path: str = None,
+                              user_id: str = None):
     """
-    Обработка видео с использованием нового VideoEditorService (MoviePy + NumPy)
+    Обработка видео через VideoEditorService (один вызов ffmpeg) с реальным прогрессом.
     """
     task_id = self.request.id
     
@@ -315,7 +518,8 @@ def process_video_editor_task(self, video_path: str, options: dict, audio_path:
     redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
     
     # Обновляем статус: STARTED
-    redis_client.set(f"task:{task_id}", json.dumps({"status": "PROCESSING", "progress": 0}))
+    reporter = ProgressReporter(redis_client, task_id, user_id=user_id, kind="video")
+    reporter.update(0, stage="encode", force=True)
 
     try:
         # Инициализируем новый сервис
@@ -323,7 +527,7 @@ def process_video_editor_task(self, video_path: str, options: dict, audio_path:
         
         # Генерируем имя выходного файла
         output_filename = f"edited_{uuid.uuid4()}.mp4"
-        
+
         # Запускаем обработку (это займет время)
         result_path = editor_service.process_video(
             input_path=video_path,
@@ -334,21 +538,18 @@ def process_video_editor_task(self, video_path: str, options: dict, audio_path:
             remove_audio=options.get('remove_audio', False),
             new_audio_path=audio_path,
             text_config=options.get('text_config'),
+            on_progress=reporter.update,
         )
 
         # Формируем URL результата
         result_url = f"/static/{output_filename}"
 
         # Обновляем статус: SUCCESS
-        result_data = {"status": "SUCCESS", "url": result_url}
-        redis_client.set(f"task:{task_id}", json.dumps(result_data))
-        
-        return result_data
+        return reporter.finish(url=result_url)
 
     except Exception as e:
         print(f"Error processing video: {e}")
-        error_data = {"status": "FAILURE", "error": str(e)}
-        redis_client.set(f"task:{task_id}", json.dumps(error_data))
+        error_data = reporter.fail(str(e))
         # Возвращаем ошибку как результат (но не рейзим, чтобы Celery не перезапускал задачу бесконечно)
         return error_data
     finally:
@@ -358,8 +559,113 @@ def process_video_editor_task(self, video_path: str, options: dict, audio_path:
 # 3. ФОНОВЫЕ ЗАДАЧИ (Index, Views, Search)
 # ==========================================
 
-@shared_task(name="app.worker.index_meme_task")
-def index_meme_task(meme_data: dict):
+@shared_task(name="app.worker.drain_search_outbox_task")
+def drain_search_outbox_task():
+    """Пачками переносит события search_outbox в Meilisearch (см. services/search_outbox)."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = search_writer.writer_lock(redis_client)
+    # Один писатель за раз: иначе устаревший документ может обогнать удаление,
+    # а запись во время пересборки/смены настроек потеряется при swap.
+    # Занято — события ждут в outbox до следующего kick или beat.
+    if not lock.acquire(blocking=False):
+        redis_client.close()
+        return
+    db = SessionLocal()
+    try:
+        search = get_search_service()
+        if not search:
+            return
+        while search_outbox.drain_batch(db, search, redis_client):
+            lock.extend(search_writer.LOCK_TIMEOUT, replace_ttl=True)
+    except Exception as e:
+        print(f"Search outbox drain error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+        search_writer.release(lock)
+        redis_client.close()
+
+@shared_task(bind=True, max_retries=5, name="app.worker.apply_search_settings_task")
+def apply_search_settings_task(self):
+    """Применяет diff настроек индексов один раз на версию (см. services/search_settings)."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    version = search_settings.settings_version()
+    settings_lock = redis_client.lock(search_settings.LOCK_KEY, timeout=search_settings.LOCK_TIMEOUT)
+    writer = search_writer.writer_lock(redis_client)
+    # Параллельный старт нескольких API-процессов: работу делает один
+    if redis_client.get(search_settings.APPLIED_KEY) == version or not settings_lock.acquire(blocking=False):
+        redis_client.close()
+        return
+    try:
+        if redis_client.get(search_settings.APPLIED_KEY) == version:
+            return
+        search = get_search_service()
+        if not search:
+            raise RuntimeError("Meilisearch is not available")
+        # Остальные писатели ждут, пока идет копирование в теневой индекс
+        search_writer.acquire_or_raise(writer)
+
+        def keep_locks(copied):
+            writer.extend(search_writer.LOCK_TIMEOUT, replace_ttl=True)
+            settings_lock.extend(search_settings.LOCK_TIMEOUT, replace_ttl=True)
+
+        try:
+            changed = search_settings.apply_index_settings(search.client, on_batch=keep_locks)
+        finally:
+            search_writer.release(writer)
+        redis_client.set(search_settings.APPLIED_KEY, version, ex=search_settings.APPLIED_TTL)
+        print(f"⚙️ Search settings {version}: {changed or 'up to date'}")
+        search_outbox.kick(redis_client, celery_app)
+    except Exception as e:
+        print(f"Search settings error: {e}")
+        raise self.retry(exc=e, countdown=30)
+    finally:
+        try:
+            settings_lock.release()
+        except Exception:
+            pass
+        redis_client.close()
+
+@shared_task(bind=True, max_retries=5, name="app.worker.sync_search_index_task")
+def sync_search_index_task(self, full: bool = False):
+    """Инкрементальная (или полная через теневой индекс) синхронизация поиска с БД."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = redis_client.lock(search_sync.LOCK_KEY, timeout=search_sync.LOCK_TIMEOUT)
+    # Каждая реплика API шлет задачу при старте — выполняется одна
+    if not lock.acquire(blocking=False):
+        redis_client.close()
+        return
+    db = SessionLocal()
+    try:
+        search = get_search_service()
+        if not search:
+            raise RuntimeError("Meilisearch is not available")
+        report = search_sync.sync_all(
+            db, redis_client, search.client, full=full,
+            on_batch=lambda done: lock.extend(search_sync.LOCK_TIMEOUT, replace_ttl=True),
+        )
+        print(f"🔄 Search sync: {report}")
+        search_outbox.kick(redis_client, celery_app)
+    except Exception as e:
+        print(f"❌ Search sync failed: {e}")
+        raise self.retry(exc=e, countdown=60)
+    finally:
+        db.close()
+        try:
+            lock.release()
+        except Exception:
+            pass
+        redis_client.close()
+
+# Задачи ниже оставлены для сообщений, поставленных в очередь до перехода на outbox.
+# Тоже пишут только под локом писателей; занят (пересборка) — повтор позже.
+@shared_task(bind=True, max_retries=20, name="app.worker.index_meme_task")
+def index_meme_task(self, meme_data: dict):
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = search_writer.writer_lock(redis_client)
+    if not lock.acquire(blocking=True, blocking_timeout=5):
+        redis_client.close()
+        raise self.retry(countdown=30)
     try:
         search = get_search_service()
         if search:
@@ -367,9 +673,17 @@ def index_meme_task(meme_data: dict):
             print(f"🔍 Indexed meme {meme_data.get('id')}")
     except Exception as e:
         print(f"Index error: {e}")
+    finally:
+        search_writer.release(lock)
+        redis_client.close()
 
-@shared_task(name="app.worker.delete_index_task")
-def delete_index_task(meme_id: str):
+@shared_task(bind=True, max_retries=20, name="app.worker.delete_index_task")
+def delete_index_task(self, meme_id: str):
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = search_writer.writer_lock(redis_client)
+    if not lock.acquire(blocking=True, blocking_timeout=5):
+        redis_client.close()
+        raise self.retry(countdown=30)
     try:
         search = get_search_service()
         if search:
@@ -377,6 +691,9 @@ def delete_index_task(meme_id: str):
             print(f"🗑️ Deleted from index {meme_id}")
     except Exception as e:
         print(f"Delete index error: {e}")
+    finally:
+        search_writer.release(lock)
+        redis_client.close()
 
 @shared_task(name="app.worker.sync_views_task")
 def sync_views_task():
@@ -384,25 +701,10 @@ def sync_views_task():
     redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
     db = SessionLocal()
     try:
-        # Собираем все обновления в один словарь
-        updates = {}
-        for key in redis_client.scan_iter(match="meme:views:*"):
-            try:
-                views_str = redis_client.getset(key, 0)
-                if views_str and int(views_str) > 0:
-                    meme_id = key.split(":")[-1]
-                    updates[meme_id] = int(views_str)
-            except Exception:
-                pass
-
-        # Batch update
+        # RENAME + HGETALL хэша просмотров и один UPDATE ... FROM (VALUES ...)
+        updates = views.flush(redis_client, db)
         if updates:
-            for meme_id, views in updates.items():
-                db.execute(
-                    text("UPDATE memes SET views_count = views_count + :val WHERE id = :mid"),
-                    {"val": views, "mid": meme_id}
-                )
-            db.commit()
+            search_counters.mark(redis_client, *updates.keys())
             print(f"👁️ Synced views for {len(updates)} memes")
     except Exception as e:
         print(f"Sync views error: {e}")
@@ -411,6 +713,36 @@ def sync_views_task():
         db.close()
         redis_client.close()
 
+@shared_task(name="app.worker.sync_search_counters_task")
+def sync_search_counters_task():
+    """Частичные обновления views/shares/likes в индексе memes (см. services/search_counters)."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = search_writer.writer_lock(redis_client)
+    # Идет пересборка/дренер — пометки останутся в dirty-множестве до следующего запуска
+    if not lock.acquire(blocking=False):
+        redis_client.close()
+        return
+    db = SessionLocal()
+    try:
+        search = get_search_service()
+        if not search:
+            return
+        total = 0
+        while True:
+            taken = search_counters.sync_batch(redis_client, db, search)
+            if not taken:
+                break
+            total += taken
+            lock.extend(search_writer.LOCK_TIMEOUT, replace_ttl=True)
+        if total:
+            print(f"📊 Search counters updated for {total} memes")
+    except Exception as e:
+        print(f"Sync search counters error: {e}")
+    finally:
+        db.close()
+        search_writer.release(lock)
+        redis_client.close()
+
 @shared_task(name="app.worker.sync_search_stats_task")
 def sync_search_stats_task():
     redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
@@ -435,6 +767,54 @@ def sync_search_stats_task():
         db.close()
         redis_client.close()
 
+@shared_task(name="app.worker.refresh_hot_search_terms_task")
+def refresh_hot_search_terms_task():
+    """Горячие поисковые запросы для длинного TTL кэша поиска (см. services/search_cache)."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    db = SessionLocal()
+    try:
+        db_terms = [
+            term for (term,) in db.query(SearchTerm.term)
+            .order_by(SearchTerm.count.desc())
+            .limit(search_cache.HOT_TERMS_LIMIT)
+        ]
+        total = search_cache.refresh_hot_terms(redis_client, db_terms)
+        print(f"🔥 Hot search terms: {total}")
+    except Exception as e:
+        print(f"Hot search terms error: {e}")
+    finally:
+        db.close()
+        redis_client.close()
+
+@shared_task(name="app.worker.reconcile_approved_set_task")
+def reconcile_approved_set_task():
+    """Сверка Redis-множества одобренных мемов с БД (для /memes/random, см. services/random_pick)."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    db = SessionLocal()
+    try:
+        added, removed = random_pick.reconcile_approved_set(db, redis_client)
+        if added or removed:
+            print(f"🎲 Approved set reconciled: +{added} -{removed}")
+    except Exception as e:
+        print(f"Approved set reconcile error: {e}")
+    finally:
+        db.close()
+        redis_client.close()
+
+@shared_task(name="app.worker.gc_media_blobs_task")
+def gc_media_blobs_task():
+    """Файлы MediaBlob, на которые больше не ссылается ни один мем (см. services/media_dedup)."""
+    db = SessionLocal()
+    try:
+        removed = media_dedup.collect_orphans(db)
+        if removed:
+            print(f"🧹 Orphan media blobs removed: {removed}")
+    except Exception as e:
+        print(f"Media blob GC error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
 @shared_task(name="app.worker.sync_denormalized_counts_task")
 def sync_denormalized_counts_task():
     """Safety net: periodically recalculate denormalized counters from actual data."""
@@ -460,4 +840,23 @@ def sync_denormalized_counts_task():
         print(f"Sync counts error: {e}")
         db.rollback()
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@shared_task(name="app.worker.recompute_hot_scores_task")
+def recompute_hot_scores_task():
+    """hot_score recalculation for the smart feed plus a frozen ranking snapshot for its cursors."""
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    db = SessionLocal()
+    try:
+        # Пишем только строки, чей score заметно сдвинулся (меньше WAL и bloat)
+        result = db.execute(ranking.recompute_stmt())
+        db.commit()
+        gen = ranking.build_snapshot(redis_client, db)
+        db.rollback()  # закрываем транзакцию чтения снимка
+        print(f"🔥 Hot scores recomputed for {result.rowcount} memes, snapshot {gen}")
+    except Exception as e:
+        print(f"Hot score error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+        redis_client.close()
@@ -1,4 +1,3 @@
-import asyncio
 import os
 import sys
 
@@ -6,86 +5,54 @@ import sys
 # Предполагается запуск из папки backend/
 sys.path.append(os.getcwd())
 
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload  # <--- Нужно для загрузки тегов
-from app.core.database import AsyncSessionLocal
-from app.models.models import Meme, User, Tag
-from app.services.search import get_search_service
+import redis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 
-async def sync():
-    print("🚀 Starting synchronization with Meilisearch...")
-    
-    try:
-        search_service = get_search_service()
-        if not search_service:
-            print("❌ Error: Could not connect to Meilisearch service.")
-            return
+from app.core.config import settings
+from app.services.search import get_search_service
+from app.services import search_sync
 
-        async with AsyncSessionLocal() as db:
-            # 1. МЕМЫ
-            print("📦 Syncing Memes...")
-            # Важно: используем selectinload для тегов, чтобы не получить ошибку или пустые теги
-            query = select(Meme).where(Meme.status == 'approved').options(
-                selectinload(Meme.tags),
-                selectinload(Meme.user) 
-            )
-            memes = (await db.execute(query)).scalars().all()
-            
-            meme_docs = []
-            for m in memes:
-                # Собираем список тегов
-                tag_list = [t.name for t in m.tags]
+# Тот же движок синхронизации, что и у sync_search_index_task при старте API:
+#   python sync_meili.py         — догнать изменения с последнего водяного знака
+#   python sync_meili.py --full  — пересобрать индексы в теневых и переключить swap'ом
 
-                username = m.user.username if m.user else "unknown"
-                
-                meme_docs.append({
-                    "id": str(m.id),
-                    "title": m.title,
-                    "description": m.description,
-                    "thumbnail_url": m.thumbnail_url,
-                    "media_url": m.media_url,
-                    "views_count": m.views_count,
-                    "shares_count": getattr(m, 'shares_count', 0), # Используем getattr на случай, если миграция не прошла
-                    "width": m.width,
-                    "height": m.height,
-                    "duration": m.duration,
-                    "status": m.status,     # <--- КРИТИЧНО для фильтрации
-                    "tags": tag_list,
-                    "author_username": username
-                })
+def sync(full: bool = False):
+    print("🚀 Starting synchronization with Meilisearch...")
 
-            if meme_docs:
-                # add_documents обновляет существующие документы, если ID совпадает
-                search_service.index_memes.add_documents(meme_docs)
-            print(f" -> ✅ Sent {len(meme_docs)} memes to index.")
+    search_service = get_search_service()
+    if not search_service:
+        print("❌ Error: Could not connect to Meilisearch service.")
+        return
 
-            # 2. ПОЛЬЗОВАТЕЛИ
-            print("👤 Syncing Users...")
-            users = (await db.execute(select(User))).scalars().all()
-            user_docs = [{
-                "id": str(u.id),
-                "username": u.username,
-                "full_name": u.full_name,
-                "avatar_url": u.avatar_url
-            } for u in users]
-            if user_docs:
-                search_service.index_users.add_documents(user_docs)
-            print(f" -> ✅ Sent {len(user_docs)} users.")
+    redis_client = redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+    lock = redis_client.lock(search_sync.LOCK_KEY, timeout=search_sync.LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        print("⏳ Another search sync is running, try again later.")
+        redis_client.close()
+        return
 
-            # 3. ТЕГИ (Словарь тегов)
-            print("🏷️ Syncing Tags Dictionary...")
-            tags = (await db.execute(select(Tag))).scalars().all()
-            tag_docs = [{"id": t.id, "name": t.name} for t in tags]
-            if tag_docs:
-                search_service.index_tags.add_documents(tag_docs)
-            print(f" -> ✅ Sent {len(tag_docs)} tags.")
+    engine = create_engine(settings.DATABASE_URL.replace("+asyncpg", ""))
+    db = sessionmaker(bind=engine)()
+    try:
+        def progress(done):
+            lock.extend(search_sync.LOCK_TIMEOUT, replace_ttl=True)
+            print(f" -> {done} docs", end="\r")
 
+        report = search_sync.sync_all(db, redis_client, search_service.client, full=full, on_batch=progress)
+        for uid, (mode, count) in report.items():
+            print(f" -> ✅ {uid}: {mode}, {count} docs")
         print("🎉 Synchronization complete! Search should work now.")
-
     except Exception as e:
         print(f"❌ Synchronization failed: {e}")
+    finally:
+        db.close()
+        engine.dispose()
+        try:
+            lock.release()
+        except Exception:
+            pass
+        redis_client.close()
 
 if __name__ == "__main__":
-    if sys.platform == "win32":
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(sync())
\ No newline at end of file
+    sync(full="--full" in sys.argv)
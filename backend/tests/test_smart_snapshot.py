@@ -0,0 +1,77 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+memes_api = pytest.importorskip("app.api.memes")
+from fastapi import Response  # noqa: E402
+
+
+class FakeRedis:
+    def __init__(self, ids):
+        self.ids = ids
+
+    async def exists(self, key):
+        return 1
+
+    async def zrevrange(self, key, start, stop):
+        return self.ids[start:stop + 1]
+
+
+class FakeQuery:
+    def __init__(self, clause=None):
+        self.clause = clause
+
+    def where(self, clause):
+        return FakeQuery(clause)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeDB:
+    """SQL-фильтр ленты: проходят только мемы из allowed."""
+
+    def __init__(self, allowed):
+        self.allowed = allowed
+
+    async def execute(self, query):
+        ids = query.clause.right.value
+        return FakeResult([(SimpleNamespace(id=i), False) for i in ids if str(i) in self.allowed])
+
+
+def _read(monkeypatch, ids, allowed, pos, limit):
+    monkeypatch.setattr(memes_api, "redis_client", FakeRedis(ids))
+    response = Response()
+    memes = asyncio.run(memes_api._read_smart_snapshot(
+        response, FakeDB(allowed), FakeQuery(), "gen1", pos, limit,
+    ))
+    return [str(m.id) for m in memes], response.headers.get(memes_api.NEXT_CURSOR_HEADER)
+
+
+def test_filtered_snapshot_page_is_full(monkeypatch):
+    # Фильтр пропускает один мем из 200 — больше, чем раньше просматривалось за страницу
+    ids = [str(uuid.uuid4()) for _ in range(5000)]
+    allowed = set(ids[::200])
+
+    page, cursor = _read(monkeypatch, ids, allowed, 0, 20)
+
+    assert page == ids[::200][:20]
+    assert cursor is not None
+    assert memes_api._decode_cursor(cursor, "smart")["pos"] == ids.index(page[-1]) + 1
+
+
+def test_filtered_snapshot_last_page_has_no_cursor(monkeypatch):
+    ids = [str(uuid.uuid4()) for _ in range(5000)]
+    allowed = set(ids[::200])
+
+    page, cursor = _read(monkeypatch, ids, allowed, ids.index(ids[::200][20]), 20)
+
+    assert page == ids[::200][20:]
+    assert cursor is None
@@ -9,7 +9,7 @@ import { Label } from "@/components/ui/label";
 import { Loader2, ChevronLeft, Download, Sparkles, Check, ArrowUpFromLine } from "lucide-react";
 import type { CropOptions } from "@/types/editor";
 import { toast } from "sonner";
-import { processImage, checkStatus, createSticker, getFullUrl, uploadTempFile } from "@/lib/api/editor";
+import { processImage, pollStatus, createSticker, getFullUrl, uploadTempFile } from "@/lib/api/editor";
 import { MaskEditor, MaskEditorRef } from "@/components/editor/mask-editor";
 import { getEditorSource, setEditorResult } from "@/lib/editor-bridge";
 
@@ -24,7 +24,7 @@ const ASPECT_PRESETS = [
 
 type ResizeHandle = 'nw' | 'ne' | 'sw' | 'se' | 'n' | 's' | 'w' | 'e';
 
-const MAX_POLL_ATTEMPTS = 300; // 5 минут при 1с интервале
+const POLL_TIMEOUT_MS = 5 * 60 * 1000; // 5 минут
 
 function StickerMakerInner() {
   const router = useRouter();
@@ -43,8 +43,8 @@ function StickerMakerInner() {
   const maskEditorRef = useRef<MaskEditorRef>(null);
   const [isProcessing, setIsProcessing] = useState(false);
 
-  // Polling refs для cleanup
-  const pollIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  // Поколение опроса: новый запуск или размонтирование отменяет предыдущий long-poll
+  const pollGenRef = useRef(0);
 
   // Design State
   const previewRef = useRef<HTMLDivElement>(null);
@@ -73,7 +73,7 @@ function StickerMakerInner() {
   // Cleanup polling on unmount
   useEffect(() => {
     return () => {
-      if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
+      pollGenRef.current++;
     };
   }, []);
 
@@ -108,32 +108,20 @@ function StickerMakerInner() {
   }, [fromUpload, router]);
 
   // Polling helper
-  const startPolling = (taskId: string, onSuccess: (result: any) => void, onFailure?: () => void) => {
-    if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
-    let attempts = 0;
-    pollIntervalRef.current = setInterval(async () => {
-      attempts++;
-      if (attempts > MAX_POLL_ATTEMPTS) {
-        clearInterval(pollIntervalRef.current!);
-        pollIntervalRef.current = null;
-        setIsProcessing(false);
-        toast.error("Таймаут: задача заняла слишком много времени");
-        return;
-      }
-      try {
-        const status = await checkStatus(taskId);
-        if (status.status === "SUCCESS") {
-          clearInterval(pollIntervalRef.current!);
-          pollIntervalRef.current = null;
-          onSuccess(status.result);
-        } else if (status.status === "FAILURE") {
-          clearInterval(pollIntervalRef.current!);
-          pollIntervalRef.current = null;
-          setIsProcessing(false);
-          onFailure?.();
-        }
-      } catch {}
-    }, 1000);
+  const startPolling = async (taskId: string, onSuccess: (result: any) => void, onFailure?: () => void) => {
+    const gen = ++pollGenRef.current;
+    const isCancelled = () => pollGenRef.current !== gen;
+    const status = await pollStatus(taskId, { timeoutMs: POLL_TIMEOUT_MS, isCancelled });
+    if (isCancelled()) return;
+    if (!status) {
+      setIsProcessing(false);
+      toast.error("Таймаут: задача заняла слишком много времени");
+    } else if (status.status === "SUCCESS") {
+      onSuccess(status.result);
+    } else {
+      setIsProcessing(false);
+      onFailure?.();
+    }
   };
 
   // 2. AUTO REMOVE
@@ -199,7 +187,7 @@ function StickerMakerInner() {
             height: Math.round(cropRect.height * (imgRef.current.naturalHeight / imgLayout.height)),
         } : undefined;
 
-        const { task_id } = await createSticker(serverPath, "none", {
+        const response = await createSticker(serverPath, "none", {
             text: text,
             textColor: textColor,
             textSize: textSize,
@@ -209,12 +197,18 @@ function StickerMakerInner() {
             outlineWidth: outlineWidth,
             crop: cropData,
         });
-        startPolling(task_id, (result) => {
+        const onReady = (result: any) => {
           setFinalResult(getFullUrl(result.url));
           setStep("result");
           setIsProcessing(false);
           toast.dismiss(toastId);
-        }, () => {
+        };
+        // Попадание в кэш рендера: результат приходит сразу, без задачи
+        if (response.status === "SUCCESS" && response.result) {
+          onReady(response.result);
+          return;
+        }
+        startPolling(response.task_id, onReady, () => {
           setIsProcessing(false);
           toast.dismiss(toastId);
           toast.error("Ошибка создания");
@@ -5,13 +5,13 @@ import { Button } from "@/components/ui/button";
 import { Loader2, ChevronLeft, Download, Check, ArrowUpFromLine } from "lucide-react";
 import { toast } from "sonner";
 import { processVideo } from "@/lib/api/editor";
-import { checkStatus, getFullUrl } from "@/lib/api/editor";
+import { pollStatus, getFullUrl } from "@/lib/api/editor";
 import type { VideoProcessOptions } from "@/types/editor";
 import VideoEditor from "@/components/editor/video-editor";
 import { useRouter, useSearchParams } from "next/navigation";
 import { getEditorSource, setEditorResult } from "@/lib/editor-bridge";
 
-const MAX_POLL_ATTEMPTS = 300; // 5 минут при 2с интервале = 10 минут
+const POLL_TIMEOUT_MS = 10 * 60 * 1000; // 10 минут
 
 function VideoEditorInner() {
   const router = useRouter();
@@ -25,13 +25,13 @@ function VideoEditorInner() {
   const [finalResult, setFinalResult] = useState<string | null>(null);
   const [isProcessing, setIsProcessing] = useState(false);
 
-  // Polling ref для cleanup
-  const pollIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  // Поколение опроса: новый запуск или размонтирование отменяет предыдущий long-poll
+  const pollGenRef = useRef(0);
 
   // Cleanup polling on unmount
   useEffect(() => {
     return () => {
-      if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
+      pollGenRef.current++;
     };
   }, []);
 
@@ -61,40 +61,32 @@ function VideoEditorInner() {
     try {
         const { task_id } = await processVideo(serverPath, options);
 
-        if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
-        let attempts = 0;
-
-        pollIntervalRef.current = setInterval(async () => {
-            attempts++;
-            if (attempts > MAX_POLL_ATTEMPTS) {
-                clearInterval(pollIntervalRef.current!);
-                pollIntervalRef.current = null;
-                setIsProcessing(false);
-                toast.dismiss(toastId);
-                toast.error("Таймаут: обработка заняла слишком много времени");
-                return;
-            }
-            try {
-                const status = await checkStatus(task_id);
-                if (status.status === "SUCCESS") {
-                    clearInterval(pollIntervalRef.current!);
-                    pollIntervalRef.current = null;
-                    setFinalResult(getFullUrl(status.result.url));
-                    setStep("result");
-                    setIsProcessing(false);
-                    toast.dismiss(toastId);
-                    toast.success("Видео обработано!");
-                } else if (status.status === "FAILURE") {
-                    clearInterval(pollIntervalRef.current!);
-                    pollIntervalRef.current = null;
-                    setIsProcessing(false);
-                    toast.dismiss(toastId);
-                    toast.error("Ошибка обработки на сервере");
-                }
-            } catch (e) {
-                // ignore polling errors
-            }
-        }, 2000);
+        const gen = ++pollGenRef.current;
+        const isCancelled = () => pollGenRef.current !== gen;
+        const status = await pollStatus(task_id, {
+            timeoutMs: POLL_TIMEOUT_MS,
+            isCancelled,
+            onProgress: (s) => {
+                if (s.progress) toast.loading(`Обработка видео... ${s.progress}%`, { id: toastId });
+            },
+        });
+        if (isCancelled()) return;
+
+        if (!status) {
+            setIsProcessing(false);
+            toast.dismiss(toastId);
+            toast.error("Таймаут: обработка заняла слишком много времени");
+        } else if (status.status === "SUCCESS") {
+            setFinalResult(getFullUrl(status.result.url));
+            setStep("result");
+            setIsProcessing(false);
+            toast.dismiss(toastId);
+            toast.success("Видео обработано!");
+        } else {
+            setIsProcessing(false);
+            toast.dismiss(toastId);
+            toast.error("Ошибка обработки на сервере");
+        }
 
     } catch (e) {
         setIsProcessing(false);
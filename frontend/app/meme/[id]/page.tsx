@@ -10,6 +10,7 @@ import { MemeOwnerActions } from "@/components/meme-owner-actions";
 import { VideoPlayer } from "@/components/video-player";
 import type { Metadata } from "next";
 import { getImageUrl } from "@/lib/seo";
+import { forwardedHeaders } from "@/lib/server-api";
 
 const SITE_URL = process.env.NEXT_PUBLIC_SITE_URL || "http://localhost:3000";
 const FETCH_API_URL = process.env.INTERNAL_API_URL || process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
@@ -18,7 +19,8 @@ const DISPLAY_API_URL = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:800
 export async function generateMetadata({ params }: { params: Promise<{ id: string }> }): Promise<Metadata> {
   const { id } = await params;
   try {
-    const res = await fetch(`${FETCH_API_URL}/api/v1/memes/${id}`, { cache: "no-store" });
+    // Те же заголовки, что и в getMeme: Next.js склеит оба fetch в один запрос
+    const res = await fetch(`${FETCH_API_URL}/api/v1/memes/${id}`, { cache: "no-store", headers: await forwardedHeaders() });
     if (!res.ok) return { title: "Мем не найден" };
     const meme = await res.json();
 
@@ -59,8 +61,8 @@ export async function generateMetadata({ params }: { params: Promise<{ id: strin
 
 async function getMeme(id: string) {
   try {
-    // Используем FETCH_API_URL для общения между контейнерами
-    const res = await fetch(`${FETCH_API_URL}/api/v1/memes/${id}`, { cache: "no-store" });
+    // Используем FETCH_API_URL для общения между контейнерами; IP браузера — для учета просмотров
+    const res = await fetch(`${FETCH_API_URL}/api/v1/memes/${id}`, { cache: "no-store", headers: await forwardedHeaders() });
     if (!res.ok) return null;
     return res.json();
   } catch (e) {
@@ -64,7 +64,9 @@ export function Header() {
 
       socket.onmessage = (event) => {
           try {
-              JSON.parse(event.data);
+              const data = JSON.parse(event.data);
+              if (data?.type === "ping") return; // heartbeat от сервера
+              if (data?.type === "task_progress") return; // прогресс задач — не уведомление
               setUnreadCount(prev => prev + 1);
           } catch (e) {
               console.error("WS Parse error", e);
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useCallback } from "react";
+import React, { useCallback, useEffect, useRef } from "react";
 import { Loader2 } from "lucide-react";
 import { MemeGrid, MemeGridSkeleton } from "@/components/meme-grid";
 import { useInfiniteScroll } from "@/hooks/use-infinite-scroll";
@@ -20,10 +20,20 @@ export function InfiniteMemeGrid({
   limit = 20,
   token,
 }: InfiniteMemeGridProps) {
+  // Курсор keyset-пагинации из X-Next-Cursor; пока его нет — листаем через skip
+  const cursorRef = useRef<string | null>(null);
+
+  useEffect(() => {
+    cursorRef.current = null;
+  }, [fetchUrl]);
+
   const fetchFn = useCallback(
     async (skip: number, lim: number) => {
       const separator = fetchUrl.includes("?") ? "&" : "?";
-      const url = `${API_URL}${fetchUrl}${separator}skip=${skip}&limit=${lim}`;
+      const page = cursorRef.current
+        ? `cursor=${encodeURIComponent(cursorRef.current)}`
+        : `skip=${skip}`;
+      const url = `${API_URL}${fetchUrl}${separator}${page}&limit=${lim}`;
 
       const headers: Record<string, string> = {};
       if (token) {
@@ -32,6 +42,7 @@ export function InfiniteMemeGrid({
 
       const res = await fetch(url, { headers, cache: "no-store" });
       if (!res.ok) return [];
+      cursorRef.current = res.headers.get("X-Next-Cursor");
       return res.json();
     },
     [fetchUrl, token]
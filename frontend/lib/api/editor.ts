@@ -69,13 +69,38 @@ export const createSticker = async (imagePath: string, animation: string, option
   return res.json();
 };
 
-export const checkStatus = async (taskId: string) => {
-  const res = await fetch(`${API_URL}/editor/status/${taskId}`, {
+// since — последний увиденный progress: сервер держит запрос (long-poll), пока он не изменится
+export const checkStatus = async (taskId: string, since?: number) => {
+  const query = since !== undefined ? `?since=${since}` : "";
+  const res = await fetch(`${API_URL}/editor/status/${taskId}${query}`, {
     headers: getHeaders(),
   });
   return res.json();
 };
 
+// Ожидание завершения задачи long-poll'ом: каждый запрос возвращается, когда изменился
+// progress (или через ~20 с), поэтому не нужен опрос раз в секунду.
+// Возвращает финальный статус (SUCCESS/FAILURE) или null — таймаут/отмена.
+export const pollStatus = async (
+  taskId: string,
+  opts: { timeoutMs: number; isCancelled: () => boolean; onProgress?: (status: any) => void },
+) => {
+  const deadline = Date.now() + opts.timeoutMs;
+  let since: number | undefined;
+  while (Date.now() < deadline && !opts.isCancelled()) {
+    try {
+      const status = await checkStatus(taskId, since);
+      if (status.status === "SUCCESS" || status.status === "FAILURE") return status;
+      opts.onProgress?.(status);
+      since = status.progress ?? 0;
+    } catch {
+      // Сеть/рестарт бэкенда — повторяем с паузой
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+  }
+  return null;
+};
+
 // Загрузка временного файла на сервер (маски, или файла для редактора)
 export const uploadTempFile = async (file: File): Promise<{ server_path: string; url: string }> => {
     const formData = new FormData();
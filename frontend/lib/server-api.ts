@@ -0,0 +1,15 @@
+import { headers } from "next/headers";
+
+const INTERNAL_API_TOKEN = process.env.INTERNAL_API_TOKEN || "";
+
+// Заголовки для SSR-запросов к бэкенду от имени браузера: IP клиента и общий секрет.
+// Без токена бэкенд не верит X-Forwarded-For, и все просмотры со страниц
+// схлопываются в один IP контейнера фронтенда (дедупликация views).
+export async function forwardedHeaders(): Promise<Record<string, string>> {
+  const incoming = await headers();
+  const ip = incoming.get("x-forwarded-for")?.split(",")[0].trim() || incoming.get("x-real-ip") || "";
+  const result: Record<string, string> = {};
+  if (ip) result["X-Forwarded-For"] = ip;
+  if (INTERNAL_API_TOKEN) result["X-Internal-Token"] = INTERNAL_API_TOKEN;
+  return result;
+}
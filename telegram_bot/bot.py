@@ -40,6 +40,8 @@ WEB_APP_URL = os.getenv("WEB_APP_URL")
 API_INTERNAL_URL = os.getenv("API_INTERNAL_URL", "http://backend:8000/api/v1") 
 # Если переменная не задана, берем WEB_APP_URL, но убираем слэш в конце если есть
 API_PUBLIC_URL = os.getenv("API_PUBLIC_URL", WEB_APP_URL)
+# Общий с бэкендом секрет: без него бэкенд игнорирует viewer у /memes/random
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
 if API_PUBLIC_URL and API_PUBLIC_URL.endswith('/'):
     API_PUBLIC_URL = API_PUBLIC_URL[:-1]
 
@@ -450,9 +452,12 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Inline error: {e}")
 
 async def random_meme_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # viewer включает на бэкенде окно "без повторов" для этого пользователя Telegram
+    params = {"viewer": f"tg:{update.effective_user.id}"}
+    headers = {"X-Internal-Token": INTERNAL_API_TOKEN} if INTERNAL_API_TOKEN else {}
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_INTERNAL_URL}/memes/random") as resp:
+            async with session.get(f"{API_INTERNAL_URL}/memes/random", params=params, headers=headers) as resp:
                 if resp.status == 200:
                     meme = await resp.json()
                     media_path = meme.get('media_url', '')